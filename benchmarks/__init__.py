@@ -0,0 +1,5 @@
+"""Benchmarks of the DBHandler package.
+
+Every benchmark is a script that can be run with
+``python -m DBHandler.benchmarks.<name>`` and writes its results as JSON.
+"""
@@ -0,0 +1,120 @@
+"""Benchmarks server-side aggregation and downsampling of curves.
+
+A probe_data table of the default model is filled with one synthetic curve
+(datax, datay, temperature, time) of --rows points. Reading the full curve
+into Python is compared with DBHandler.aggregate (GROUP BY x bucket) and
+DBHandler.downsample (streaming LTTB). Run with
+
+    python -m DBHandler.benchmarks.aggregate --rows 10000000 --buckets 1000 \
+        --output results.json
+
+Add '--backends mysql --mysql-cred cred.yml' to run against a MySQL/MariaDB
+test DB.
+"""
+import argparse
+import datetime
+import json
+import tempfile
+import time
+
+import numpy as np
+import sqlalchemy
+
+from .pipeline import make_handler
+
+MODEL = "default"
+TABLE = "db_probe_data"
+PROBEID = 1
+CHUNK = 1000000
+
+
+def fill(handler, rows):
+    """Inserts a synthetic curve of rows points in chunks."""
+    from DBHandler.modules.dbhandler.dbhandler import Columns
+
+    rng = np.random.default_rng(0)
+    start = np.datetime64(datetime.datetime(2020, 1, 1), "us")
+    for first in range(0, rows, CHUNK):
+        datax = np.arange(first, min(first + CHUNK, rows), dtype=float)
+        handler.store_columns(TABLE, Columns({
+            "probeid": PROBEID,
+            "datax": datax,
+            "datay": np.sin(datax / 1e5) + rng.normal(0, 0.05, len(datax)),
+            "temperature": 20 + rng.normal(0, 0.5, len(datax)),
+            "time": start + datax.astype("timedelta64[s]")}))
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def full_curve(handler):
+    """Reads the full curve like the plotting front end does today."""
+    tab = handler.dbt.obj(TABLE).__table__
+    datax, datay = [], []
+    for x_val, y_val in handler.session.connection().execute(
+            sqlalchemy.select([tab.c.datax, tab.c.datay])
+            .where(tab.c.probeid == PROBEID)):
+        datax.append(x_val)
+        datay.append(y_val)
+    return {"datax": datax, "datay": datay}
+
+
+def run(backend, rows, buckets, points, mysql_cred=None): #pylint: disable=R0913
+    """Returns runtime and number of returned points per method."""
+    handler = make_handler(MODEL, backend, tempfile.mkdtemp(
+        prefix="dbhandler_bench_"), mysql_cred)
+    handler.log.setLevel("WARNING")
+    _, fill_seconds = _timed(fill, handler, rows)
+    filters = {"probeid": PROBEID}
+    results = []
+    for method, func, kwargs in [
+            ("full curve", full_curve, {}),
+            ("aggregate datax", handler.aggregate,
+             {"x": "datax", "y": ["datay"], "buckets": buckets}),
+            ("aggregate time", handler.aggregate,
+             {"x": "time", "y": ["temperature"], "buckets": buckets}),
+            ("downsample datax", handler.downsample,
+             {"x": "datax", "y": "datay", "points": points})]:
+        if func is full_curve:
+            columns, seconds = _timed(func, handler)
+        else:
+            columns, seconds = _timed(func, TABLE, filters=filters, **kwargs)
+        results.append({"backend": backend, "method": method, "rows": rows,
+                        "fill_seconds": fill_seconds, "seconds": seconds,
+                        "points": len(next(iter(columns.values()))),
+                        "rows_per_second": rows / seconds})
+    handler.session.close()
+    return results
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--buckets", type=int, default=1000)
+    parser.add_argument("--points", type=int, default=1000,
+                        help="points of the LTTB downsampler")
+    parser.add_argument("--backends", nargs="+", default=["sqlite-file"],
+                        choices=["sqlite-file", "sqlite-memory", "mysql"])
+    parser.add_argument("--mysql-cred", default=None)
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    args = parser.parse_args()
+    results = []
+    for backend in args.backends:
+        results += run(backend, args.rows, args.buckets, args.points,
+                       args.mysql_cred)
+    for res in results:
+        print("{backend:>14} {method:>18} {rows:>9} rows {seconds:9.2f} s "
+              "{points:>9} points {rows_per_second:10.0f} rows/s"
+              .format(**res))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=1)
+
+
+if __name__ == "__main__":
+    main()
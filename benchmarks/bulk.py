@@ -0,0 +1,74 @@
+"""Compares sequential upload_data with the parallel bulk import.
+
+Synthetic I_tot containers of the default model are imported one by one with
+DBHandler.upload_data and with DBHandler.bulk_upload for several process
+pool sizes. Run with
+
+    python -m DBHandler.benchmarks.bulk --containers 200 --points 500 \
+        --processes 0 2 4 8 --output results.json
+"""
+import argparse
+import copy
+import json
+import os
+import tempfile
+import time
+
+from .containers import i_tot_container
+from .pipeline import SENSOR, make_handler
+
+
+def run(containers, points, processes, writers, backend="sqlite-file"):
+    """Returns containers/s and rows/s of upload_data and bulk_upload."""
+    workdir = tempfile.mkdtemp(prefix="dbhandler_bench_")
+    handler = make_handler("default", backend, workdir)
+    handler.log.setLevel("WARNING")
+    container = i_tot_container(points, **SENSOR)
+    results = []
+
+    start = time.perf_counter()
+    for _ in range(containers):
+        handler.upload_data(copy.deepcopy(container))
+    seconds = time.perf_counter() - start
+    results.append({"method": "upload_data", "processes": None,
+                    "seconds": seconds,
+                    "containers_per_second": containers / seconds,
+                    "rows_per_second": containers * (points + 1) / seconds})
+
+    for number in processes:
+        report = handler.bulk_upload(
+            (copy.deepcopy(container) for _ in range(containers)),
+            processes=number, writers=writers)
+        results.append({"method": "bulk_upload", "processes": number,
+                        "seconds": report["seconds"],
+                        "containers_per_second":
+                            report["containers_per_second"],
+                        "rows_per_second": report["rows_per_second"],
+                        "failed": len(report["failed"])})
+    handler.session.close()
+    return results
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--containers", type=int, default=200)
+    parser.add_argument("--points", type=int, default=500)
+    parser.add_argument("--processes", type=int, nargs="+",
+                        default=[0, 2, os.cpu_count()])
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    args = parser.parse_args()
+    results = run(args.containers, args.points, args.processes, args.writers)
+    for res in results:
+        print("{method:>12} {processes!s:>9} {seconds:9.3f} s "
+              "{containers_per_second:9.1f} containers/s "
+              "{rows_per_second:10.0f} rows/s".format(**res))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=1)
+
+
+if __name__ == "__main__":
+    main()
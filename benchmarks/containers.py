@@ -0,0 +1,88 @@
+"""Synthetic measurement containers for benchmarks."""
+import datetime
+import math
+import random
+
+START = datetime.datetime(2019, 6, 1, 12, 0, 0)
+
+
+def _timestamp(index):
+    return str(START + datetime.timedelta(seconds=index))
+
+
+def iv_container(points, name="benchmark_sensor", project="benchmark"):
+    """Returns an 'iv' container as recorded by the probe station (see
+    sample model)."""
+    header = {"measurement": "iv",
+              "name": name,
+              "project": project,
+              "operator": "benchmark",
+              "date": _timestamp(0),
+              "temperature": 20.0,
+              "humidity": 30.0,
+              "cerntimestamp": 1559390400,
+              "flag": "meas",
+              "guardring": True,
+              "station": "probe_left"}
+    data = []
+    for i in range(points):
+        voltage = -1000.0 * i / max(points - 1, 1)
+        data.append({"voltage": voltage,
+                     "current": -1e-9 * math.sqrt(-voltage) \
+                                * (1 + random.gauss(0, 0.01)),
+                     "timestamp": _timestamp(i),
+                     "temperature": 20.0 + random.gauss(0, 0.05),
+                     "humidity": 30.0 + random.gauss(0, 0.2),
+                     "biascurrent": -1e-8 * (1 + random.gauss(0, 0.01))})
+    return {"header": header, "data": data}
+
+
+def _default_header(measurement, name, project):
+    return {"measurement": measurement,
+            "name": name,
+            "project": project,
+            "operator": "benchmark",
+            "date": _timestamp(0),
+            "temperature": 20.0,
+            "flag": "meas",
+            "guardring": True}
+
+
+def i_tot_container(points, name="benchmark_sensor", project="benchmark"):
+    """Returns an 'I_tot' container of the default model."""
+    data = [{"high_voltage_set_voltage": -1000.0 * i / max(points - 1, 1),
+             "amperemeter_read_current": -1e-9 * (1 + random.random()),
+             "timestamp": _timestamp(i)} for i in range(points)]
+    return {"header": _default_header("I_tot", name, project), "data": data}
+
+
+def c_tot_container(points, name="benchmark_sensor", project="benchmark"):
+    """Returns a 'C_tot' container of the default model."""
+    data = [{"high_voltage_set_voltage": -1000.0 * i / max(points - 1, 1),
+             "lcr_read_capacitance": 1e-10 * (1 + random.random()),
+             "timestamp": _timestamp(i)} for i in range(points)]
+    return {"header": _default_header("C_tot", name, project), "data": data}
+
+
+def r_poly_container(points, name="benchmark_sensor", project="benchmark",
+                     ramp_points=5):
+    """Returns an 'R_poly' container of the default model. Every strip
+    carries a voltage 'ramp' that is stored as nested subdata."""
+    data = []
+    for i in range(points):
+        ramp = [{"low_voltage_set_voltage": float(j),
+                 "amperemeter_read_current": 1e-6 * j * (1 + random.random())}
+                for j in range(ramp_points)]
+        data.append({"motor_goto_strip": i,
+                     "r_poly": 1.5e6 * (1 + random.gauss(0, 0.01)),
+                     "high_voltage_set_voltage": -600.0,
+                     "timestamp": _timestamp(i),
+                     "ramp": ramp})
+    return {"header": _default_header("R_poly", name, project), "data": data}
+
+
+# measurement types of every model that can be benchmarked
+CONTAINERS = {"default": {"I_tot": i_tot_container,
+                          "C_tot": c_tot_container,
+                          "R_poly": r_poly_container},
+              "sample": {"iv": iv_container}}
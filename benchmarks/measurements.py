@@ -0,0 +1,88 @@
+"""Compares per-probe reads with get_measurements.
+
+A sensor report reads every probe of a sensor: get_dict of db_probe,
+search_table of db_probe_data and the db_info row. The benchmark uploads
+synthetic I_tot curves of the default model and reads them once probe by
+probe and once with one get_measurements call, counting the executed
+statements. Run with
+
+    python -m DBHandler.benchmarks.measurements --probes 200 --points 100 \
+        --output results.json
+"""
+import argparse
+import copy
+import json
+import tempfile
+import time
+
+import sqlalchemy
+
+from .containers import i_tot_container
+from .pipeline import SENSOR, make_handler
+
+
+def per_probe(handler, probeids):
+    """The reads of a report without get_measurements."""
+    report = {}
+    for probeid in probeids:
+        probe = handler.get_dict("db_probe", probeid)
+        report[probeid] = {
+            "db_probe": probe,
+            "db_info": handler.get_dict("db_info", probe["id"]),
+            "db_probe_data": [
+                row.to_dict() for row in
+                handler.search_rows("db_probe_data", probeid=probeid)]}
+    return report
+
+
+def run(probes, points, backend="sqlite-file"):
+    """Returns time and statements of both ways to read probes curves."""
+    workdir = tempfile.mkdtemp(prefix="dbhandler_bench_")
+    handler = make_handler("default", backend, workdir)
+    handler.log.setLevel("WARNING")
+    container = i_tot_container(points, **SENSOR)
+    for _ in range(probes):
+        handler.upload_data(copy.deepcopy(container))
+    probeids = handler.get_values("db_probe", "probeid")
+    probeids = probeids if isinstance(probeids, list) else [probeids]
+
+    statements = [0]
+
+    def count(*args): #pylint: disable=W0613
+        statements[0] += 1
+    sqlalchemy.event.listen(handler.engine, "before_cursor_execute", count)
+    result = {"probes": probes, "points": points}
+    for name, func in [
+            ("per_probe", lambda: per_probe(handler, probeids)),
+            ("get_measurements", lambda: handler.get_measurements(probeids))]:
+        statements[0] = 0
+        start = time.perf_counter()
+        func()
+        result[name + "_seconds"] = time.perf_counter() - start
+        result[name + "_statements"] = statements[0]
+    sqlalchemy.event.remove(handler.engine, "before_cursor_execute", count)
+    handler.session.close()
+    return result
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--probes", type=int, nargs="+", default=[20, 200])
+    parser.add_argument("--points", type=int, default=100)
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    args = parser.parse_args()
+    results = [run(probes, args.points) for probes in args.probes]
+    for res in results:
+        print("{probes:>5} probes | per probe {per_probe_seconds:8.3f} s "
+              "{per_probe_statements:>6} statements | get_measurements "
+              "{get_measurements_seconds:8.3f} s "
+              "{get_measurements_statements:>4} statements".format(**res))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=1)
+
+
+if __name__ == "__main__":
+    main()
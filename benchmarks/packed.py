@@ -0,0 +1,70 @@
+"""Compares row storage of db_probe_data with packed curves.
+
+Synthetic I_tot curves of the default model are uploaded with upload_data
+and read back with get_columns, once with one row per point and once with
+db_probe_data as packed table (one compressed row per probeid). Run with
+
+    python -m DBHandler.benchmarks.packed --curves 20 --points 1000 5000 \
+        --output results.json
+"""
+import argparse
+import copy
+import json
+import os
+import tempfile
+import time
+
+from .containers import i_tot_container
+from .pipeline import SENSOR, make_handler
+
+PACKED = {"packed tables": {"db_probe_data": {
+    "table": "db_probe_curve", "key": "probeid", "compression": "zstd"}}}
+
+
+def run(storage, curves, points, backend="sqlite-file"):
+    """Returns upload and read time per curve and the DB file size."""
+    workdir = tempfile.mkdtemp(prefix="dbhandler_bench_")
+    handler = make_handler("default", backend, workdir,
+                           extra=PACKED if storage == "packed" else None)
+    handler.log.setLevel("WARNING")
+    container = i_tot_container(points, **SENSOR)
+    start = time.perf_counter()
+    for _ in range(curves):
+        handler.upload_data(copy.deepcopy(container))
+    upload = (time.perf_counter() - start) / curves
+    probeids = handler.get_values("db_probe", "probeid")
+    probeids = probeids if isinstance(probeids, list) else [probeids]
+    start = time.perf_counter()
+    for probeid in probeids:
+        handler.get_columns("db_probe_data", probeid)
+    read = (time.perf_counter() - start) / len(probeids)
+    handler.session.close()
+    path = os.path.join(workdir, "benchmark.db")
+    return {"storage": storage, "curves": curves, "points": points,
+            "upload_seconds": upload, "read_seconds": read,
+            "db_bytes": os.path.getsize(path) if os.path.exists(path)
+                        else None}
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--curves", type=int, default=20)
+    parser.add_argument("--points", type=int, nargs="+",
+                        default=[100, 1000, 5000])
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    args = parser.parse_args()
+    results = [run(storage, args.curves, points)
+               for points in args.points for storage in ["rows", "packed"]]
+    for res in results:
+        print("{storage:>7} {points:>7} points {upload_seconds:9.4f} s/upload "
+              "{read_seconds:9.5f} s/read {db_bytes!s:>10} bytes"
+              .format(**res))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=1)
+
+
+if __name__ == "__main__":
+    main()
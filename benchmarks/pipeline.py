@@ -0,0 +1,196 @@
+"""Benchmarks the DBHandler upload and query pipeline.
+
+Synthetic containers of every measurement type of the default model (I_tot,
+C_tot, R_poly with nested 'ramp' subdata) and the sample model (iv) are
+uploaded with increasing size. The stages untangle_data, add_cross_ref,
+check_data_types and store_data as well as typical queries are timed. The
+backends are SQLite (file and in-memory) and, if a credentials file is
+given, a MySQL/MariaDB server. Run with
+
+    python -m DBHandler.benchmarks.pipeline --sizes 10 100 1000 \
+        --output results.json
+
+Every model runs in its own process because the table classes of all
+models share one declarative base.
+"""
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+BACKENDS = ["sqlite-file", "sqlite-memory", "mysql"]
+SENSOR = {"name": "benchmark_sensor", "project": "benchmark"}
+
+
+def make_handler(model, backend, workdir, mysql_cred=None, extra=None):
+    """Returns a DBHandler for model that is connected to backend, extra
+    sections (dict) are added to the model."""
+    from DBHandler.modules.dbhandler import dbhandler
+
+    path = os.path.join(dbhandler.MODPATH, "models", model, model + ".yml")
+    with open(path, "r") as cfg:
+        db_cfg = yaml.load(cfg, Loader=yaml.FullLoader)
+    db_cfg["map"] = "DBHandler.modules.dbhandler.models.{0}.{0}_map"\
+                    .format(model)
+    if backend == "mysql":
+        db_cfg["engine"] = "mysql+mysqlconnector"
+        db_cfg["credentials"] = os.path.abspath(mysql_cred)
+    elif backend == "sqlite-memory":
+        db_cfg["engine"] = "sqlite"
+        db_cfg["sqlite"] = {"path": ":memory:"}
+    else:
+        db_cfg["engine"] = "sqlite"
+        db_cfg["sqlite"] = dict(db_cfg.get("sqlite") or {},
+                                path=os.path.join(workdir, "benchmark.db"))
+    db_cfg.update(extra or {})
+    model_file = os.path.join(workdir, model + ".yml")
+    with open(model_file, "w") as cfg:
+        yaml.dump(db_cfg, cfg)
+    handler = dbhandler.DBHandler(model_file)
+    if "db_info" in handler.dbt.all_names() \
+            and not handler.check_for_value("db_info", **SENSOR):
+        handler.add_item("db_info", dict(SENSOR))
+    return handler
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def time_upload(handler, factory, points):
+    """Times every stage of upload_data for one container."""
+    container = factory(points, **SENSOR)
+    timings = {}
+    meas_data, timings["untangle_data"] = _timed(handler.untangle_data,
+                                                 copy.deepcopy(container))
+    meas_data, timings["add_cross_ref"] = _timed(handler.add_cross_ref,
+                                                 meas_data)
+    meas_data, timings["check_data_types"] = _timed(handler.check_data_types,
+                                                    meas_data)
+    success, timings["store_data"] = _timed(handler.store_data, meas_data)
+    return timings, bool(success)
+
+
+def time_queries(handler):
+    """Times typical read operations on the latest uploaded measurement."""
+    import sqlalchemy
+    table = handler.dbt.obj("db_probe")
+    probeid, = handler.session.query(
+        sqlalchemy.func.max(table.probeid)).one()
+    queries = {
+        "get_dict": lambda: handler.get_dict("db_probe", probeid),
+        "search_table": lambda: handler.search_table(
+            "db_probe_data", probeid=probeid).all(),
+        "get_values": lambda: handler.get_values(
+            "db_probe_data", "datay", {"probeid": probeid}),
+        "check_for_value": lambda: handler.check_for_value("db_info",
+                                                           **SENSOR),
+        "which_exist": lambda: handler.which_exist(
+            "db_info", "name", [SENSOR["name"]]
+            + ["sensor_{}".format(index) for index in range(5000)])}
+    return {name: _timed(query)[1] for name, query in queries.items()}
+
+
+def run_model(model, backends, sizes, repeat, mysql_cred=None):
+    """Runs the benchmark of one model and returns a list of results."""
+    from .containers import CONTAINERS
+    results = []
+    for backend in backends:
+        workdir = tempfile.mkdtemp(prefix="dbhandler_bench_")
+        try:
+            handler = make_handler(model, backend, workdir, mysql_cred)
+        except Exception as err: # pylint: disable=W0703
+            print("Skipping {}/{}: {}".format(model, backend, err),
+                  file=sys.stderr)
+            continue
+        handler.log.setLevel("WARNING")
+        for measurement, factory in CONTAINERS[model].items():
+            for points in sizes:
+                for run in range(repeat):
+                    timings, success = time_upload(handler, factory, points)
+                    if success:
+                        timings.update(time_queries(handler))
+                    for stage, seconds in timings.items():
+                        results.append({"model": model,
+                                        "backend": backend,
+                                        "measurement": measurement,
+                                        "points": points,
+                                        "run": run,
+                                        "stage": stage,
+                                        "seconds": seconds,
+                                        "success": success})
+        handler.session.close()
+    return results
+
+
+def _metadata():
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import sqlalchemy
+    return {"commit": commit,
+            "date": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "machine": platform.machine()}
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--models", nargs="+", default=["default", "sample"])
+    parser.add_argument("--backends", nargs="+", default=BACKENDS[:2],
+                        choices=BACKENDS)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mysql-cred", default=None,
+                        help="credentials file of a MySQL/MariaDB test DB")
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    backends = [b for b in args.backends
+                if b != "mysql" or args.mysql_cred is not None]
+
+    if args.worker:
+        json.dump(run_model(args.worker, backends, args.sizes, args.repeat,
+                            args.mysql_cred), sys.stdout)
+        return
+
+    results = []
+    for model in args.models:
+        cmd = [sys.executable, "-m", __spec__.name, "--worker", model,
+               "--backends"] + backends \
+            + ["--sizes"] + [str(size) for size in args.sizes] \
+            + ["--repeat", str(args.repeat)]
+        if args.mysql_cred:
+            cmd += ["--mysql-cred", args.mysql_cred]
+        output = subprocess.run(cmd, stdout=subprocess.PIPE, check=True)
+        results += json.loads(output.stdout.decode())
+
+    for res in results:
+        if res["run"] == 0:
+            print("{model:>8} {backend:>14} {measurement:>7} {points:>8} "
+                  "{stage:>17} {seconds:10.5f} s".format(**res))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump({"metadata": _metadata(), "results": results}, out,
+                      indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Benchmarks the high-volume insert path of the etl_tct_test model.
+
+Synthetic pulses (etl_tct_pulse) with several CFD times each
+(etl_tct_cfd_time) are loaded with DBHandler.load_nested. For comparison a
+small sample is inserted with the per-row add_item path. Run with
+
+    python -m DBHandler.benchmarks.pulses --pulses 1000000 --cfd 3 \
+        --output results.json
+
+Add '--backends mysql --mysql-cred cred.yml' to load into a MySQL/MariaDB
+test DB ('--method infile' uses LOAD DATA LOCAL INFILE).
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from .pipeline import make_handler
+
+MODEL = "etl_tct_test"
+RUN = {"temperature": 20., "bias_voltage": -200., "scope": "benchmark",
+       "operator": 1, "flag": "meas", "signal_source": "sr90"}
+
+
+def pulse_columns(pulses, cfd, runid):
+    """Returns parent columns, child columns and parent index of synthetic
+    pulses with cfd CFD times each."""
+    rng = np.random.default_rng(0)
+    parents = {"eventid": np.arange(pulses),
+               "runid": runid,
+               "risetime": rng.normal(500e-12, 50e-12, pulses),
+               "charge": rng.normal(10e-15, 2e-15, pulses),
+               "signalheight": rng.normal(0.1, 0.01, pulses),
+               "slope": rng.normal(1e8, 1e7, pulses),
+               "pulselength": rng.normal(2e-9, 1e-10, pulses),
+               "noise": rng.normal(1e-3, 1e-4, pulses),
+               "scope_channel": 1,
+               "pulse_source": "dut"}
+    children = {"fraction": np.tile(np.arange(10, 10 * (cfd + 1), 10),
+                                    pulses),
+                "time": rng.normal(1e-9, 1e-11, pulses * cfd)}
+    return parents, children, np.repeat(np.arange(pulses), cfd)
+
+
+def run(backend, pulses, cfd, method, sample, mysql_cred=None): #pylint: disable=R0913
+    """Returns rows/s of load_nested and of the per-row add_item path."""
+    handler = make_handler(MODEL, backend, tempfile.mkdtemp(
+        prefix="dbhandler_bench_"), mysql_cred)
+    handler.log.setLevel("WARNING")
+    handler.add_item("etl_tct_run", dict(RUN))
+    runid = handler.get_values("etl_tct_run", "runid")
+    runid = max(runid) if isinstance(runid, list) else runid
+    results = []
+
+    parents, children, index = pulse_columns(sample, cfd, runid)
+    start = time.perf_counter()
+    for number in range(sample):
+        handler.add_item("etl_tct_pulse", {
+            key: (value[number].item() if hasattr(value, "dtype") else value)
+            for key, value in parents.items()})
+        for child in np.nonzero(index == number)[0]:
+            handler.add_item("etl_tct_cfd_time", {
+                "pulseid": number + 1,
+                "fraction": children["fraction"][child].item(),
+                "time": children["time"][child].item()})
+    seconds = time.perf_counter() - start
+    results.append({"backend": backend, "method": "add_item",
+                    "pulses": sample, "rows": sample * (cfd + 1),
+                    "seconds": seconds,
+                    "rows_per_second": sample * (cfd + 1) / seconds})
+
+    parents, children, index = pulse_columns(pulses, cfd, runid)
+    start = time.perf_counter()
+    handler.load_nested("etl_tct_pulse", parents, "etl_tct_cfd_time",
+                        children, index, method=method)
+    seconds = time.perf_counter() - start
+    results.append({"backend": backend, "method": "load_nested/" + method,
+                    "pulses": pulses, "rows": pulses * (cfd + 1),
+                    "seconds": seconds,
+                    "rows_per_second": pulses * (cfd + 1) / seconds})
+    handler.session.close()
+    return results
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--pulses", type=int, default=1000000)
+    parser.add_argument("--cfd", type=int, default=3,
+                        help="CFD times per pulse")
+    parser.add_argument("--sample", type=int, default=1000,
+                        help="pulses inserted with add_item")
+    parser.add_argument("--backends", nargs="+", default=["sqlite-file"],
+                        choices=["sqlite-file", "sqlite-memory", "mysql"])
+    parser.add_argument("--method", default="auto",
+                        choices=["auto", "executemany", "infile"])
+    parser.add_argument("--mysql-cred", default=None)
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    args = parser.parse_args()
+    results = []
+    for backend in args.backends:
+        results += run(backend, args.pulses, args.cfd, args.method,
+                       args.sample, args.mysql_cred)
+    for res in results:
+        print("{backend:>14} {method:>24} {pulses:>9} pulses "
+              "{seconds:9.2f} s {rows_per_second:10.0f} rows/s".format(**res))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=1)
+
+
+if __name__ == "__main__":
+    main()
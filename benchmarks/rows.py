@@ -0,0 +1,114 @@
+"""Compares ORM instances with lightweight rows on a wide table.
+
+db_alibava of the sample model (~60 columns) is filled with synthetic rows
+and read back completely, once as ORM instances (search_table, get_dict
+before the rows) and once as plain rows (select_rows, search_rows). Time
+and peak memory (tracemalloc) of the reads and the conversion to dicts are
+reported. Run with
+
+    python -m DBHandler.benchmarks.rows --rows 10000 100000 \
+        --output results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+
+def _value(column, index):
+    if isinstance(column.type, sqlalchemy.Enum):
+        return column.type.enums[index % len(column.type.enums)]
+    if isinstance(column.type, sqlalchemy.DateTime):
+        return datetime.datetime(2020, 1, 1) \
+            + datetime.timedelta(seconds=index)
+    if isinstance(column.type, sqlalchemy.Integer):
+        return index
+    if isinstance(column.type, sqlalchemy.Float):
+        return index * 0.5
+    return "value {}".format(index % 100)
+
+
+def _measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def run(rows, workdir):
+    """Returns time and peak memory of ORM and plain reads of rows rows."""
+    from DBHandler.modules.dbhandler.models.sample.sample_map import \
+        db_alibava
+    from DBHandler.modules.dbhandler.rows import select_rows
+
+    engine = sqlalchemy.create_engine("sqlite:///" + os.path.join(
+        workdir, "rows_{}.db".format(rows)))
+    tab = db_alibava.__table__
+    tab.create(engine)
+    with engine.begin() as conn:
+        conn.execute(tab.insert(), [
+            {column.name: _value(column, index) for column in tab.columns
+             if not column.primary_key} for index in range(rows)])
+    session = sessionmaker(bind=engine)()
+
+    def orm():
+        return session.query(db_alibava).all()
+
+    def orm_dicts():
+        result = []
+        for item in session.query(db_alibava):
+            values = dict(sqlalchemy.orm.attributes.instance_dict(item))
+            values.pop("_sa_instance_state")
+            result.append(values)
+        return result
+
+    def plain():
+        return select_rows(session.connection(), db_alibava)
+
+    def plain_dicts():
+        return [row.to_dict()
+                for row in select_rows(session.connection(), db_alibava)]
+
+    results = {"rows": rows, "columns": len(tab.columns)}
+    for name, func in [("orm", orm), ("orm_dicts", orm_dicts),
+                       ("plain", plain), ("plain_dicts", plain_dicts)]:
+        session.expunge_all()
+        _, seconds, peak = _measure(func)
+        results[name + "_seconds"] = seconds
+        results[name + "_peak_bytes"] = peak
+    session.close()
+    engine.dispose()
+    return results
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix="dbhandler_rows_")
+    results = [run(rows, workdir) for rows in args.rows]
+    for res in results:
+        print("{rows:>8} rows | orm {orm_seconds:7.3f} s "
+              "{orm_peak_bytes:>11} B | plain {plain_seconds:7.3f} s "
+              "{plain_peak_bytes:>11} B | dicts: orm {orm_dicts_seconds:7.3f}"
+              " s plain {plain_dicts_seconds:7.3f} s".format(**res))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compares the insert rate of SQLite performance profiles.
+
+Every profile is a 'sqlite' model section (see create_sqlite_engine). Rows
+of the default model's probe_data table are inserted one commit per row, as
+DBHandler.add_item does, and in a single transaction. Run with
+``python -m DBHandler.benchmarks.sqlite_profiles``.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy.orm import sessionmaker
+
+PROFILES = {
+    "default": {},
+    "wal": {"journal_mode": "WAL",
+            "synchronous": "NORMAL"},
+    "wal-tuned": {"journal_mode": "WAL",
+                  "synchronous": "NORMAL",
+                  "cache_size": -64000,
+                  "mmap_size": 268435456,
+                  "temp_store": "MEMORY",
+                  "busy_timeout": 5000},
+    "unsafe": {"journal_mode": "MEMORY",
+               "synchronous": "OFF"},
+    "memory": {"path": ":memory:"}}
+
+
+def _row(index):
+    return {"probeid": 1, "datax": float(index), "datay": 1e-9 * index,
+            "temperature": 20.0, "RH": 30.0}
+
+
+def run(profile, rows, workdir):
+    """Returns inserts/sec of one profile for per-row and batched commits."""
+    from DBHandler.modules.dbhandler import dbhandler, BASE
+    from DBHandler.modules.dbhandler.models.default import default_map
+
+    sqlite_cfg = dict(PROFILES[profile])
+    sqlite_cfg.setdefault("path", os.path.join(workdir, profile + ".db"))
+    engine = dbhandler.create_sqlite_engine(sqlite_cfg)
+    BASE.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    table = default_map.db_probe_data
+
+    start = time.perf_counter()
+    for index in range(rows):
+        session.add(table(**_row(index)))
+        session.commit()
+    per_row = rows / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    session.bulk_insert_mappings(table, [_row(index)
+                                         for index in range(rows)])
+    session.commit()
+    batched = rows / (time.perf_counter() - start)
+    session.close()
+    engine.dispose()
+    return {"profile": profile, "rows": rows,
+            "per_row_commit_per_s": per_row,
+            "single_transaction_per_s": batched}
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES),
+                        choices=list(PROFILES))
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp(prefix="dbhandler_sqlite_")
+    results = [run(profile, args.rows, workdir) for profile in args.profiles]
+    for res in results:
+        print("{profile:>10} {per_row_commit_per_s:12.0f} rows/s per row "
+              "{single_transaction_per_s:12.0f} rows/s batched".format(**res))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Compares the JSON, msgpack and Arrow transport of measurement containers.
+
+Run with ``python -m DBHandler.benchmarks.transport``.
+"""
+import argparse
+import json
+import timeit
+
+from DBHandler.utility import transport
+from .containers import iv_container
+
+CANDIDATES = [("json", None),
+              ("msgpack", None),
+              ("msgpack", "zstd"),
+              ("msgpack", "lz4"),
+              ("arrow", None),
+              ("arrow", "zstd")]
+
+
+def run(points, repeat):
+    """Returns encode/decode timings and body size of every candidate."""
+    container = iv_container(points)
+    results = []
+    for encoding, compression in CANDIDATES:
+        try:
+            body, headers = transport.encode_payload(container, encoding,
+                                                     compression)
+        except ImportError as err:
+            print("Skipping {}/{}: {}".format(encoding, compression, err))
+            continue
+        encode = min(timeit.repeat(
+            lambda: transport.encode_payload(container, encoding, #pylint: disable=W0640
+                                             compression),
+            number=1, repeat=repeat))
+        decode = min(timeit.repeat(
+            lambda: transport.decode_payload(body, headers['Content-Type'], #pylint: disable=W0640
+                                             compression),
+            number=1, repeat=repeat))
+        results.append({"encoding": encoding,
+                        "compression": compression,
+                        "points": points,
+                        "bytes": len(body),
+                        "encode_s": encode,
+                        "decode_s": decode})
+    return results
+
+
+def main():
+    """Benchmark entry point."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, nargs="+",
+                        default=[100, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None,
+                        help="write results to this JSON file")
+    args = parser.parse_args()
+    results = []
+    for points in args.points:
+        results += run(points, args.repeat)
+    for res in results:
+        print("{points:>8} {encoding:>8} {compression!s:>5} "
+              "{bytes:>12} B  enc {encode_s:.4f} s  dec {decode_s:.4f} s"
+              .format(**res))
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
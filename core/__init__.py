@@ -1,4 +1,4 @@
 """ The core part of MeasurementControl """
 
 from .device import Device
-from .module import Module, Endpoint, Alive, Interrupt
+from .module import Module, Endpoint, Alive, Interrupt, Metrics
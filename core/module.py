@@ -6,7 +6,6 @@ with a supervisor, starting the flask rest api,...
 """
 
 import logging
-import logging.handlers
 from socket import error as socket_error
 import argparse
 import threading
@@ -32,6 +31,29 @@ class Endpoint(Resource): #pylint: disable=too-few-public-methods
         self.log = self.module.log
         super().__init__(args, **kwargs)
 
+    def payload(self, columnar=False):
+        """ Return the decoded request body. Besides JSON, msgpack and Arrow
+        IPC bodies (optionally zstd/lz4 compressed) are accepted. """
+        return utility.decode_payload(request.get_data(),
+                                      request.mimetype,
+                                      request.headers.get('Content-Encoding'),
+                                      columnar=columnar)
+
+    def respond(self, payload, status=200):
+        """ Encode payload according to the Accept header of the request,
+        payloads that the negotiated encoding can't represent are sent as
+        JSON """
+        encoding = utility.negotiate_encoding(request.accept_mimetypes,
+                                              payload)
+        if encoding == 'json':
+            return payload, status
+        try:
+            body, headers = utility.encode_payload(payload, encoding)
+        except (TypeError, ValueError, OverflowError) as err:
+            self.log.debug("Can't encode response as %s: %s", encoding, err)
+            return payload, status
+        return make_response(body, status, headers)
+
 
 class Alive(Resource):  # pylint: disable=R0903
     """ Alive endpoint. """
@@ -47,10 +69,15 @@ class Interrupt(Endpoint):  # pylint: disable=R0903
         """Handle interrupt."""
         self.log.debug("Received interrupt")
         self.module.interrupt()
-        func = request.environ.get('werkzeug.server.shutdown')
-        if func is None:
-            raise RuntimeError('Not running with the Werkzeug Server')
-        func()
+        self.module.shutdown_server()
+
+class Metrics(Endpoint):  # pylint: disable=R0903
+    """Metrics endpoint, Prometheus text format."""
+
+    def get(self):
+        """Return all metrics of the module."""
+        return make_response(self.module.metrics.render_prometheus(), 200,
+                             {'Content-Type': 'text/plain; version=0.0.4'})
 
 class Module(): #pylint: disable=too-many-instance-attributes
     """ Module base class """
@@ -81,6 +108,7 @@ class Module(): #pylint: disable=too-many-instance-attributes
 
         self.app = None
         self.api = None
+        self.server = None
 
         self._add_local_logger()
 
@@ -92,6 +120,14 @@ class Module(): #pylint: disable=too-many-instance-attributes
         elif cmdargs.cfg:
             self.config = self.get_config_from_file(filename=cmdargs.cfg,
                                                     section=self._name)
+        # metrics are collected if enabled by 'metrics: True' in the config
+        try:
+            metrics_enabled = bool(self.config[self._name].get('metrics',
+                                                               False))
+        except (KeyError, TypeError, AttributeError):
+            metrics_enabled = False
+        self.metrics = utility.MetricsRegistry(enabled=metrics_enabled)
+
         try:
             self._apply_config()
         except AttributeError:
@@ -249,20 +285,26 @@ module.".format(self.__class__.__name__))
 
     def get_http_handler(self):
         """
-        Get a http_handler pointing to the logcollector
+        Get a batching, non-blocking http_handler pointing to the
+        logcollector. Batch size, flush interval, queue size, sample rate
+        and body format can be set in the 'log_shipping' entry of the module
+        config section (see utility.BatchHTTPHandler).
         """
         post_string = "http://{0}:{1}{2}".format(self.registry['ip'],
                                                  self.registry['port'],
                                                  self.registry['path'])
         log_collector = requests.get(post_string).json()
+        try:
+            shipping = self.config[self._name].get('log_shipping') or {}
+        except (KeyError, TypeError, AttributeError):
+            shipping = {}
         http_handler = None
         for proc in log_collector:
             if proc['type'] == 'logcollector':
-                http_handler = logging.handlers.HTTPHandler(
+                http_handler = utility.BatchHTTPHandler(
                     '{0}:{1}'.format(proc['ip'], proc['port']),
                     '/log',
-                    method='POST',
-                )
+                    **getattr(shipping, 'dictionary', shipping))
                 http_handler.setLevel(logging.NOTSET)
         return http_handler
 
@@ -273,6 +315,8 @@ module.".format(self.__class__.__name__))
         """
         http_handler = self.get_http_handler()
         if http_handler:
+            for handler in self.log.handlers:
+                handler.close()
             self.log.handlers = []
             self.log.addHandler(http_handler)
             self.log.debug("Setting verbosity to %s", self.verbosity)
@@ -294,6 +338,12 @@ module.".format(self.__class__.__name__))
         """
         self.add_endpoint(Interrupt, '/interrupt')
 
+    def add_metrics_endpoint(self):
+        """
+        Add metrics endpoint to the module
+        """
+        self.add_endpoint(Metrics, '/metrics')
+
 
     def add_endpoint(self, resource, endpoint):
         """ Add HTTP endpoint and pass module instance in class_kwargs. """
@@ -306,6 +356,20 @@ module.".format(self.__class__.__name__))
     def _add_user_thread(self):
         self.log.debug("No user defined thread specified in %s.", self)
 
+    def before_fork(self):
+        """
+        Called in the parent process before a pre-fork server (gunicorn)
+        forks a worker. To be overwritten by user class.
+        """
+
+    def after_fork(self):
+        """
+        Called in every forked worker process of a pre-fork server
+        (gunicorn) before it handles requests. Resources that must not be
+        shared with the parent (e.g. DB connections) are recreated here.
+        To be overwritten by user class.
+        """
+
     def interrupt(self):
         """
         Interrupt handler, called during interrupt.
@@ -318,35 +382,48 @@ module.".format(self.__class__.__name__))
 
     def create_flask_app(self, flask_thread=False):
         """
-        Create and run the flask app. Populate alive, interrupt and user
-        enpoints.
+        Create and run the flask app. Populate alive, interrupt, metrics and
+        user enpoints. The serving backend (werkzeug, waitress or gunicorn) and
+        its worker/thread/keep-alive/backlog limits are taken from the
+        'server' entry of the module config section.
         """
         self.app = Flask(__name__)   # Create a Flask WSGI appliction
         self.api = Api(self.app)          # Create a Flask-RESTPlus API
         logging.getLogger('werkzeug').setLevel(logging.WARNING)
         self.add_alive_endpoint()
         self.add_interrupt_endpoint()
+        self.add_metrics_endpoint()
         self._add_user_endpoints(self.api)
         CORS(self.app, resources={r"/*": {"origins": "*"}})
         if not self._testing:
+            self.server = utility.create_server(
+                self.app,
+                self.config[self._name]['ip'],
+                self.config[self._name]['port'],
+                self.config[self._name].get('server'),
+                before_fork=self.before_fork,
+                after_fork=self.after_fork)
+            if flask_thread and self.server.main_thread:
+                raise RuntimeError("The {} has to run in the main thread, "
+                                   "flask_thread is not supported".format(
+                                       self.server.__class__.__name__))
             if flask_thread:
-                keywords = {'debug': True,
-                            'host': self.config[self._name]['ip'],
-                            'port': self.config[self._name]['port'],
-                            'use_reloader': False,
-                            'threaded': True}
-                flask_thr = threading.Thread(target=self.app.run,
-                                             kwargs=keywords)
+                flask_thr = threading.Thread(target=self.server.run)
                 flask_thr.start()
                 time.sleep(0.1)
                 self._add_user_thread()
                 flask_thr.join()
             else:
-                self.app.run(debug=True,
-                             host=self.config[self._name]['ip'],
-                             port=self.config[self._name]['port'],
-                             use_reloader=False,
-                             threaded=True)
+                self.server.run()
+
+    def shutdown_server(self):
+        """
+        Stop the server started by create_flask_app. Can be called from
+        within a request.
+        """
+        if self.server is None:
+            raise RuntimeError('No server running')
+        self.server.shutdown()
 
     def get_process_from_registry(self, processtype):
         """Get list of processes of a certain type from the registry."""
@@ -386,15 +463,29 @@ module.".format(self.__class__.__name__))
         return ret
 
     @staticmethod
-    def issue_call(method, recipient, path, payload=None):
-        """Issue the http call into the system."""
+    def issue_call(method, recipient, path, payload=None, # pylint: disable=R0913
+                   encoding='json', compression=None):
+        """Issue the http call into the system. Payloads of post and put
+        calls are sent as JSON by default. Pass encoding='msgpack' or
+        'arrow' to send the data block of a measurement container as packed
+        float64 columns and compression='zstd' or 'lz4' to compress the
+        body."""
         http_string = "http://{0}:{1}{2}".format(recipient['ip'],
                                                  recipient['port'],
                                                  path)
+        body = None
+        headers = None
+        if encoding != 'json' or compression:
+            body, headers = utility.encode_payload(payload, encoding,
+                                                   compression)
         if method == "get":
             dat = requests.get(http_string)
+        elif method == "post" and body is not None:
+            dat = requests.post(http_string, data=body, headers=headers)
         elif method == "post":
             dat = requests.post(http_string, json=payload)
+        elif method == "put" and body is not None:
+            dat = requests.put(http_string, data=body, headers=headers)
         elif method == "put":
             dat = requests.put(http_string, json=payload)
         elif method == "delete":
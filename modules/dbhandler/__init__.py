@@ -1,3 +1,4 @@
 """DBHandler package."""
 from .models import BASE
 from .dbhandler import DBHandler
+from .aio import AsyncDBHandler
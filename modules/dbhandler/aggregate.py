@@ -0,0 +1,328 @@
+"""Server-side aggregation and downsampling of curves for plotting.
+
+A plot of 1000 pixels does not need millions of points. Two reductions are
+offered, both return columns (dict{name : list}):
+
+    - bucket_aggregate pushes the binning into SQL: the x range is split
+      into equal buckets, 'GROUP BY bucket' returns count and min/max/mean
+      of the y columns per bucket
+    - lttb is a streaming Largest-Triangle-Three-Buckets downsampler that
+      keeps the visual shape of a curve. It runs while the rows are
+      fetched, only two buckets are held in memory
+
+DateTime columns are handled as seconds since the epoch in SQL. lttb
+returns the stored x values of the selected points, the bucket centers of
+bucket_aggregate are returned as datetime objects.
+
+Curves of packed tables (see packed.py) are no rows of the DB, they are
+unpacked and reduced in memory by aggregate_columns and lttb_columns with
+the same results.
+"""
+import datetime
+import itertools
+import math
+
+import sqlalchemy
+
+EPOCH = datetime.datetime(1970, 1, 1)
+# rows per fetch of the streaming downsampler
+FETCH_SIZE = 10000
+
+
+def is_datetime(column):
+    """Returns True if column is a DateTime column."""
+    return isinstance(column.type, sqlalchemy.DateTime)
+
+
+def numeric(column, dialect):
+    """Returns column as numeric SQL expression, DateTime columns as seconds
+    since the epoch."""
+    if not is_datetime(column):
+        return column
+    if dialect.name == "sqlite":
+        return (sqlalchemy.func.julianday(column) - 2440587.5) * 86400.0
+    if dialect.name == "mysql":
+        return sqlalchemy.func.timestampdiff(
+            sqlalchemy.text("MICROSECOND"),
+            sqlalchemy.literal("1970-01-01"), column) / 1e6
+    return sqlalchemy.extract("epoch", column)
+
+
+def to_number(value):
+    """Converts datetime objects to seconds since the epoch."""
+    if isinstance(value, datetime.datetime):
+        return (value - EPOCH).total_seconds()
+    return value
+
+
+def from_number(value, column):
+    """Inverse of to_number for values of column."""
+    if value is not None and is_datetime(column):
+        return EPOCH + datetime.timedelta(seconds=value)
+    return value
+
+
+def bucket_aggregate(conn, table, x, ys, buckets=1000, where=(), #pylint: disable=R0913, R0914
+                     x_range=None):
+    """Aggregates the y columns in equal x buckets with one GROUP BY query.
+
+    Args:
+        - conn (Connection) : DB connection
+        - table (sqlalchemy.Table) : DB table
+        - x (str) : column that is binned, e.g. 'datax' or 'time'
+        - ys (list) : aggregated columns
+        - buckets (int) : number of buckets
+        - where (list) : filter expressions
+        - x_range (tuple) : (low, high), default is min/max of x
+
+    Returns:
+        dict{x : bucket centers, 'count' : [...], '<y>_min' : [...],
+             '<y>_max' : [...], '<y>_mean' : [...]}, empty buckets are left
+        out
+    """
+    x_col = table.c[x]
+    x_num = numeric(x_col, conn.dialect)
+    where = list(where)
+    if x_range is None:
+        low, high = conn.execute(sqlalchemy.select(
+            [sqlalchemy.func.min(x_num), sqlalchemy.func.max(x_num)])
+                                 .where(sqlalchemy.and_(*where))).first()
+    else:
+        low, high = (to_number(value) for value in x_range)
+    columns = {x: [], "count": []}
+    for y in ys:
+        for agg in ["min", "max", "mean"]:
+            columns["{}_{}".format(y, agg)] = []
+    if low is None:
+        return columns
+    low, high = float(low), float(high)
+    width = (high - low) / buckets or 1.
+    index = (x_num - low) / width
+    if conn.dialect.name == "sqlite":
+        # x - low >= 0, so the cast truncates like floor
+        bucket = sqlalchemy.cast(index, sqlalchemy.Integer)
+    else:
+        bucket = sqlalchemy.func.floor(index)
+    bucket = bucket.label("bucket")
+    selected = [bucket, sqlalchemy.func.count()]
+    for y in ys:
+        selected += [sqlalchemy.func.min(table.c[y]),
+                     sqlalchemy.func.max(table.c[y]),
+                     sqlalchemy.func.sum(table.c[y]),
+                     sqlalchemy.func.count(table.c[y])]
+    query = sqlalchemy.select(selected).where(sqlalchemy.and_(
+        x_num >= low, x_num <= high, *where)).group_by(bucket)\
+        .order_by(bucket)
+    # bucket number : [count, (min, max, sum, count) per y]
+    merged = {}
+    for row in conn.execute(query):
+        # x == high falls into bucket number 'buckets'
+        number = min(int(row[0]), buckets - 1)
+        if number not in merged:
+            merged[number] = list(row[1:])
+            continue
+        aggs = merged[number]
+        for pos, value in enumerate(row[1:]):
+            if value is None:
+                continue
+            if aggs[pos] is None:
+                aggs[pos] = value
+            elif pos and pos % 4 == 1:
+                aggs[pos] = min(aggs[pos], value)
+            elif pos and pos % 4 == 2:
+                aggs[pos] = max(aggs[pos], value)
+            else:
+                aggs[pos] += value
+    for number in sorted(merged):
+        aggs = merged[number]
+        columns[x].append(from_number(low + (number + .5) * width, x_col))
+        columns["count"].append(aggs[0])
+        for pos, y in enumerate(ys):
+            base = 1 + 4 * pos
+            columns[y + "_min"].append(aggs[base])
+            columns[y + "_max"].append(aggs[base + 1])
+            columns[y + "_mean"].append(aggs[base + 2] / aggs[base + 3]
+                                        if aggs[base + 3] else None)
+    return columns
+
+
+def lttb(points, count, threshold):
+    """Largest-Triangle-Three-Buckets downsampling of an iterator of (x, y)
+    tuples ordered by x. Yields at most threshold points, the first and the
+    last point are always kept. Only two buckets are held in memory.
+
+    Args:
+        - points (iterator) : (x, y) with numeric x and y
+        - count (int) : number of points of the iterator
+        - threshold (int) : number of returned points
+    """
+    if threshold >= count or threshold < 3:
+        for point in points:
+            yield point
+        return
+    points = iter(points)
+    every = (count - 2) / (threshold - 2)
+
+    def take(start, end):
+        return list(itertools.islice(points, end - start))
+
+    def bounds(number):
+        return (int(math.floor(number * every)) + 1,
+                min(int(math.floor((number + 1) * every)) + 1, count - 1))
+
+    selected = next(points)
+    yield selected
+    current = take(*bounds(0))
+    for number in range(threshold - 2):
+        if number < threshold - 3:
+            following = take(*bounds(number + 1))
+        else:
+            following = take(0, 1)
+        avg_x = sum(point[0] for point in following) / len(following)
+        avg_y = sum(point[1] for point in following) / len(following)
+        selected = _largest_triangle(selected, current, avg_x, avg_y)
+        yield selected
+        current = following
+    for point in current:
+        yield point
+
+
+def _largest_triangle(first, bucket, avg_x, avg_y):
+    """Returns the point of bucket that spans the largest triangle with first
+    and (avg_x, avg_y)."""
+    area = -1.
+    for point in bucket:
+        point_area = abs((first[0] - avg_x) * (point[1] - first[1])
+                         - (first[0] - point[0]) * (avg_y - first[1]))
+        if point_area > area:
+            area = point_area
+            best = point
+    return best
+
+
+def stream_lttb(conn, table, x, y, threshold, where=()): #pylint: disable=R0913
+    """Downsamples a curve with lttb while its rows are fetched. The
+    numeric x of DateTime columns is only used for the triangle areas, the
+    stored x values of the selected points are returned.
+
+    Returns:
+        dict{x : [...], y : [...]}
+    """
+    x_col = table.c[x]
+    y_col = table.c[y]
+    x_num = numeric(x_col, conn.dialect)
+    selected = [x_num, y_col]
+    if x_num is not x_col:
+        selected.append(x_col)
+    where = sqlalchemy.and_(y_col.isnot(None), x_col.isnot(None), *where)
+    count = conn.execute(sqlalchemy.select([sqlalchemy.func.count()])
+                         .select_from(table).where(where)).scalar()
+    result = conn.execution_options(stream_results=True).execute(
+        sqlalchemy.select(selected).where(where).order_by(x_col))
+    # the tuples of the DBAPI cursor are used directly instead of result
+    # rows, the raw x values of the selected points are converted like
+    # result rows would (e.g. SQLite DateTime strings)
+    rows = itertools.chain.from_iterable(
+        iter(lambda: result.cursor.fetchmany(FETCH_SIZE), []))
+    # position of the stored x values in the rows
+    raw = 0
+    processor = None
+    if x_num is not x_col:
+        raw = 2
+        processor = x_col.type.dialect_impl(conn.dialect)\
+            .result_processor(conn.dialect, None)
+    columns = {x: [], y: []}
+    for point in lttb(rows, count, threshold):
+        columns[x].append(processor(point[raw]) if processor
+                          else point[raw])
+        columns[y].append(point[1])
+    result.close()
+    return columns
+
+
+def _present(value):
+    return value is not None and not (isinstance(value, float)
+                                      and math.isnan(value))
+
+
+def _values(columns, key, length):
+    """Returns a column of columns as list, None for missing columns."""
+    if key not in columns:
+        return [None] * length
+    column = columns[key]
+    return column.tolist() if hasattr(column, "tolist") else list(column)
+
+
+def aggregate_columns(columns, x, ys, buckets=1000, x_range=None): #pylint: disable=R0914
+    """Like bucket_aggregate for a curve in memory, e.g. an unpacked curve
+    of a packed table.
+
+    Args:
+        - columns (dict) : dict{key : list or numpy array}
+        - x (str) : key that is binned
+        - ys (list) : aggregated keys
+        - buckets (int) : number of buckets
+        - x_range (tuple) : (low, high), default is min/max of x
+    """
+    length = len(next(iter(columns.values()))) if columns else 0
+    x_values = _values(columns, x, length)
+    y_values = [_values(columns, y, length) for y in ys]
+    result = {x: [], "count": []}
+    for y in ys:
+        for agg in ["min", "max", "mean"]:
+            result["{}_{}".format(y, agg)] = []
+    points = [pos for pos, value in enumerate(x_values) if _present(value)]
+    if not points:
+        return result
+    is_time = isinstance(x_values[points[0]], datetime.datetime)
+    numbers = {pos: to_number(x_values[pos]) for pos in points}
+    if x_range is None:
+        low, high = min(numbers.values()), max(numbers.values())
+    else:
+        low, high = (to_number(value) for value in x_range)
+    low, high = float(low), float(high)
+    width = (high - low) / buckets or 1.
+    # bucket number : [count, [present y values] per y]
+    merged = {}
+    for pos in points:
+        if not low <= numbers[pos] <= high:
+            continue
+        number = min(int((numbers[pos] - low) / width), buckets - 1)
+        aggs = merged.setdefault(number, [0] + [[] for _ in ys])
+        aggs[0] += 1
+        for index, values in enumerate(y_values):
+            if _present(values[pos]):
+                aggs[index + 1].append(values[pos])
+    for number in sorted(merged):
+        aggs = merged[number]
+        center = low + (number + .5) * width
+        result[x].append(EPOCH + datetime.timedelta(seconds=center)
+                         if is_time else center)
+        result["count"].append(aggs[0])
+        for index, y in enumerate(ys):
+            values = aggs[index + 1]
+            result[y + "_min"].append(min(values) if values else None)
+            result[y + "_max"].append(max(values) if values else None)
+            result[y + "_mean"].append(sum(values) / len(values)
+                                       if values else None)
+    return result
+
+
+def lttb_columns(columns, x, y, threshold):
+    """Like stream_lttb for a curve in memory, the points are ordered by
+    x first.
+
+    Returns:
+        dict{x : [...], y : [...]}
+    """
+    length = len(next(iter(columns.values()))) if columns else 0
+    points = sorted(
+        ((to_number(x_value), y_value, x_value) for x_value, y_value
+         in zip(_values(columns, x, length), _values(columns, y, length))
+         if _present(x_value) and _present(y_value)),
+        key=lambda point: point[0])
+    result = {x: [], y: []}
+    for point in lttb(iter(points), len(points), threshold):
+        result[x].append(point[2])
+        result[y].append(point[1])
+    return result
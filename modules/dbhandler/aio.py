@@ -0,0 +1,206 @@
+"""asyncio API of the DBHandler.
+
+The DBHandler works on one SQLAlchemy session and blocks its caller, so
+asyncio services (e.g. web backends) would stall their event loop. The
+AsyncDBHandler runs the methods of a DBHandler in a thread pool instead:
+
+    - every worker thread has its own copy of the handler with its own
+      session, the number of workers limits the DB connections. The
+      session is closed after every call, returned ORM objects (e.g. of
+      search_table) are detached
+    - upload_data, search_table, search_rows, get_values and get_columns
+      are coroutines with the arguments and results of the DBHandler
+      methods (search_table returns a list instead of a query)
+    - iterate streams large result sets chunk by chunk as Columns, a
+      thread of its own fetches the next chunks while the caller processes
+      the last one (bounded by prefetch). It holds its own connection, so
+      the workers stay free for the calls made inside the iteration
+
+SQLAlchemy 1.3 has no async engine (and no aiosqlite/aiomysql dialects), the
+thread pool gives the same concurrency for the blocking drivers:
+
+    async with AsyncDBHandler("model.yml", max_connections=4) as adb:
+        await asyncio.gather(*[adb.upload_data(container)
+                               for container in containers])
+        async for chunk in adb.iterate("db_probe_data", probeid=12):
+            ...
+
+SQLite allows one writer at a time, so uploads to SQLite are serialized
+(reads stay concurrent). An in-memory SQLite DB has a single connection and
+gets a single worker.
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import threading
+
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker
+
+try:
+    from .dbhandler import DBHandler
+except (ModuleNotFoundError, ImportError):
+    from dbhandler import DBHandler
+
+
+class AsyncDBHandler():
+    """Coroutines of the DBHandler methods, executed by a pool of worker
+    threads with one session each.
+
+    Args:
+        - handler (DBHandler or str) : handler or its model file/'default'
+        - max_connections (int) : number of worker threads and sessions
+    """
+    def __init__(self, handler, max_connections=4):
+        if not isinstance(handler, DBHandler):
+            handler = DBHandler(handler)
+        self.handler = handler
+        engine = handler.engine
+        if isinstance(engine.pool, sqlalchemy.pool.StaticPool):
+            max_connections = 1
+        self.max_connections = max(int(max_connections), 1)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_connections,
+            thread_name_prefix="DBHandler.aio")
+        self._session = sessionmaker(bind=engine)
+        self._local = threading.local()
+        # shared with the endpoints of the handler (see request_scope)
+        self._write_lock = handler.write_lock
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Waits for the running calls and stops the workers."""
+        self._executor.shutdown(wait=True)
+
+    def _worker(self):
+        """Returns the handler copy of the calling worker thread."""
+        handler = getattr(self._local, "handler", None)
+        if handler is None:
+            handler = self.handler.session_copy(self._session())
+            self._local.handler = handler
+        return handler
+
+    def _call(self, name, *args, **kwargs):
+        return self._apply(lambda handler: getattr(handler, name)(*args,
+                                                                  **kwargs))
+
+    def _apply(self, func):
+        """Calls func with the handler copy of the worker."""
+        handler = self._worker()
+        try:
+            return func(handler)
+        finally:
+            # the connection goes back to the pool from its own thread
+            # (SQLite connections must not change threads)
+            handler.session.close()
+
+    def _write(self, name, *args, **kwargs):
+        if self._write_lock is None:
+            return self._call(name, *args, **kwargs)
+        with self._write_lock:
+            return self._call(name, *args, **kwargs)
+
+    async def run(self, name, *args, **kwargs):
+        """Runs the DBHandler method name in a worker and returns its
+        result, e.g. await adb.run("get_dict", "db_probe")."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self._call, name, *args,
+                                              **kwargs))
+
+    async def upload_data(self, data, option="upload only"):
+        """See DBHandler.upload_data."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self._write, "upload_data",
+                                              data, option))
+
+    async def search_table(self, table, **kwargs):
+        """See DBHandler.search_table, returns the found items as list."""
+        def search(handler):
+            data = handler.search_table(table, **kwargs)
+            return None if data is None else list(data)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(self._apply, search))
+
+    async def search_rows(self, table, **kwargs):
+        """See DBHandler.search_rows."""
+        return await self.run("search_rows", table, **kwargs)
+
+    async def get_values(self, table, key, key_args=None):
+        """See DBHandler.get_values."""
+        return await self.run("get_values", table, key, key_args)
+
+    async def get_columns(self, table, value, keys=None, key=None):
+        """See DBHandler.get_columns."""
+        return await self.run("get_columns", table, value, keys, key)
+
+    async def iterate(self, table, chunk_size=10000, keys=None, prefetch=2, #pylint: disable=R0913
+                      **filters):
+        """Yields the rows of table (filtered like DBHandler.iter_columns)
+        as Columns of up to chunk_size rows, ordered by primary key. The
+        result set is streamed by a thread outside the worker pool, which
+        holds one more connection until the iteration ends.
+
+        Args:
+            - table (str) : name of DB table
+            - chunk_size (int) : rows per chunk
+            - keys (list) : selected columns, default are all
+            - prefetch (int) : chunks fetched ahead of the caller
+            - **filters : e.g. probeid=12
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(maxsize=max(int(prefetch), 1))
+        stop = threading.Event()
+        # a worker would be blocked by the producer for the whole iteration
+        # and calls awaited inside it could wait for that worker forever
+        thread = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="DBHandler.aio.iterate")
+        producer = loop.run_in_executor(
+            thread, self._produce, loop, chunks, stop, table, chunk_size,
+            keys, filters)
+        thread.shutdown(wait=False)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            stop.set()
+            # unblock the producer, it puts at most one more chunk
+            while not chunks.empty():
+                chunks.get_nowait()
+            with contextlib.suppress(Exception):
+                await producer
+
+    def _produce(self, loop, chunks, stop, table, chunk_size, keys, filters): #pylint: disable=R0913
+        """Fetches the chunks of iterate in its own thread and session."""
+        def put(item):
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        handler = self.handler.session_copy(self._session())
+        try:
+            with contextlib.closing(handler.iter_columns(
+                    table, chunk_size, keys, **filters)) as columns:
+                for chunk in columns:
+                    if stop.is_set():
+                        break
+                    put(chunk)
+        except Exception as err: #pylint: disable=W0703
+            if not stop.is_set():
+                put(err)
+            return
+        finally:
+            handler.session.close()
+        if not stop.is_set():
+            put(None)
@@ -0,0 +1,347 @@
+"""Parallel bulk import of data containers.
+
+upload_data handles one container at a time: untangling and type conversion
+run on one core while the DB waits, and every row is its own commit. The
+BulkImporter splits the pipeline:
+
+    - preprocessing (reading JSON files, sort_container and
+      convert_data_types) only depends on the model, so it runs in a
+      process pool
+    - a small number of writer threads, each with its own connection, store
+      the preprocessed containers. A container is one transaction, the rows
+      of 'always' tables are inserted with one executemany per table
+    - the tables of a container are written in model order, so parents are
+      written before their children. Cross-references to a parent of the
+      same container use its inserted primary key, nested tables use the
+      generated IDs of their parent rows (see NestedLoader), the others
+      are resolved within the container's transaction like DBTable.get_cr
+
+Run from the command line with
+
+    python -m DBHandler.modules.dbhandler.bulk model.yml archive/ \
+        --processes 8 --writers 2
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import sqlalchemy
+
+try:
+    from .dbhandler import HEADER, Columns, sort_container, \
+        convert_data_types, columns_insert
+    from .nested import NestedLoader
+    from .summary import upsert_summary
+except (ModuleNotFoundError, ImportError):
+    from dbhandler import HEADER, Columns, sort_container, \
+        convert_data_types, columns_insert
+    from nested import NestedLoader
+    from summary import upsert_summary
+
+# model of the worker processes, set by _init_worker
+_MODEL = {}
+
+
+def iter_sources(paths):
+    """Yields the JSON files of a list of files and directories (sorted,
+    not recursive)."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(".json"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def preprocess_container(container, table_ass, meas_tk, type_info):
+    """Untangles and type converts a data container (see
+    DBHandler.untangle_data and DBHandler.check_data_types).
+
+    Args:
+        - container (dict or str) : data container or path of a JSON file
+        - table_ass (dict) : 'table assignment' of the model
+        - meas_tk (str) : 'measurement type key' of the model
+        - type_info (dict) : dict{table name : [(key, python type), ...]}
+    """
+    if isinstance(container, str):
+        with open(container, "r") as json_file:
+            container = json.load(json_file)
+    meas_type = container[HEADER].pop(meas_tk)
+    meas_data = sort_container(container, table_ass[meas_type])
+    return convert_data_types(meas_data, type_info)
+
+
+def _init_worker(table_ass, meas_tk, type_info):
+    _MODEL.update(table_ass=table_ass, meas_tk=meas_tk, type_info=type_info)
+
+
+def _preprocess(item):
+    index, source = item
+    start = time.perf_counter()
+    try:
+        meas_data = preprocess_container(source, **_MODEL)
+    except Exception as err: #pylint: disable=W0703
+        return index, source, None, "{}: {}".format(type(err).__name__, err), \
+            time.perf_counter() - start
+    return index, source, meas_data, None, time.perf_counter() - start
+
+
+class BulkImporter(): #pylint: disable=R0902
+    """Imports many data containers with a process pool for preprocessing
+    and writer threads for bulk inserts.
+
+    Args:
+        - handler (DBHandler) : provides model, engine and metrics
+        - processes (int) : size of the process pool, default is the number
+                            of CPUs, 0 preprocesses in the calling process
+        - writers (int) : number of DB connections that write, always 1
+                          for SQLite
+        - chunksize (int) : containers per task of the process pool
+        - queue_size (int) : preprocessed containers waiting for a writer
+    """
+    def __init__(self, handler, processes=None, writers=2, #pylint: disable=R0913
+                 chunksize=4, queue_size=64):
+        self.log = logging.getLogger("DBHandler.BulkImporter")
+        self.handler = handler
+        self.dbt = handler.dbt
+        self.engine = handler.engine
+        self.processes = os.cpu_count() if processes is None else processes
+        if self.engine.dialect.name == "sqlite":
+            writers = 1
+        self.writers = max(int(writers), 1)
+        self.chunksize = chunksize
+        self.queue_size = queue_size
+        self.type_info = {table: handler.get_table_info(table)
+                          for table in self.dbt.all_names()}
+        self._order = {table: index
+                       for index, table in enumerate(self.dbt.all_names())}
+        self._ref_cache = {}
+        self._loader = NestedLoader(self.engine, self.dbt,
+                                    local_infile=handler.local_infile)
+        self._lock = threading.Lock()
+        self._report = None
+
+    def run(self, sources):
+        """Imports all containers of sources (dicts or paths of JSON files)
+        and returns a report dict with throughput and failed containers."""
+        self._report = {"containers": 0, "rows": 0, "failed": [],
+                        "preprocess_seconds": 0., "write_seconds": 0.,
+                        "processes": self.processes, "writers": self.writers}
+        start = time.perf_counter()
+        pending = queue.Queue(maxsize=self.queue_size)
+        threads = [threading.Thread(target=self._write_loop, args=(pending,),
+                                    name="DBHandler.bulk.{}".format(number))
+                   for number in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for index, source, meas_data, error, seconds in \
+                    self._preprocessed(enumerate(sources)):
+                self._report["preprocess_seconds"] += seconds
+                if error is not None:
+                    self._failed(index, source, error)
+                else:
+                    pending.put((index, source, meas_data))
+        finally:
+            for _ in threads:
+                pending.put(None)
+            for thread in threads:
+                thread.join()
+        report = self._report
+        report["seconds"] = time.perf_counter() - start
+        report["containers_per_second"] = \
+            report["containers"] / report["seconds"]
+        report["rows_per_second"] = report["rows"] / report["seconds"]
+        self.log.info("Imported %s containers (%s rows, %s failed) in "
+                      "%.2f s: %.1f containers/s, %.0f rows/s",
+                      report["containers"], report["rows"],
+                      len(report["failed"]), report["seconds"],
+                      report["containers_per_second"],
+                      report["rows_per_second"])
+        return report
+
+    def _preprocessed(self, items):
+        model = (self.handler.table_ass, self.handler.meas_tk, self.type_info)
+        if self.processes == 0:
+            _init_worker(*model)
+            for item in items:
+                yield _preprocess(item)
+            return
+        # feed the pool in windows, so that iterators of containers are not
+        # pickled all at once
+        window = self.processes * self.chunksize * 4
+        with multiprocessing.Pool(self.processes, _init_worker,
+                                  model) as pool:
+            while True:
+                batch = list(itertools.islice(items, window))
+                if not batch:
+                    break
+                for result in pool.imap_unordered(_preprocess, batch,
+                                                  self.chunksize):
+                    yield result
+
+    def _failed(self, index, source, error):
+        name = source if isinstance(source, str) else index
+        self.log.warning("Import of container %s failed: %s", name, error)
+        with self._lock:
+            self._report["failed"].append({"source": name, "error": error})
+        self.handler.metrics.inc("dbhandler_errors_total", stage="bulk_import")
+
+    def _write_loop(self, pending):
+        with self.engine.connect() as conn:
+            while True:
+                item = pending.get()
+                if item is None:
+                    break
+                index, source, meas_data = item
+                start = time.perf_counter()
+                try:
+                    with conn.begin():
+                        rows = self.write(conn, meas_data)
+                except (sqlalchemy.exc.SQLAlchemyError, ValueError,
+                        KeyError) as err:
+                    self._failed(index, source,
+                                 "{}: {}".format(type(err).__name__, err))
+                    continue
+                with self._lock:
+                    self._report["containers"] += 1
+                    self._report["rows"] += sum(rows.values())
+                    self._report["write_seconds"] += \
+                        time.perf_counter() - start
+                self.handler.metrics.inc("dbhandler_uploads_total")
+                for table, count in rows.items():
+                    self.handler._rows_written(table, count) #pylint: disable=W0212
+                for table in meas_data:
+                    if table in self.handler.summaries:
+                        self.handler._summary_written(table) #pylint: disable=W0212
+
+    def write(self, conn, meas_data):
+        """Writes one preprocessed container on conn (within a transaction)
+        and returns the number of rows per table."""
+        inserted = {}
+        rows = {}
+        nesting = self.handler.nesting
+        for table in sorted(meas_data, key=lambda name: self._order[name]):
+            option = self.dbt.opt(table)
+            if option not in ["once", "always"] \
+                    or nesting.get(table, (None,))[0] in meas_data:
+                # nested tables are written with their parent rows
+                continue
+            data = meas_data[table]
+            cross_ref = self._cross_ref(conn, table, meas_data, inserted)
+            tab = self.dbt.obj(table).__table__
+            children = [child for child in meas_data
+                        if nesting.get(child, (None,))[0] == table]
+            if children and isinstance(data, list):
+                for row in data:
+                    row.update(cross_ref)
+                groups = meas_data[children[0]]
+                self._loader.load_on(
+                    conn, table, Columns.from_rows(data), children[0],
+                    Columns.from_rows([dic for group in groups
+                                       for dic in group]),
+                    [index for index, group in enumerate(groups)
+                     for _ in group])
+                rows[table] = len(data)
+                rows[children[0]] = sum(len(group) for group in groups)
+            elif table in self.handler.packed and data:
+                if isinstance(data, Columns):
+                    data.update(cross_ref)
+                else:
+                    for row in data:
+                        row.update(cross_ref)
+                packed, row = self.handler.packed_row(table, data)
+                conn.execute(self.dbt.obj(packed).__table__.insert(), row)
+                rows[packed] = 1
+            elif isinstance(data, Columns):
+                data.update(cross_ref)
+                statement, values = columns_insert(conn.dialect, tab, data)
+                if values:
+                    conn.execute(statement, values)
+                rows[table] = len(values)
+            elif isinstance(data, dict):
+                data.update(cross_ref)
+                result = conn.execute(tab.insert(), data)
+                inserted[table] = result.inserted_primary_key[0]
+                rows[table] = 1
+            elif data:
+                for row in data:
+                    row.update(cross_ref)
+                conn.execute(tab.insert(), data)
+                rows[table] = len(data)
+            if table in self.handler.summaries:
+                summary = self.handler.summary_row(table, data)
+                if summary is not None:
+                    upsert_summary(conn, self.dbt,
+                                   self.handler.summaries[table], *summary)
+        return rows
+
+    def _cross_ref(self, conn, table, meas_data, inserted):
+        info = self.dbt.cr_dict.get(table)
+        if not info:
+            return {}
+        parent = info["table name"]
+        column = self.dbt.obj(parent).__table__.c[info["para"]]
+        if info["keyword"] not in ["None", None, ""]:
+            keywords = [info["keyword"]] if isinstance(info["keyword"], str) \
+                else list(info["keyword"])
+            search = tuple((key, meas_data[parent][key]) for key in keywords)
+            cache = self.dbt.opt(parent) == "never"
+            if cache and (table, search) in self._ref_cache:
+                return {info["para"]: self._ref_cache[(table, search)]}
+            query = sqlalchemy.select([column])
+            for key, value in search:
+                query = query.where(column.table.c[key] == value)
+            value = conn.execute(query.limit(1)).scalar()
+            if value is None:
+                raise ValueError("No {} in {} for {}".format(
+                    info["para"], parent, dict(search)))
+            if cache:
+                self._ref_cache[(table, search)] = value
+            return {info["para"]: value}
+        if parent in inserted and info["para"] == self.dbt.primkey(parent):
+            return {info["para"]: inserted[parent]}
+        last = conn.execute(sqlalchemy.select(
+            [sqlalchemy.func.max(column)])).scalar() or 0
+        if info["para option"] == "latest" and parent not in meas_data:
+            return {info["para"]: last + 1}
+        return {info["para"]: last}
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Bulk import of data "
+                                     "containers (JSON files)")
+    parser.add_argument("model", help="model file or 'default'")
+    parser.add_argument("paths", nargs="+",
+                        help="JSON files or directories of JSON files")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--chunksize", type=int, default=4)
+    parser.add_argument("--report", default=None,
+                        help="write the report to this JSON file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from DBHandler.modules.dbhandler import DBHandler
+    handler = DBHandler(args.model)
+    report = handler.bulk_upload(iter_sources(args.paths),
+                                 processes=args.processes,
+                                 writers=args.writers,
+                                 chunksize=args.chunksize)
+    if args.report:
+        with open(args.report, "w") as out:
+            json.dump(report, out, indent=1)
+    if report["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
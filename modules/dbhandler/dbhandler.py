@@ -4,16 +4,50 @@ import logging
 import os
 import datetime
 import inspect
+import contextlib
 import copy
+import itertools
+import json
+import shutil
+import tempfile
+import threading
+from functools import wraps
 from pydoc import locate
 import yaml
 import sqlalchemy
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import sessionmaker
+from flask import request, Response, stream_with_context
 try:
     from .models import meta
+    from .profiler import QueryProfiler
+    from .sync import Synchronizer
+    from .aggregate import bucket_aggregate, stream_lttb, aggregate_columns, \
+        lttb_columns
+    from .packed import packed_config, pack_columns, unpack_columns, \
+        concat_columns, as_column
+    from .summary import summary_config, summarize, upsert_summary
+    from .export import arrow_type
+    from .rows import select_rows
+    from .feed import ChangeFeed
 except (ModuleNotFoundError, ImportError):
     from models import meta
-from DBHandler.core import Module
+    from profiler import QueryProfiler
+    from sync import Synchronizer
+    from aggregate import bucket_aggregate, stream_lttb, aggregate_columns, \
+        lttb_columns
+    from packed import packed_config, pack_columns, unpack_columns, \
+        concat_columns, as_column
+    from summary import summary_config, summarize, upsert_summary
+    from export import arrow_type
+    from rows import select_rows
+    from feed import ChangeFeed
+from DBHandler.core import Module, Endpoint
+from DBHandler.utility import JSONContainerFile
+from DBHandler.utility.transport import columns_to_rows, negotiate_stream, \
+    negotiate_encoding, encode_payload, ndjson_stream, arrow_stream, \
+    gzip_stream, open_stream, read_ndjson, read_arrow, JSON, NDJSON, ARROW, \
+    ARROW_HEADER, STREAM_TYPES
 # absolute path of dbhandler module
 MODPATH = os.path.dirname(\
     os.path.abspath(inspect.getfile(inspect.currentframe())))
@@ -22,6 +56,281 @@ DEFAULT_MODEL = os.path.join("models", "default", "default.yml")
 # define header names of incomming data
 HEADER = "header"        # header name is mendatory
 DATA_HEADER = ["data"]   # at least one data_header is mendatory
+# default SQLite DB file, relative to the working directory
+SQLITE_PATH = "mySQlite.db"
+# PRAGMAs that can be set in the 'sqlite' section of the model
+SQLITE_PRAGMAS = ["journal_mode", "synchronous", "cache_size", "mmap_size",
+                  "temp_store", "busy_timeout", "foreign_keys"]
+# PRAGMAs of the offline buffer, can be overwritten in the model
+BUFFER_PRAGMAS = {"journal_mode": "WAL", "synchronous": "NORMAL",
+                  "busy_timeout": 5000}
+# buckets of the DB round trips per upload histogram
+ROUND_TRIP_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 10000, 100000)
+# maximum seconds a change feed request waits for new rows
+MAX_WAIT = 60
+
+def timed_query(func):
+    """Decorator that records the runtime of a query method in the
+    'dbhandler_query_seconds' histogram (if metrics are enabled)."""
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.timer("dbhandler_query_seconds",
+                                method=func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+def profiled_request(func):
+    """Decorator that groups the statements of a method call in the SQL
+    profiler (if enabled) to detect N+1 patterns."""
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self.profiler is None:
+            return func(self, *args, **kwargs)
+        with self.profiler.request(func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+@compiles(sqlalchemy.BigInteger, "sqlite")
+def _compile_sqlite_big_integer(type_, compiler, **kwargs): #pylint: disable=W0613
+    """SQLite only autoincrements 'INTEGER PRIMARY KEY' columns, so
+    BigInteger primary keys (e.g. sample model) are created as INTEGER,
+    which is a 64 bit type in SQLite anyway."""
+    return "INTEGER"
+
+class Profiler(Endpoint):
+    """SQL profiler endpoint."""
+
+    def get(self):
+        """Return the statement profile, '?top=N' limits the statements."""
+        if self.module.profiler is None:
+            return "SQL profiler is not enabled", 404
+        top = request.args.get('top', None, type=int)
+        return self.module.profiler.summary(top)
+
+    def delete(self):
+        """Reset the statement profile."""
+        if self.module.profiler is None:
+            return "SQL profiler is not enabled", 404
+        self.module.profiler.reset()
+        return "OK", 200
+
+class Sync(Endpoint):
+    """Offline buffer endpoint."""
+
+    def get(self):
+        """Return the sync status."""
+        if self.module.syncer is None:
+            return "Offline buffer is not enabled", 404
+        return self.module.syncer.stats
+
+    def post(self):
+        """Run a sync round now."""
+        if self.module.syncer is None:
+            return "Offline buffer is not enabled", 404
+        pushed = self.module.sync_now()
+        if pushed is None:
+            return self.module.syncer.stats["last_error"], 503
+        return pushed
+
+class Plot(Endpoint):
+    """Reduced curves for plotting."""
+
+    def get(self, table):
+        """Return columns of '?x=...&y=...' reduced to '?buckets=N' (min,
+        max, mean, count per x bucket) or '?points=N' (LTTB). Other
+        arguments filter the rows, e.g. '?probeid=12'."""
+        args = request.args.to_dict()
+        try:
+            x_key = args.pop('x')
+            y_keys = args.pop('y').split(',')
+            points = args.pop('points', None)
+            buckets = int(args.pop('buckets', 1000))
+            with self.module.request_scope() as handler:
+                if points is not None:
+                    curve = handler.downsample(table, x_key, y_keys[0],
+                                               int(points), args)
+                else:
+                    curve = handler.aggregate(table, x_key, y_keys, buckets,
+                                              args)
+        except (KeyError, ValueError, AttributeError) as err:
+            return "Invalid plot request: {}".format(err), 400
+        # x of DateTime columns are datetimes (see Changes)
+        try:
+            body, headers = encode_payload(
+                curve, negotiate_encoding(request.accept_mimetypes, curve))
+        except (TypeError, ValueError, OverflowError):
+            body, headers = encode_payload(curve)
+        return Response(body, headers=headers)
+
+def _batched(iterable, size):
+    """Yields lists of up to size items of iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+class Stream(Endpoint):
+    """Base class of endpoints that stream chunks of columns as NDJSON
+    ('?format=ndjson', default) or Arrow IPC stream ('?format=arrow' or
+    Accept header), gzip compressed if the client accepts it."""
+
+    def stream(self, table, chunks, columnar=False):
+        """Return a streamed response of chunks, the first chunk is fetched
+        before, so that invalid requests fail with 400."""
+        encoding = request.args.get('format') \
+            or negotiate_stream(request.accept_mimetypes)
+        if encoding not in STREAM_TYPES:
+            return "Unknown format '{}'".format(encoding), 400
+        try:
+            first = next(chunks, None)
+        except (KeyError, ValueError, AttributeError,
+                sqlalchemy.exc.SQLAlchemyError) as err:
+            return "Invalid request: {}".format(err), 400
+        chunks = itertools.chain([] if first is None else [first], chunks)
+        try:
+            if encoding == 'arrow':
+                body = arrow_stream(chunks, self.arrow_types(table))
+            else:
+                body = ndjson_stream(chunks, columnar)
+        except ImportError as err:
+            return str(err), 406
+        headers = {}
+        if request.accept_encodings['gzip']:
+            body = gzip_stream(body)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(stream_with_context(body),
+                        mimetype=STREAM_TYPES[encoding], headers=headers)
+
+    def arrow_types(self, table):
+        """Arrow types of the columns of a table stored in rows."""
+        if table in self.module.packed:
+            return {}
+        types = {column.name: arrow_type(column.type) for column
+                 in self.module.dbt.obj(table).__table__.columns}
+        return {name: arrow for name, arrow in types.items()
+                if arrow is not None}
+
+class Search(Stream):
+    """Streamed search of DB tables."""
+
+    def get(self, table):
+        """Stream the rows of table, the arguments filter the rows like
+        search_table (e.g. '?name=%LGAD'), except for '?keys=a,b' (selected
+        columns), '?chunk_size=N' and '?format=...'."""
+        args = request.args.to_dict()
+        args.pop('format', None)
+        keys = args.pop('keys', None)
+        try:
+            chunk_size = int(args.pop('chunk_size', 10000))
+        except ValueError as err:
+            return "Invalid request: {}".format(err), 400
+        return self.stream(table, self.module.iter_columns(
+            table, chunk_size, keys.split(',') if keys else None, **args))
+
+class ColumnFetch(Stream):
+    """Streamed columns of one key value (see get_columns)."""
+
+    def get(self, table, value):
+        """Stream the rows of table with key value as columns, one NDJSON
+        line or record batch per chunk. '?key=...' is the key column
+        (default is the key of the packed table or the cross-reference),
+        '?keys=a,b' selects columns."""
+        args = request.args
+        keys = args.get('keys')
+        try:
+            key = args.get('key') or self.module.packed.get(table, {}).get(
+                "key") or self.module.dbt.cr_dict[table]["para"]
+        except KeyError:
+            return "No key column of {}".format(table), 400
+        chunks = self.module.iter_columns(
+            table, args.get('chunk_size', 10000, type=int),
+            keys.split(',') if keys else None, **{key: value})
+        return self.stream(table, chunks, columnar=True)
+
+class Upload(Endpoint):
+    """Streamed upload of data containers."""
+
+    def post(self):
+        """Upload the container of the (chunked, gzip or zstd encoded)
+        request body in chunks of '?chunk_size=N' rows:
+            - JSON: spooled to a temporary file, see upload_file
+            - NDJSON: the container without data in the first line, one
+              data row per following line
+            - Arrow IPC stream: the container without data in the schema
+              metadata (see utility.transport), the rows in record batches
+        Other content types (e.g. msgpack) are decoded at once."""
+        chunk_size = request.args.get('chunk_size', 10000, type=int)
+        option = request.args.get('option', "upload only")
+        try:
+            stream = open_stream(request.stream,
+                                 request.headers.get('Content-Encoding'))
+            if request.mimetype == JSON:
+                with tempfile.NamedTemporaryFile(suffix=".json") as spool:
+                    shutil.copyfileobj(stream, spool, 1 << 20)
+                    spool.flush()
+                    with self.module.request_scope(write=True) as handler:
+                        success = handler.upload_file(spool.name,
+                                                      chunk_size, option)
+            else:
+                with self.module.request_scope(write=True) as handler:
+                    success = self.upload(handler, stream, chunk_size,
+                                          option)
+        except (KeyError, ValueError, TypeError, OSError) as err:
+            return "Invalid upload: {}".format(err), 400
+        except ImportError as err:
+            return str(err), 415
+        if not success:
+            return "Upload failed", 400
+        return "OK", 200
+
+    def upload(self, handler, stream, chunk_size, option):
+        """Upload the NDJSON, Arrow or other request body with handler."""
+        if request.mimetype == NDJSON:
+            lines = read_ndjson(stream)
+            container = next(lines, None) or {}
+            return handler.upload_chunks(
+                container[HEADER], _batched(lines, chunk_size), option,
+                source="request")
+        if request.mimetype == ARROW:
+            metadata, batches = read_arrow(stream)
+            return handler.upload_chunks(
+                json.loads(metadata[ARROW_HEADER])[HEADER],
+                (columns_to_rows(columns) for columns in batches),
+                option, source="request")
+        return handler.upload_data(self.payload(), option)
+
+class Changes(Endpoint):
+    """Change feed of DB tables."""
+
+    def get(self, table):
+        """Return the rows of table beyond '?cursor=N' (default is the
+        watermark, i.e. only new rows) in batches of '?limit=N' rows. With
+        '?timeout=S' the request waits up to S seconds (at most MAX_WAIT)
+        for new rows (long-poll). '?keys=a,b' selects columns, other
+        arguments filter the rows like search_table."""
+        args = request.args.to_dict()
+        keys = args.pop('keys', None)
+        try:
+            cursor = args.pop('cursor', None)
+            cursor = self.module.watermark(table) if cursor is None \
+                else int(cursor)
+            limit = int(args.pop('limit', 1000))
+            timeout = min(float(args.pop('timeout', 0)), MAX_WAIT)
+            batch = self.module.wait_for_changes(
+                table, cursor, timeout, limit,
+                keys.split(',') if keys else None, **args)
+        except (KeyError, ValueError, AttributeError,
+                sqlalchemy.exc.SQLAlchemyError) as err:
+            return "Invalid request: {}".format(err), 400
+        # JSON (default) or msgpack, rows contain dates and times
+        try:
+            body, headers = encode_payload(
+                batch, negotiate_encoding(request.accept_mimetypes, batch))
+        except (TypeError, ValueError, OverflowError):
+            body, headers = encode_payload(batch)
+        return Response(body, headers=headers)
 
 class DBHandler(Module): #pylint: disable=R0902
     """Database handling
@@ -30,17 +339,43 @@ class DBHandler(Module): #pylint: disable=R0902
         - load_cred:        loads credentials to access a mySQL DB
         - load_cfg:         loads cfg file with info about DB and its tables
         - get_dict:         returns table row
+        - search_rows:      returns lightweight read-only rows of a search
         - add_item:         adds dict to DB table
         - get_table_keys:   gets list of all DB table keys
         - get_values:       returns all values of key in DB table
         - update_all_values:changes certain value of all items in table
         - update_value:     changes a certain value of certain items
         - check_for_value:  checks if value is in DB table or not
+        - which_exist:      returns the values that are in a DB table column
+        - aggregate:        min/max/mean/count of columns in x buckets
+        - downsample:       LTTB downsampling of a curve
         - untangle_data:    untangles a data container and adjusts data so that
                             data can be added to respective table
         - upload_data:      uploads data container to DB
+        - upload_file:      uploads data container from a JSON file in chunks
+        - upload_chunks:    uploads a header and chunks of data rows
+        - store_data:       adds untangled data to its DB tables
+        - store_parent:     stores a parent row and references its key
+        - store_columns:    bulk inserts columnar data into a DB table
+        - store_rows:       inserts rows into a DB table in one transaction
+        - store_nested:     stores parent rows and their nested children
+        - store_packed:     stores the rows of a packed table as one row
+        - get_columns:      returns the rows of one key value as columns
+        - get_measurements: returns many measurements with their tables
+        - iter_columns:     streams the rows of a table in chunks of columns
+        - watermark:        returns the largest primary key of a table
+        - changes:          returns the rows beyond a cursor (change feed)
+        - wait_for_changes: waits for rows beyond a cursor (long-poll)
+        - store_summary:    updates the summary row of uploaded rows
+        - rebuild_summary:  recomputes a summary table from stored data
+        - bulk_upload:      imports many data containers in parallel
+        - export_parquet:   exports a DB table into a Parquet dataset
+        - load_nested:      high-volume insert of parent and child rows
         - get_dbt:          returns DBTable object
         - get_session:      returns the session object
+        - session_copy:     returns a copy of the handler with its own session
+        - request_scope:    session copy for one request of the server
+        - sync_now:         pushes the offline buffer to the central DB
     """
     _type = 'dbhandler'
 
@@ -59,6 +394,11 @@ class DBHandler(Module): #pylint: disable=R0902
 			          "passwd"    : "..."}
         """
         self.cfg_path = ""
+        self.profiler = None
+        self.syncer = None
+        self.local_infile = False
+        # statements sent by the calling thread, see _count_round_trip
+        self._round_trips = threading.local()
         for arg in args:
             if os.path.isfile(arg) or arg == "default":
                 self.cfg_path = arg
@@ -86,8 +426,9 @@ class DBHandler(Module): #pylint: disable=R0902
                            table_dict=db_cfg["tables"],
                            cr_dict=db_cfg["cross-reference"])
 
+        engine = None
         if db_cfg["engine"] == "sqlite":
-            engine = sqlalchemy.create_engine("sqlite:///mySQlite.db")
+            engine = create_sqlite_engine(db_cfg.get("sqlite"))
             meta.BASE.metadata.create_all(engine, checkfirst=True)
             session = sessionmaker(bind=engine)
             self.session = session() #pylint: disable=W0201
@@ -108,21 +449,55 @@ class DBHandler(Module): #pylint: disable=R0902
             else:
                 raise FileNotFoundError("Couldn't find or read credentials...")
 
+            # 'local infile' allows LOAD DATA LOCAL (see nested.py)
+            self.local_infile = bool(db_cfg.get("local infile")) #pylint: disable=W0201
             engine = sqlalchemy.create_engine(db_cfg["engine"]
                                               + "://"
                                               + cred["user"] + ":"
                                               + cred["passwd"] + "@"
                                               + cred["host"] + ":"
                                               + "3306" + "/"
-                                              + cred["database"])
+                                              + cred["database"],
+                                              connect_args={
+                                                  "allow_local_infile": True}
+                                              if self.local_infile else {})
+            if db_cfg.get("offline buffer"):
+                # uploads go to the local buffer, the synchronizer
+                # replicates them to the central DB
+                self.remote_engine = engine #pylint: disable=W0201
+                engine = create_sqlite_engine(
+                    self._buffer_options(db_cfg["offline buffer"])[0])
+                meta.BASE.metadata.create_all(engine, checkfirst=True)
             session = sessionmaker(bind=engine)
             self.session = session() #pylint: disable=W0201
         else:
             self.log.warning("Unkown engine in DB cfg...")
+        self.engine = engine #pylint: disable=W0201
+        # SQLite allows one writer at a time, an in-memory DB has a single
+        # connection for all sessions (see request_scope)
+        self.write_lock = None #pylint: disable=W0201
+        if engine is not None and engine.dialect.name == "sqlite":
+            self.write_lock = threading.Lock()
+        if engine is not None:
+            sqlalchemy.event.listen(engine, "before_cursor_execute",
+                                    self._count_round_trip)
+        self._describe_metrics()
+        profiler_cfg = self._get_option("profiler")
+        if profiler_cfg and engine is not None:
+            self.enable_profiler(**(profiler_cfg \
+                                    if isinstance(profiler_cfg, dict) else {}))
 
         self.table_ass = db_cfg["table assignment"] #pylint: disable=W0201
         self.meas_tk = db_cfg["measurement type key"] #pylint: disable=W0201
         self.cross_ref = db_cfg["cross-reference"] #pylint: disable=W0201
+        self.nesting = nested_tables(self.table_ass, #pylint: disable=W0201
+                                     self.cross_ref)
+        self.packed = packed_config( #pylint: disable=W0201
+            db_cfg.get("packed tables"), self.dbt)
+        self.summaries = summary_config( #pylint: disable=W0201
+            db_cfg.get("summary tables"), self.dbt)
+        self.feed = ChangeFeed(self.dbt, engine, #pylint: disable=W0201
+                               self.packed)
 
         if self.dbt.all_names() == []:
             self.log.warning("Import of table classes failed...")
@@ -131,6 +506,180 @@ class DBHandler(Module): #pylint: disable=R0902
             self.log.info("Connection to database established...")
             self.log.info("Imported table classes: %s",
                           ", ".join(self.dbt.all_names()))
+            if engine is not None and db_cfg.get("offline buffer") \
+                    and db_cfg["engine"] != "sqlite":
+                self._start_sync(engine, db_cfg["offline buffer"])
+
+    @staticmethod
+    def _buffer_options(buffer_cfg):
+        """Splits the 'offline buffer' section of the model into the
+        SQLite options of the buffer and the options of the synchronizer:
+
+            offline buffer:
+                path: buffer.db     # local SQLite DB
+                interval: 30        # seconds between two sync rounds
+                batch size: 5000    # rows per transaction on the server
+                refresh: 3600       # seconds between two full reads of
+                                    # the mirrored tables (e.g. db_info)
+                # optional PRAGMAs, see 'sqlite' section
+        """
+        sqlite_cfg = dict(BUFFER_PRAGMAS, path="buffer.db")
+        sqlite_cfg.update(buffer_cfg if isinstance(buffer_cfg, dict) else {})
+        sync_cfg = {"interval": sqlite_cfg.pop("interval", 30),
+                    "batch_size": sqlite_cfg.pop("batch size", 5000),
+                    "refresh": sqlite_cfg.pop("refresh", 3600)}
+        return sqlite_cfg, sync_cfg
+
+    def _start_sync(self, engine, buffer_cfg):
+        self.syncer = Synchronizer(engine, self.remote_engine, self.dbt,
+                                   **self._buffer_options(buffer_cfg)[1])
+        self.syncer.start()
+        self.log.info("Offline buffer enabled, syncing every %s s",
+                      self.syncer.interval)
+
+    def sync_now(self):
+        """Pushes the offline buffer to the central DB. Returns dict of
+        pushed rows per table or None if the central DB is not reachable.
+        """
+        if self.syncer is None:
+            return {}
+        return self.syncer.sync_once()
+
+    def interrupt(self):
+        """Stops the synchronizer after a final sync round and releases the
+        waiters of the change feed."""
+        self.feed.close()
+        if self.syncer is not None:
+            self.syncer.stop()
+
+    def _get_option(self, key, default=None):
+        """Returns option of the 'dbhandler' module config section."""
+        try:
+            value = self.config['dbhandler'].get(key, default)
+        except (KeyError, TypeError, AttributeError):
+            return default
+        return getattr(value, 'dictionary', value)
+
+    def session_copy(self, session=None):
+        """Returns a copy of the handler that works on a session of its own
+        (default is a new session of the engine). The session of the
+        handler must not be shared between threads, e.g. the request
+        threads of the server or the workers of AsyncDBHandler.
+        """
+        if session is None:
+            session = sessionmaker(bind=self.engine)()
+        handler = copy.copy(self)
+        handler.session = session
+        handler.dbt = copy.copy(self.dbt)
+        handler.dbt.set_session(session)
+        return handler
+
+    @contextlib.contextmanager
+    def request_scope(self, write=False):
+        """Yields a session copy of the handler (see session_copy) and
+        closes its session afterwards. Writes to SQLite and all calls on an
+        in-memory SQLite DB are serialized by write_lock.
+
+        Args:
+            - write (bool) : the calls within the scope write to the DB
+        """
+        lock = None
+        if self.write_lock is not None and (write or isinstance(
+                self.engine.pool, sqlalchemy.pool.StaticPool)):
+            lock = self.write_lock
+        with lock or contextlib.suppress():
+            handler = self.session_copy()
+            try:
+                yield handler
+            finally:
+                handler.session.close()
+
+    def before_fork(self):
+        """Closes the session and the pooled connections before gunicorn
+        forks a worker, so parent and worker never share a connection
+        (closing it in the worker would also close it for the parent)."""
+        if isinstance(self.engine.pool, sqlalchemy.pool.StaticPool):
+            # disposing would drop the DB
+            self.log.warning("Every worker process gets a copy of the "
+                             "in-memory SQLite DB")
+            return
+        self.session.close()
+        self.engine.dispose()
+        if getattr(self, "remote_engine", None) is not None:
+            self.remote_engine.dispose()
+
+    def after_fork(self):
+        """Gives a forked worker a session of its own and locks that were
+        not held by a thread of the parent."""
+        self.session = sessionmaker(bind=self.engine)() #pylint: disable=W0201
+        self.dbt.set_session(self.session)
+        if self.write_lock is not None:
+            self.write_lock = threading.Lock() #pylint: disable=W0201
+
+    def _add_user_endpoints(self, api):
+        self.add_endpoint(Profiler, '/profiler')
+        self.add_endpoint(Sync, '/sync')
+        self.add_endpoint(Plot, '/plot/<string:table>')
+        self.add_endpoint(Search, '/search/<string:table>')
+        self.add_endpoint(ColumnFetch, '/columns/<string:table>/<value>')
+        self.add_endpoint(Upload, '/upload')
+        self.add_endpoint(Changes, '/changes/<string:table>')
+
+    def enable_profiler(self, **kwargs):
+        """Attach a SQL statement profiler to the engine. Keyword arguments
+        are passed to QueryProfiler (slow_threshold, slow_log, n_plus_one,
+        samples). Can also be enabled by the 'profiler' entry of the module
+        config section.
+        """
+        self.disable_profiler()
+        self.profiler = QueryProfiler(**kwargs)
+        self.profiler.attach(self.engine)
+        self.log.info("SQL profiler enabled")
+        return self.profiler
+
+    def disable_profiler(self):
+        """Detach the SQL statement profiler."""
+        if self.profiler is not None:
+            self.profiler.detach()
+            self.profiler = None
+
+    def _describe_metrics(self):
+        for name, text in [
+                ("dbhandler_stage_seconds", "Runtime of upload_data stages"),
+                ("dbhandler_query_seconds", "Runtime of query methods"),
+                ("dbhandler_rows_written_total", "Rows added per table"),
+                ("dbhandler_round_trips_total", "Statements sent to the DB"),
+                ("dbhandler_upload_round_trips", "Statements per upload"),
+                ("dbhandler_uploads_total", "Received upload requests"),
+                ("dbhandler_errors_total", "Failed stages")]:
+            self.metrics.describe(name, text)
+
+    def _count_round_trip(self, *args): #pylint: disable=W0613
+        self.metrics.inc("dbhandler_round_trips_total")
+        # the statement runs in the thread of the upload that sent it,
+        # concurrent uploads don't count the statements of each other
+        self._round_trips.count = self._thread_round_trips() + 1
+
+    def _thread_round_trips(self):
+        return getattr(self._round_trips, "count", 0)
+
+    def _observe_round_trips(self, start):
+        """Records the statements of the calling thread since start as the
+        round trips of one upload."""
+        self.metrics.observe("dbhandler_upload_round_trips",
+                             self._thread_round_trips() - start,
+                             buckets=ROUND_TRIP_BUCKETS)
+
+    def _rows_written(self, table, count=1):
+        """Counts committed rows of table and wakes the waiters of the
+        change feed."""
+        self.metrics.inc("dbhandler_rows_written_total", count, table=table)
+        self.feed.notify(table)
+
+    def _summary_written(self, table):
+        """Wakes the waiters of the summary table of table, is called after
+        summary rows were committed (see store_summary)."""
+        self.feed.notify(self.summaries[table]["table"])
 
     def load_cred(self, arg):
         """Handles the import of credentials"""
@@ -185,6 +734,7 @@ class DBHandler(Module): #pylint: disable=R0902
                            "primary key. The items you plan to update can not "
                            "be identified.")
 
+    @timed_query
     def search_table(self, table, **kwargs):
         """Basic search operation: search for key-value in DB table and filter
         your data by passing keyword arguments. You can add '%' in a kwarg
@@ -218,7 +768,39 @@ class DBHandler(Module): #pylint: disable=R0902
         data = self.session.query(table).filter_by(**kwargs)
         return data
 
+    def _search_criteria(self, table, filters):
+        """Returns search_table-like keyword arguments as list of
+        expressions, values with '%' are wildcard searches (contains)."""
+        tab = self.dbt.obj(table).__table__
+        criteria = []
+        for key, value in filters.items():
+            if isinstance(value, str) and "%" in value:
+                criteria.append(tab.c[key].contains(value.replace("%", "")))
+            else:
+                criteria.append(tab.c[key] == value)
+        return criteria
+
+    @timed_query
+    def search_rows(self, table, **kwargs):
+        """Like search_table, but returns a list of lightweight read-only
+        rows (see rows.py) instead of a query of ORM instances. The rows
+        have an attribute per column and to_dict(), they are not tracked
+        by the session.
+
+        Args:
+            - table (sqlalchemy.ext.declarative class/str) : table object/name
+            - **kwargs : e.g. name="...", project="%LGAD"
+        """
+        if not isinstance(table, str):
+            table = table.__name__
+        obj = self.dbt.obj(table)
+        return select_rows(self.session.connection(), obj,
+                           self._search_criteria(table, kwargs),
+                           obj.__table__.c[self.dbt.primkey(table)])
+
 
+    @timed_query
+    @profiled_request
     def get_dict(self, table, pk_value=None):
         """Returns dict with all key:value-pairs from table. To print a
         specific row pass its primary key value. Default is all rows of table.
@@ -231,26 +813,16 @@ class DBHandler(Module): #pylint: disable=R0902
         Returns:
             Dict or None if there's no item with that pk value.
         """
-        result = []
         if isinstance(table, str):
             table = self.dbt.obj(table)
+        prim_key = getattr(table, self.dbt.primkey(table))
+        # plain rows, no ORM instances (see rows.py)
+        rows = select_rows(self.session.connection(), table,
+                           [] if pk_value is None else [prim_key == pk_value],
+                           prim_key)
         if pk_value is not None:
-            for col in self.session.query(table).\
-            filter(getattr(table, self.dbt.primkey(table)) == pk_value):
-                result = sqlalchemy.orm.attributes.instance_dict(col)
-# first element is {'_sa_instance_state':sqlalchemy.orm.state.InstanceState...}
-                result.pop('_sa_instance_state')
-                return result
-        pk_list = self.get_values(table, str(self.dbt.primkey(table)))
-        if not isinstance(pk_list, list):
-            pk_list = [pk_list]
-        for item in pk_list:
-            for col in self.session.query(table).\
-            filter(getattr(table, self.dbt.primkey(table)) == item):
-                result.append(sqlalchemy.orm.attributes.instance_dict(col))
-        for item in result:
-            item.pop('_sa_instance_state')
-        return result
+            return rows[0].to_dict() if rows else None
+        return [row.to_dict() for row in rows]
 
     def add_item(self, table, item, force_upload=True): #pylint: disable=R1710
         """Add item to DB table.
@@ -279,9 +851,11 @@ class DBHandler(Module): #pylint: disable=R0902
             if upload is True:
                 self.session.add(table(**item))
                 self.session.commit()
+                self._rows_written(table.__name__)
                 return True
 
         except Exception as err: # pylint: disable=W0703
+            self.metrics.inc("dbhandler_errors_total", stage="add_item")
             print(err)
             # if "Session.rollback()" in str(err):
             #     pass
@@ -306,6 +880,7 @@ class DBHandler(Module): #pylint: disable=R0902
         filter(getattr(table, attr) == old_value).\
         update({getattr(table, attr) : new_value})
 
+    @timed_query
     def get_table_info(self, table):
         """Retrieve a list of all keys of a DB table.
 
@@ -328,6 +903,7 @@ class DBHandler(Module): #pylint: disable=R0902
                              "into python type.")
         return table_info
 
+    @timed_query
     def get_values(self, table, key, key_args=None):
         """Returns the values of a given key for all items in a DB table.
 
@@ -353,6 +929,7 @@ class DBHandler(Module): #pylint: disable=R0902
             return values[0]
         return values
 
+    @timed_query
     def check_for_value(self, table, **kwargs):
         """Checks if key:value-pair is in DB table, e.g. sensor name (key=name,
         value="sensor name").
@@ -367,30 +944,152 @@ class DBHandler(Module): #pylint: disable=R0902
         """
         if isinstance(table, str):
             table = self.dbt.obj(table)
-        check = list(self.session.query(table).filter_by(**kwargs))
-        if check == []:
-            return False
-        return True
+        # SELECT EXISTS (...), the DB stops at the first matching row
+        return bool(self.session.query(
+            self.session.query(table).filter_by(**kwargs).exists()).scalar())
+
+    @timed_query
+    def which_exist(self, table, column, values, chunk_size=500,
+                    method="auto"):
+        """Returns the subset of values that are in a column of a DB table,
+        e.g. the known sensor names of a list of names. The values are
+        checked with chunked IN queries or, for many values, by joining a
+        temporary table that is filled with one executemany.
+
+        Args:
+            - table (sqlalchemy.ext.declarative class/str) : table object/name
+            - column (str) : name of column in table
+            - values (iterable) : checked values
+            - chunk_size (int) : values per IN query
+            - method (str) : "in", "temp" or "auto" (temporary table for
+                             more than 4 chunks)
+
+        Returns:
+            set of the present values
+        """
+        if isinstance(table, str):
+            table = self.dbt.obj(table)
+        col = table.__table__.c[column]
+        values = list({value for value in values if value is not None})
+        if method == "auto":
+            method = "temp" if len(values) > 4 * chunk_size else "in"
+        present = set()
+        if not values:
+            return present
+        conn = self.session.connection()
+        if method == "in":
+            for first in range(0, len(values), chunk_size):
+                present.update(value for value, in conn.execute(
+                    sqlalchemy.select([col]).distinct().where(col.in_(
+                        values[first:first + chunk_size]))))
+            return present
+        if method != "temp":
+            raise ValueError("Unknown method '{}'".format(method))
+        temp = sqlalchemy.Table("which_exist_values", sqlalchemy.MetaData(),
+                                sqlalchemy.Column("value", col.type),
+                                prefixes=["TEMPORARY"])
+        temp.create(conn)
+        try:
+            conn.execute(temp.insert(), [{"value": value} for value in values])
+            present.update(value for value, in conn.execute(
+                sqlalchemy.select([col]).distinct().where(col.in_(
+                    sqlalchemy.select([temp.c.value])))))
+        finally:
+            temp.drop(conn)
+        return present
+
+    def _filters(self, table, filters):
+        """Returns filter_by-like keyword arguments as list of expressions."""
+        tab = self.dbt.obj(table).__table__
+        return [tab.c[key] == value for key, value in (filters or {}).items()]
+
+    @timed_query
+    def aggregate(self, table, x, y, buckets=1000, filters=None, #pylint: disable=R0913
+                  x_range=None):
+        """Splits the x range of a table into equal buckets and returns
+        min, max, mean and count of y per bucket. The binning is done by the
+        DB (GROUP BY), e.g. for multi-day environment logs:
+
+            handler.aggregate("db_probe_data", "time", ["temperature", "RH"],
+                              buckets=500, filters={"probeid": 12})
+
+        Curves of packed tables are unpacked and binned in memory, filters
+        has to select one curve by the key of the packed table.
+
+        Args:
+            - table (str) : name of DB table
+            - x (str) : binned key, numeric or DateTime
+            - y (str or list) : aggregated keys
+            - buckets (int) : number of buckets
+            - filters (dict) : 'filter_by' keyword arguments
+            - x_range (tuple) : (low, high) of x, default is min/max
+
+        Returns:
+            Columns{x : bucket centers, 'count' : [...], '<y>_min' : [...],
+                    '<y>_max' : [...], '<y>_mean' : [...]}
+        """
+        y_keys = [y] if isinstance(y, str) else list(y)
+        if table in self.packed:
+            return Columns(aggregate_columns(
+                self._packed_curve(table, [x] + y_keys, filters), x, y_keys,
+                buckets, x_range))
+        return Columns(bucket_aggregate(
+            self.session.connection(), self.dbt.obj(table).__table__, x,
+            y_keys, buckets, self._filters(table, filters), x_range))
+
+    @timed_query
+    def downsample(self, table, x, y, points=1000, filters=None):
+        """Downsamples the curve y(x) of a table to at most points with
+        Largest-Triangle-Three-Buckets. The rows are reduced while they are
+        fetched (ordered by x), so the full curve is never held in memory.
+        Curves of packed tables are unpacked and reduced in memory, filters
+        has to select one curve by the key of the packed table.
+
+        Args:
+            - table (str) : name of DB table
+            - x (str) : key of x values, numeric or DateTime
+            - y (str) : key of y values
+            - points (int) : number of returned points
+            - filters (dict) : 'filter_by' keyword arguments
+
+        Returns:
+            Columns{x : [...], y : [...]}
+        """
+        if table in self.packed:
+            return Columns(lttb_columns(
+                self._packed_curve(table, [x, y], filters), x, y, points))
+        return Columns(stream_lttb(
+            self.session.connection(), self.dbt.obj(table).__table__, x, y,
+            points, self._filters(table, filters)))
+
+    def _packed_curve(self, table, keys, filters):
+        """Returns the columns keys of the curve of a packed table that
+        filters select by its key (see get_columns), e.g. for aggregate."""
+        key = self.packed[table]["key"]
+        if set(filters or {}) != {key}:
+            raise ValueError("The curves of packed table {} are reduced one "
+                             "at a time, filter by {}".format(table, key))
+        tab = self.dbt.obj(table).__table__
+        for name in keys:
+            if name not in tab.c:
+                raise KeyError("{} has no column {}".format(table, name))
+        return self.get_columns(table, filters[key], keys, key)
 
     def add_cross_ref(self, meas_data):
-        """Add DB table cross-references to data.
+        """Add DB table cross-references to data. Nested tables (see
+        nested_tables) reference the rows of their parent, their keys are
+        added when they are stored (see store_nested).
         """
         for table in meas_data:
+            if table in self.nesting:
+                continue
             cross_ref = self.dbt.get_cr(table, meas_data)
-            if is_nested(table, self.table_ass) is False:
-                if cross_ref != {} and isinstance(meas_data[table], dict):
-                    meas_data[table].update(cross_ref)
-                elif cross_ref != {} and isinstance(meas_data[table], list) \
-                        and meas_data[table] != []:
-                    for table_data in meas_data[table]:
-                        table_data.update(cross_ref)
-            else:
-                para = cross_ref[0]
-                gen = id_gen(cross_ref[1])
+            if cross_ref != {} and isinstance(meas_data[table], dict):
+                meas_data[table].update(cross_ref)
+            elif cross_ref != {} and isinstance(meas_data[table], list) \
+                    and meas_data[table] != []:
                 for table_data in meas_data[table]:
-                    eyedee = next(gen)
-                    for dic in table_data:
-                        dic.update({para : eyedee})
+                    table_data.update(cross_ref)
         return meas_data
 
     def untangle_data(self, meas_dict):
@@ -402,6 +1101,9 @@ class DBHandler(Module): #pylint: disable=R0902
         3) renames keys or adds default data as stated in key assignment
         4) converts falsely interpreted elements (like dates into datetime)
 
+        The data can be a list of per-point dicts or a dict of columns
+        (see Columns).
+
         Args:
             - meas_dict :
         Return:
@@ -412,59 +1114,31 @@ class DBHandler(Module): #pylint: disable=R0902
                 meas_type = val
                 break
         meas_dict[HEADER].pop(self.meas_tk)
-        self.log.debug("Recieved data container %s", meas_dict)
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("Recieved '%s' data container with %s",
+                           meas_type, {data: len(meas_dict.get(data, [])) \
+                                       for data in DATA_HEADER})
         try:
-            new_meas_dict = sort_keys_by_tables(meas_dict,
-                                                self.table_ass[meas_type])
+            new_meas_dict = sort_container(meas_dict,
+                                           self.table_ass[meas_type])
         except Exception as err_msg:#pylint: disable=W0703
             self.log.warning("Untangling and sorting data was not succesfull")
             self.log.warning(err_msg)
             new_meas_dict = {}
         return new_meas_dict
 
-    def check_data_types(self, meas_dict): # pylint: disable=too-many-branches
+    def check_data_types(self, meas_dict):
         """Loops through sorted data dictionary in order to check and
-        convert data types.
-        """
-        station = meas_dict.get('db_probe', dict).get('station', None)
-        if isinstance(station, str):
-            if station == "probe_left":
-                station = 1
-            elif station == "probe_right":
-                station = 2
-            meas_dict['db_probe']['station'] = station
-
-        for table, data in meas_dict.items():
-            info = self.get_table_info(table)
-            if isinstance(data, dict):
-                for db_key, db_type in info:
-                    try:
-                        meas_dict[table][db_key] = adjust_types(db_type, \
-                                            meas_dict[table][db_key])
-                    except ValueError:
-                        self.log.error("Error while converting key <%s> from "\
-                           "table <%s> to type <%s>", db_key, table, db_type)
-                        raise ValueError
-                    except TypeError:
-                        self.log.error("Error while converting key <%s> from "\
-                           "table <%s> to type <%s>", db_key, table, db_type)
-                        raise TypeError
-                    except KeyError:
-                        pass
-            if isinstance(data, list):
-                converted_lst = []
-                for dic in data:
-                    for db_key, db_type in info:
-                        try:
-                            dic[db_key] = adjust_types(db_type, dic[db_key])
-                        except ValueError:
-                            raise ValueError
-                        except KeyError:
-                            pass
-                    converted_lst.append(dic)
-                meas_dict[table] = converted_lst
-        return meas_dict
+        convert data types (see convert_data_types).
+        """
+        type_info = {table: self.get_table_info(table) for table in meas_dict}
+        try:
+            return convert_data_types(meas_dict, type_info)
+        except (ValueError, TypeError) as err:
+            self.log.error(err)
+            raise
 
+    @profiled_request
     def upload_data(self, data, option="upload only"):  # pylint: disable=R0912, R1710
         """Add measurement to DB. Sorts data, converts keys and values
         according to DB table specifications.
@@ -477,40 +1151,286 @@ class DBHandler(Module): #pylint: disable=R0902
                               "upload only" (this argument was added mainly for
                               debugging purposes)
         """
+        if isinstance(data, str) and os.path.isfile(data):
+            return self.upload_file(data, option=option)
         if not isinstance(data, dict):
             self.log.warning("Recieved data container is expected to "
                              "be of type dict.")
+            self.metrics.inc("dbhandler_errors_total", stage="upload_data")
             return False
+        round_trips = self._thread_round_trips()
+        self.metrics.inc("dbhandler_uploads_total")
         # check data and sort it by DB table
-        meas_data = self.untangle_data(data)
+        with self.metrics.timer("dbhandler_stage_seconds",
+                                stage="untangle_data"):
+            meas_data = self.untangle_data(data)
         if meas_data == {}:
             self.log.warning("Upload request rejected")
+            self.metrics.inc("dbhandler_errors_total", stage="untangle_data")
             return False
         # add missing table cross-reference key/values
-        meas_data = self.add_cross_ref(meas_data)
+        with self.metrics.timer("dbhandler_stage_seconds",
+                                stage="add_cross_ref"):
+            meas_data = self.add_cross_ref(meas_data)
         # check value types and convert it if necessary
         try:
-            meas_data = self.check_data_types(meas_data)
+            with self.metrics.timer("dbhandler_stage_seconds",
+                                    stage="check_data_types"):
+                meas_data = self.check_data_types(meas_data)
         except (TypeError, ValueError):
             self.log.warning("Can not convert data type")
+            self.metrics.inc("dbhandler_errors_total",
+                             stage="check_data_types")
             return False
-        # add data:
+        with self.metrics.timer("dbhandler_stage_seconds",
+                                stage="store_data"):
+            success = self.store_data(meas_data, option)
+        if success is False:
+            self.metrics.inc("dbhandler_errors_total", stage="store_data")
+        self._observe_round_trips(round_trips)
+        return success
+
+    @profiled_request
+    def upload_file(self, path, chunk_size=10000, option="upload only"):
+        """Add measurement from a JSON file to DB. The header is parsed
+        eagerly, the data array is streamed from the memory-mapped file (see
+        JSONContainerFile) and uploaded in chunks, so memory does not grow
+        with the file size.
+
+        Args:
+            - path (str) : JSON file {"header" : { ... }, "data" : [ ... ]}
+            - chunk_size (int) : number of data rows per chunk
+            - option (str) : see upload_data
+        """
+        with JSONContainerFile(path, stream_key=DATA_HEADER[0],
+                               required=(HEADER,)) as container:
+            if HEADER not in container.fields:
+                self.log.warning("No header found in %s", path)
+                return False
+            return self.upload_chunks(container.fields[HEADER],
+                                      container.chunks(chunk_size), option,
+                                      source=path)
+
+    def upload_chunks(self, header, chunks, option="upload only",
+                      source="stream"):
+        """Add a measurement whose data rows arrive in chunks (e.g. from a
+        file or a streamed request body) to DB. Tables with upload option
+        'once' are stored with the first chunk, the following chunks reuse
+        its cross-references. Packed tables are packed once after the last
+        chunk instead of repacking the stored row for every chunk.
+
+        Args:
+            - header (dict) : header of the data container
+            - chunks (iterable) : lists of data rows
+            - option (str) : see upload_data
+            - source (str) : name of the data source for log messages
+        """
+        round_trips = self._thread_round_trips()
+        cross_refs = None
+        rows = 0
+        deferred = {}
+        try:
+            for chunk in chunks:
+                with self.metrics.timer("dbhandler_stage_seconds",
+                                        stage="untangle_data"):
+                    meas_data = self.untangle_data({HEADER: dict(header),
+                                                    DATA_HEADER[0]: chunk})
+                if meas_data == {}:
+                    self.log.warning("Upload request rejected")
+                    self.metrics.inc("dbhandler_errors_total",
+                                     stage="untangle_data")
+                    return False
+                if cross_refs is None:
+                    self.metrics.inc("dbhandler_uploads_total")
+                    with self.metrics.timer("dbhandler_stage_seconds",
+                                            stage="add_cross_ref"):
+                        meas_data = self.add_cross_ref(meas_data)
+                else:
+                    for table in list(meas_data):
+                        if self.dbt.opt(table) == "once":
+                            meas_data.pop(table)
+                    for table, cross_ref in cross_refs.items():
+                        for table_data in meas_data.get(table, []):
+                            table_data.update(cross_ref)
+                try:
+                    with self.metrics.timer("dbhandler_stage_seconds",
+                                            stage="check_data_types"):
+                        meas_data = self.check_data_types(meas_data)
+                except (TypeError, ValueError):
+                    self.log.warning("Can not convert data type")
+                    self.metrics.inc("dbhandler_errors_total",
+                                     stage="check_data_types")
+                    return False
+                with self.metrics.timer("dbhandler_stage_seconds",
+                                        stage="store_data"):
+                    success = self.store_data(meas_data, option, deferred)
+                if success is False:
+                    self.log.warning("Upload of %s stopped after %s rows",
+                                     source, rows)
+                    self.metrics.inc("dbhandler_errors_total",
+                                     stage="store_data")
+                    return False
+                if cross_refs is None:
+                    # keys of the stored parents, see store_data
+                    cross_refs = {
+                        table: {info["para"]:
+                                    meas_data[table][0][info["para"]]}
+                        for table, info in self.dbt.cr_dict.items()
+                        if self.dbt.opt(table) == "always"
+                        and table not in self.nesting
+                        and meas_data.get(table)}
+                rows += len(chunk)
+            if cross_refs is None:
+                # no data rows, upload_data records the upload
+                return self.upload_data({HEADER: dict(header),
+                                         DATA_HEADER[0]: []}, option)
+            for table, parts in deferred.items():
+                with self.metrics.timer("dbhandler_stage_seconds",
+                                        stage="store_data"):
+                    success = self.store_data(
+                        {table: Columns(concat_columns(*parts))}, option)
+                if success is False:
+                    self.log.warning("Packing %s rows of %s from %s failed",
+                                     rows, table, source)
+                    self.metrics.inc("dbhandler_errors_total",
+                                     stage="store_data")
+                    return False
+            self.log.info("Uploaded %s rows from %s", rows, source)
+            return True
+        finally:
+            if cross_refs is not None:
+                self._observe_round_trips(round_trips)
+
+    def load_nested(self, parent, parents, child=None, children=None, #pylint: disable=R0913
+                    parent_index=None, callback=None, **kwargs):
+        """High-volume insert of parent rows and their children from columns
+        (see nested.NestedLoader), e.g. etl_tct_pulse and etl_tct_cfd_time.
+        Returns the IDs of the parents.
+
+        Args:
+            - parent (str) : name of parent table
+            - parents (Columns/dict) : parent columns, scalars are broadcast
+            - child (str) : name of child table
+            - children (Columns/dict) : child columns without foreign key
+            - parent_index (list) : index of the parent of every child
+            - callback (callable) : called with the connection after the
+                                    rows were inserted, within their
+                                    transaction
+            - kwargs : batch_size, method ('auto', 'executemany', 'infile')
+        """
+        try:
+            from .nested import NestedLoader
+        except (ModuleNotFoundError, ImportError):
+            from nested import NestedLoader
+        loader = NestedLoader(self.engine, self.dbt,
+                              local_infile=self.local_infile, **kwargs)
+        ids = loader.load(parent, Columns(parents), child,
+                          Columns(children or {}), parent_index, callback)
+        self._rows_written(parent, len(ids))
+        if child is not None and parent_index is not None:
+            self._rows_written(child, len(parent_index))
+        return ids
+
+    def bulk_upload(self, sources, **kwargs):
+        """Imports many data containers in parallel (see bulk.BulkImporter)
+        and returns a report with throughput and failed containers.
+
+        Args:
+            - sources (iterable) : data containers (dict) or paths of JSON
+                                   files, see bulk.iter_sources
+            - kwargs : processes, writers, chunksize, queue_size
+        """
+        try:
+            from .bulk import BulkImporter
+        except (ModuleNotFoundError, ImportError):
+            from bulk import BulkImporter
+        return BulkImporter(self, **kwargs).run(sources)
+
+    def export_parquet(self, table, root, partition_by=(), #pylint: disable=R0913
+                       incremental=False, **kwargs):
+        """Streams a DB table into a partitioned Parquet dataset (see
+        export.ParquetExporter) and returns a report.
+
+        Args:
+            - table (str) : name of DB table
+            - root (str) : directory of the datasets
+            - partition_by (list) : 'column' of table or 'table.column' of a
+                                    cross-referenced parent, e.g.
+                                    ['db_info.project', 'db_probe.date']
+            - incremental (bool) : only rows beyond the last export
+            - kwargs : chunk_size, compression, dictionary
+        """
+        try:
+            from .export import ParquetExporter
+        except (ModuleNotFoundError, ImportError):
+            from export import ParquetExporter
+        return ParquetExporter(self, root, **kwargs).export(
+            table, partition_by, incremental)
+
+    def store_data(self, meas_data, option="upload only", deferred=None): # pylint: disable=R1710
+        """Add sorted, cross-referenced and type checked data (see
+        upload_data) to the DB tables according to their upload option.
+
+        Args:
+            - meas_data (dict) : dict{table name : dict{...} or list[...]}
+            - option (str) : "upload only", "print only", "both"
+            - deferred (dict) : collects the rows of packed tables as
+                                dict{table : [columns, ...]} instead of
+                                storing them (see upload_chunks)
+        """
         try: #pylint: disable=R1702
             for table in meas_data:
-                if self.dbt.opt(table) == "once":
+                parent = self.nesting.get(table, (None,))[0]
+                if parent in meas_data:
+                    # stored with its parent rows
+                    continue
+                children = [child for child in meas_data
+                            if self.nesting.get(child, (None,))[0] == table]
+                # the summary is written after the rows of table, in their
+                # transaction
+                summarized = table in self.summaries \
+                    and option in ["both", "upload only"]
+                if table in self.packed and not children \
+                        and self.dbt.opt(table) == "always":
+                    if option in ["both", "upload only"] \
+                            and deferred is not None:
+                        deferred.setdefault(table, []).append(
+                            self._broadcast(meas_data[table]))
+                    elif option in ["both", "upload only"]:
+                        self.store_packed(table, meas_data[table],
+                                          summarized)
+                    elif option in ["both", "print only"]:
+                        self.log.info(meas_data[table])
+                elif self.dbt.opt(table) == "once":
                     if option in ["both", "upload only"]:
-                        self.add_item(self.dbt.obj(table), meas_data[table])
+                        self.store_parent(table, meas_data, summarized)
                     elif option in ["both", "print only"]:
                         self.log.info(meas_data[table])
                 elif self.dbt.opt(table) == "always" \
-                        and is_nested(table, self.table_ass) is False:
+                        and isinstance(meas_data[table], Columns):
+                    if option in ["both", "upload only"]:
+                        self.store_columns(table, meas_data[table],
+                                           summarized)
+                    elif option in ["both", "print only"]:
+                        self.log.info(meas_data[table])
+                elif self.dbt.opt(table) == "always" and children:
+                    self.store_nested(table, meas_data[table], children[0],
+                                      meas_data[children[0]], option,
+                                      summarized)
+                elif self.dbt.opt(table) == "always" and summarized:
+                    # all rows or none, the summary counts them
+                    self.store_rows(table, meas_data[table]
+                                    if table not in self.nesting
+                                    else [dic for lis in meas_data[table]
+                                          for dic in lis], summarized)
+                elif self.dbt.opt(table) == "always" \
+                        and table not in self.nesting:
                     for dic in meas_data[table]:
                         if option in ["both", "upload only"]:
                             self.add_item(self.dbt.obj(table), dic)
                         elif option in ["both", "print only"]:
                             self.log.info(dic)
-                elif self.dbt.opt(table) == "always" \
-                        and is_nested(table, self.table_ass) is True:
+                elif self.dbt.opt(table) == "always":
                     for lis in meas_data[table]:
                         for dic in lis:
                             if option in ["both", "upload only"]:
@@ -524,6 +1444,445 @@ class DBHandler(Module): #pylint: disable=R0902
             self.log.warning("Upload was not succesful...")
             return False
 
+    def store_parent(self, table, meas_data, summary=False):
+        """Stores the row of a table with upload option 'once' (e.g.
+        db_probe) and sets the 'latest' cross-references of the other tables
+        of meas_data to its primary key. add_cross_ref predicts them as
+        last key + 1, which is wrong if another session inserted a row in
+        between (e.g. concurrent uploads of AsyncDBHandler).
+
+        Args:
+            - table (str) : name of DB table
+            - meas_data (dict) : dict{table name : dict{...} or list[...]}
+            - summary (bool) : merge the summary of the row into the summary
+                               table of table in its transaction
+        """
+        obj = self.dbt.obj(table)
+        row = obj(**meas_data[table])
+        prim_key = self.dbt.primkey(table)
+        try:
+            self.session.add(row)
+            self.session.flush()
+            value = getattr(row, prim_key)
+            if summary:
+                self.store_summary(table, dict(meas_data[table],
+                                               **{prim_key: value}))
+            self.session.commit()
+        except sqlalchemy.exc.SQLAlchemyError:
+            self.session.rollback()
+            self.metrics.inc("dbhandler_errors_total", stage="store_parent")
+            raise
+        self._rows_written(obj.__name__)
+        if summary:
+            self._summary_written(table)
+        for child, data in meas_data.items():
+            info = self.dbt.cr_dict.get(child)
+            if child in self.nesting or not info \
+                    or info["table name"] != table \
+                    or info["para"] != prim_key \
+                    or info["para option"] != "latest" \
+                    or info["keyword"] not in ["None", None, ""]:
+                continue
+            if isinstance(data, dict):
+                data[prim_key] = value
+            else:
+                for child_row in data:
+                    child_row[prim_key] = value
+        return value
+
+    def store_nested(self, parent, rows, child, groups, #pylint: disable=R0913
+                     option="upload only", summary=False):
+        """Stores parent rows and their nested children in one transaction
+        (see load_nested): the generated IDs of the parents are read back
+        per batch and the children reference the IDs of their parent row.
+        Takes a few round trips per level instead of one per row.
+
+        Args:
+            - parent (str) : name of parent table
+            - rows (list) : parent rows
+            - child (str) : name of nested table
+            - groups (list) : one list of child dicts per parent row
+            - option (str) : "upload only", "print only", "both"
+            - summary (bool) : merge the summary of rows into the summary
+                               table of parent in their transaction
+        """
+        if option in ["both", "upload only"]:
+            parent_index = [index for index, group in enumerate(groups)
+                            for _ in group]
+            children = Columns.from_rows(
+                [dic for group in groups for dic in group])
+            ids = self.load_nested(
+                parent, Columns.from_rows(rows), child, children,
+                parent_index, callback=(lambda conn: self._upsert_summary(
+                    conn, parent, rows)) if summary else None)
+            if summary:
+                self._summary_written(parent)
+            return ids
+        if option in ["both", "print only"]:
+            self.log.info(rows)
+            self.log.info(groups)
+        return None
+
+    def packed_row(self, table, data, previous=None):
+        """Returns the name of the packed table of table (see 'packed
+        tables' in the model) and the row that holds data packed into its
+        BLOB column.
+
+        Args:
+            - table (str) : name of DB table, e.g. db_probe_data
+            - data (list or Columns) : rows of one key value, e.g. probeid
+            - previous (bytes) : packed rows of the key value that data is
+                                 appended to (e.g. a later upload_data of
+                                 the same key)
+        """
+        info = self.packed[table]
+        columns = self._broadcast(data)
+        key_value = columns.pop(info["key"])[0]
+        if previous is not None:
+            columns = Columns(concat_columns(unpack_columns(previous),
+                                             columns))
+        return info["table"], {
+            info["key"]: key_value,
+            info["column"]: pack_columns(columns, info["compression"])}
+
+    @staticmethod
+    def _broadcast(data):
+        """Returns rows or Columns as Columns without broadcast scalars."""
+        columns = data if isinstance(data, Columns) \
+            else Columns.from_rows(data)
+        length = columns.length()
+        return Columns((key, [column] * length if is_scalar(column)
+                        else column) for key, column in columns.items())
+
+    def store_packed(self, table, data, summary=False):
+        """Stores the rows of a packed table as one row (see packed_row).
+
+        Args:
+            - table (str) : name of DB table, e.g. db_probe_data
+            - data (list or Columns) : rows of one key value, e.g. probeid
+            - summary (bool) : merge the summary of data into the summary
+                               table of table in the same transaction
+        """
+        if not data or (isinstance(data, Columns) and not data.length()):
+            return 0
+        info = self.packed[table]
+        tab = self.dbt.obj(info["table"]).__table__
+        key_value = data[info["key"]] if isinstance(data, Columns) \
+            else data[0][info["key"]]
+        if not is_scalar(key_value):
+            key_value = key_value[0]
+        conn = self.session.connection()
+        try:
+            # a later upload of the same curve is appended, upload_chunks
+            # packs its chunks once
+            previous = conn.execute(
+                sqlalchemy.select([tab.c[info["column"]]])
+                .where(tab.c[info["key"]] == key_value)).scalar()
+            _, row = self.packed_row(table, data, previous)
+            if previous is None:
+                conn.execute(tab.insert(), row)
+            else:
+                conn.execute(tab.update().where(
+                    tab.c[info["key"]] == key_value), row)
+            if summary:
+                self._upsert_summary(conn, table, data)
+            self.session.commit()
+        except: #pylint: disable=W0702
+            self.session.rollback()
+            raise
+        self._rows_written(info["table"])
+        if summary:
+            self._summary_written(table)
+        return 1
+
+    def summary_row(self, table, data):
+        """Returns key value and summary row of the rows of one key value
+        of a summarized table (see 'summary tables' in the model), None
+        if there are no rows.
+
+        Args:
+            - table (str) : name of DB table, e.g. db_probe_data
+            - data (dict, list or Columns) : cross-referenced rows
+        """
+        info = self.summaries[table]
+        if isinstance(data, Columns):
+            columns = data
+        else:
+            columns = Columns.from_rows([data] if isinstance(data, dict)
+                                        else data)
+        length = columns.length()
+        if not length or info["key"] not in columns:
+            return None
+        key_value = columns[info["key"]]
+        if not is_scalar(key_value):
+            key_value = key_value[0]
+        return key_value, summarize(
+            Columns((key, [column] * length if is_scalar(column)
+                     else column) for key, column in columns.items()),
+            length, info["columns"])
+
+    def store_summary(self, table, data):
+        """Merges the summary of data into the summary table of table within
+        the session transaction, it is committed with the rows of table.
+        Call it after the rows were written (see summary.upsert_summary).
+
+        Args:
+            - table (str) : name of DB table, e.g. db_probe_data
+            - data (dict, list or Columns) : cross-referenced rows
+        """
+        self._upsert_summary(self.session.connection(), table, data)
+
+    def _upsert_summary(self, conn, table, data):
+        summary = self.summary_row(table, data)
+        if summary is not None:
+            upsert_summary(conn, self.dbt, self.summaries[table], *summary)
+
+    def rebuild_summary(self, table, batch_size=1000):
+        """Recomputes the summary rows of table from the stored data in
+        batches of keys (see summary.SummaryBuilder), returns a report."""
+        try:
+            from .summary import SummaryBuilder
+        except (ModuleNotFoundError, ImportError):
+            from summary import SummaryBuilder
+        report = SummaryBuilder(self, batch_size).rebuild(table)
+        self._summary_written(table)
+        return report
+
+    @timed_query
+    def get_columns(self, table, value, keys=None, key=None):
+        """Returns the rows of table with one key value (e.g. a curve of
+        db_probe_data by its probeid) as columns of numpy arrays. Works the
+        same for tables stored in rows and packed tables (see 'packed
+        tables' in the model).
+
+        Args:
+            - table (str) : name of DB table
+            - value : key value, e.g. probeid
+            - keys (list) : returned columns, default are all columns with
+                            values except for the primary key and key
+            - key (str) : key column, default is the key of the packed
+                          table or the cross-reference of table
+
+        Returns:
+            Columns{key : numpy array}, empty if there are no rows
+        """
+        if key is None and table in self.packed:
+            key = self.packed[table]["key"]
+        elif key is None:
+            key = self.dbt.cr_dict[table]["para"]
+        conn = self.session.connection()
+        if table in self.packed:
+            info = self.packed[table]
+            tab = self.dbt.obj(info["table"]).__table__
+            blob = conn.execute(sqlalchemy.select([tab.c[info["column"]]])
+                                .where(tab.c[key] == value)).scalar()
+            if blob is not None:
+                return Columns(unpack_columns(blob, keys))
+        # rows, also curves of packed tables with nested rows
+        tab = self.dbt.obj(table).__table__
+        prim_key = self.dbt.primkey(table)
+        names = keys or [column.name for column in tab.columns
+                         if column.name not in [prim_key, key]]
+        rows = conn.execute(sqlalchemy.select([tab.c[name] for name in names])
+                            .where(tab.c[key] == value)
+                            .order_by(tab.c[prim_key])).fetchall()
+        columns = Columns()
+        for pos, name in enumerate(names):
+            values = [row[pos] for row in rows]
+            if keys or any(val is not None for val in values):
+                columns[name] = as_column(values)
+        return columns
+
+    def iter_columns(self, table, chunk_size=10000, keys=None, **filters):
+        """Yields the rows of table as Columns of up to chunk_size rows,
+        ordered by primary key. The rows are streamed from the DB on a
+        connection of their own, so the result never is in memory at once.
+        Filters work like search_table, e.g. name="%LGAD" (contains). Packed
+        tables can only be filtered by their key.
+
+        Args:
+            - table (str) : name of DB table
+            - chunk_size (int) : rows per chunk
+            - keys (list) : selected columns, default are all
+            - **filters : e.g. probeid=12
+        """
+        if table in self.packed:
+            for columns in self._iter_packed(table, chunk_size, keys,
+                                             filters):
+                yield columns
+            return
+        tab = self.dbt.obj(table).__table__
+        selected = [tab.c[key] for key in keys] if keys \
+            else list(tab.columns)
+        query = sqlalchemy.select(selected)
+        for criterion in self._search_criteria(table, filters):
+            query = query.where(criterion)
+        query = query.order_by(tab.c[self.dbt.primkey(table)])
+        names = [column.name for column in selected]
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True)\
+                .execute(query)
+            try:
+                while True:
+                    rows = result.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield Columns(zip(names, map(list, zip(*rows))))
+            finally:
+                result.close()
+
+    def _iter_packed(self, table, chunk_size, keys, filters):
+        """Unpacked curves of a packed table in slices of chunk_size."""
+        info = self.packed[table]
+        if set(filters) - {info["key"]}:
+            raise ValueError("Packed table {} can only be filtered by {}"
+                             .format(table, info["key"]))
+        tab = self.dbt.obj(info["table"]).__table__
+        query = sqlalchemy.select([tab.c[info["key"]], tab.c[info["column"]]])
+        if filters:
+            query = query.where(tab.c[info["key"]] == filters[info["key"]])
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True)\
+                .execute(query.order_by(tab.c[self.dbt.primkey(
+                    info["table"])]))
+            try:
+                for value, blob in result:
+                    curve = unpack_columns(blob, keys)
+                    length = len(next(iter(curve.values()))) if curve else 0
+                    for first in range(0, length, chunk_size):
+                        columns = Columns(
+                            (key, column[first:first + chunk_size])
+                            for key, column in curve.items())
+                        if keys is None or info["key"] in keys:
+                            columns[info["key"]] = [value] \
+                                * min(chunk_size, length - first)
+                        yield columns
+            finally:
+                result.close()
+
+    @timed_query
+    @profiled_request
+    def get_measurements(self, keys, table=None, columnar=False,
+                         chunk_size=500):
+        """Returns complete measurements (root row, referenced parents,
+        children and their nested subdata) of many keys with one query per
+        table and chunk of keys (see measurements.py), e.g. for a sensor
+        report:
+
+            measurements = handler.get_measurements(probeids)
+            measurements[12]["db_info"]["name"]
+
+        Args:
+            - keys (list) : primary key values of the root table
+            - table (str) : root table, default is the first table with
+                            upload option 'once' (e.g. db_probe)
+            - columnar (bool) : child tables as Columns of numpy arrays
+                                instead of lists of row dicts
+            - chunk_size (int) : keys per IN query
+
+        Returns:
+            dict{key : dict{table name : row dict, rows or Columns}}
+        """
+        try:
+            from .measurements import MeasurementFetcher
+        except (ModuleNotFoundError, ImportError):
+            from measurements import MeasurementFetcher
+        if table is None:
+            table = next(name for name in self.dbt.all_names()
+                         if self.dbt.opt(name) == "once")
+        return MeasurementFetcher(self, chunk_size).fetch(
+            list(keys), table, columnar)
+
+    @timed_query
+    def watermark(self, table):
+        """Returns the largest primary key of table (0 if it is empty), the
+        cursor of a change feed client that only wants new rows."""
+        return self.feed.watermark(table)
+
+    @timed_query
+    def changes(self, table, cursor=0, limit=1000, keys=None, **filters): #pylint: disable=R0913
+        """Returns the rows of table with a primary key beyond cursor in
+        batches of up to limit rows (see feed.ChangeFeed):
+
+            batch = handler.changes("db_probe", cursor)
+            cursor = batch["cursor"]
+
+        Args:
+            - table (str) : name of DB table
+            - cursor (int) : primary key of the last row of the client
+            - limit (int) : rows per batch
+            - keys (list) : selected columns, default are all
+            - **filters : like search_table, e.g. name="%LGAD"
+
+        Returns:
+            dict{"table", "cursor", "rows" : [dict, ...], "more" : bool}
+        """
+        return self.feed.changes(table, cursor, limit, keys,
+                                 self._search_criteria(table, filters))
+
+    def wait_for_changes(self, table, cursor=0, timeout=30, limit=1000, #pylint: disable=R0913
+                         keys=None, **filters):
+        """Like changes, but waits up to timeout seconds for rows beyond
+        cursor. The waiters are woken when this process commits rows of
+        table, the DB is not polled.
+        """
+        return self.feed.wait(table, cursor, timeout, limit=limit, keys=keys,
+                              criteria=self._search_criteria(table, filters))
+
+    def store_columns(self, table, columns, summary=False):
+        """Inserts columnar data (see Columns) into a DB table with one
+        executemany. The rows are passed to the driver as tuples, no per-row
+        dicts are built.
+
+        Args:
+            - table (str) : name of DB table
+            - columns (Columns) : dict{key : column or broadcast scalar}
+            - summary (bool) : merge the summary of columns into the summary
+                               table of table in the same transaction
+        """
+        statement, rows = columns_insert(self.engine.dialect,
+                                         self.dbt.obj(table).__table__,
+                                         columns)
+        if rows:
+            try:
+                self.session.connection().execute(statement, rows)
+                if summary:
+                    self.store_summary(table, columns)
+                self.session.commit()
+            except: #pylint: disable=W0702
+                self.session.rollback()
+                raise
+            self._rows_written(table, len(rows))
+            if summary:
+                self._summary_written(table)
+        return len(rows)
+
+    def store_rows(self, table, rows, summary=False):
+        """Inserts rows (dicts with the same keys) into a DB table with one
+        executemany and commits them together, unlike add_item.
+
+        Args:
+            - table (str) : name of DB table
+            - rows (list) : dicts containing keys:values of the table
+            - summary (bool) : merge the summary of rows into the summary
+                               table of table in the same transaction
+        """
+        if not rows:
+            return 0
+        try:
+            self.session.connection().execute(
+                self.dbt.obj(table).__table__.insert(), rows)
+            if summary:
+                self.store_summary(table, rows)
+            self.session.commit()
+        except: #pylint: disable=W0702
+            self.session.rollback()
+            raise
+        self._rows_written(table, len(rows))
+        if summary:
+            self._summary_written(table)
+        return len(rows)
+
     def get_dbt(self):
         """Returns DBTable object.
         """
@@ -666,15 +2025,77 @@ class DBTable():
 #########################################################
 
 
+def create_sqlite_engine(sqlite_cfg=None):
+    """Creates a SQLite engine. The 'sqlite' section of the model defines
+    the DB file and the PRAGMAs that are applied to every new connection:
+
+        sqlite:
+            path: mySQlite.db   # ':memory:' for an in-memory DB
+            journal_mode: WAL
+            synchronous: NORMAL
+            cache_size: -64000  # negative values are KiB
+            mmap_size: 268435456
+            temp_store: MEMORY
+            busy_timeout: 5000  # ms
+
+    Args:
+        - sqlite_cfg (dict) : 'sqlite' section of the model, default file
+                              and SQLite defaults if None
+    """
+    sqlite_cfg = dict(sqlite_cfg or {})
+    path = sqlite_cfg.pop("path", SQLITE_PATH)
+    pragmas = []
+    for key, value in sqlite_cfg.items():
+        if key not in SQLITE_PRAGMAS:
+            raise ValueError("Unknown SQLite option '{}'".format(key))
+        pragmas.append("PRAGMA {0}={1}".format(key, value))
+
+    if path == ":memory:":
+        # all sessions have to share the one connection of the in-memory DB
+        engine = sqlalchemy.create_engine(
+            "sqlite://", poolclass=sqlalchemy.pool.StaticPool,
+            connect_args={"check_same_thread": False})
+    else:
+        engine = sqlalchemy.create_engine(
+            "sqlite:///" + os.path.expanduser(path))
+
+    if pragmas:
+        @sqlalchemy.event.listens_for(engine, "connect")
+        def _set_pragmas(dbapi_connection, connection_record): #pylint: disable=W0612, W0613
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+    return engine
+
 def is_nested(table, tab_ass):
-    """Returns 'True' if the data is nested list(list(dict{}...))
+    """Returns 'True' if the data is nested list(list(dict{}...)), i.e. the
+    key assignment of table contains a dict (e.g. 'ramp') in the data
+    section of a measurement type.
     """
-    for head in tab_ass.values():
-        if table in head.keys():
-            if isinstance(head[table], dict):
+    for meas in tab_ass.values():
+        for data in DATA_HEADER:
+            keys = (meas.get(data) or {}).get(table)
+            if isinstance(keys, dict) \
+                    and any(isinstance(val, dict) for val in keys.values()):
                 return True
     return False
 
+def nested_tables(tab_ass, cr_dict):
+    """Returns dict{nested table : (parent table, foreign key)} of the model.
+    Parent and foreign key are taken from the cross-reference of the nested
+    table, (None, None) if it has none.
+    """
+    nesting = {}
+    for meas in tab_ass.values():
+        for data in DATA_HEADER:
+            for table in (meas.get(data) or {}):
+                if table not in nesting and is_nested(table, {"": meas}):
+                    info = cr_dict.get(table) or {}
+                    nesting[table] = (info.get("table name"),
+                                      info.get("para"))
+    return nesting
+
 def id_gen(start):
     """Generator that yields series of integers starting at 'start'.
 
@@ -686,6 +2107,108 @@ def id_gen(start):
         yield counter + start
         counter = counter + 1
 
+class Columns(dict):
+    """Data of one DB table as dict{key : column}. Columns are lists, tuples
+    or numpy arrays of equal length, scalars (constants, cross-references)
+    are broadcast over all rows.
+    """
+    @classmethod
+    def from_rows(cls, rows):
+        """Returns the columns of a list of dicts with identical keys."""
+        if not rows:
+            return cls()
+        return cls((key, [row[key] for row in rows]) for key in rows[0])
+
+    def length(self):
+        """Returns the number of rows."""
+        lengths = {len(column) for column in self.values()
+                   if not is_scalar(column)}
+        if len(lengths) > 1:
+            raise ValueError("Columns of unequal length: {}".format(
+                {key: len(column) for key, column in self.items()
+                 if not is_scalar(column)}))
+        return lengths.pop() if lengths else 0
+
+def is_scalar(value):
+    """Returns True if value is no column (see Columns)."""
+    return isinstance(value, (str, bytes)) or not hasattr(value, "__len__")
+
+def is_columnar(meas_dict):
+    """Returns True if the data of a container is a dict of columns."""
+    return all(isinstance(meas_dict.get(data), dict) for data in DATA_HEADER)
+
+def sort_container(meas_dict, ass_dict):
+    """Sorts a data container by DB tables, see sort_keys_by_tables and
+    sort_columns_by_tables. Columnar containers with nested data are
+    converted into rows first.
+    """
+    if not is_columnar(meas_dict):
+        return sort_keys_by_tables(meas_dict, ass_dict)
+    nested = any(isinstance(data_key, dict)
+                 for data in DATA_HEADER
+                 for keys in ass_dict[data].values()
+                 for data_key in keys.values())
+    if nested:
+        for data in DATA_HEADER:
+            meas_dict[data] = columns_to_rows(meas_dict[data])
+        return sort_keys_by_tables(meas_dict, ass_dict)
+    return sort_columns_by_tables(meas_dict, ass_dict)
+
+def sort_columns_by_tables(meas_dict, ass_dict):
+    """Columnar counterpart of sort_keys_by_tables: columns are renamed to
+    their DB keys and constants are kept as scalars that are broadcast over
+    all rows (see Columns).
+
+    Args:
+        - meas_dict (dict): data container, data is dict{key : column}
+        - ass_dict (dict): sort structure given by cfg file
+    """
+    final_dict = {}
+    for table, keys in ass_dict[HEADER].items():
+        final_dict[table] = {table_key: return_data_val(meas_dict[HEADER],
+                                                        data_key)
+                             for table_key, data_key in keys.items()}
+    for data in DATA_HEADER:
+        for table, keys in ass_dict[data].items():
+            final_dict[table] = Columns(
+                (table_key, return_data_val(meas_dict[data], data_key))
+                for table_key, data_key in keys.items())
+            final_dict[table].length()
+    return final_dict
+
+def columns_insert(dialect, table, columns):
+    """Returns the INSERT statement and the list of row tuples of columnar
+    data (see Columns) for one driver-level executemany.
+
+    Args:
+        - dialect : SQLAlchemy dialect of the engine
+        - table (sqlalchemy.Table) : DB table
+        - columns (Columns) : dict{key : column or broadcast scalar}
+    """
+    length = columns.length()
+    keys = list(columns)
+    values = []
+    for key, column in columns.items():
+        # the statement bypasses SQLAlchemy, the bind processors of the
+        # column types convert the values as an ORM insert would (e.g.
+        # DateTime into the string format of SQLite)
+        process = table.c[key].type.dialect_impl(dialect)\
+            .bind_processor(dialect)
+        if is_scalar(column):
+            values.append(itertools.repeat(
+                process(column) if process else column, length))
+            continue
+        column = column.tolist() if hasattr(column, "tolist") else column
+        values.append(map(process, column) if process else column)
+    marker = {"qmark": "?", "format": "%s",
+              "pyformat": "%s"}[dialect.paramstyle]
+    preparer = dialect.identifier_preparer
+    statement = "INSERT INTO {0} ({1}) VALUES ({2})".format(
+        preparer.format_table(table),
+        ", ".join(preparer.quote(key) for key in keys),
+        ", ".join([marker] * len(keys)))
+    return statement, list(zip(*values))
+
 def sort_keys_by_tables(meas_dict, ass_dict):
     """Sorts data by DB tables. Changes key names from data container into
     key names that are expected from DB, checks for incomplete data containers
@@ -708,8 +2231,10 @@ def sort_keys_by_tables(meas_dict, ass_dict):
                 temp_dict = copy.deepcopy(ass_dict[data][table])
                 for table_key, data_key in ass_dict[data][table].items():
                     if isinstance(data_key, dict):
-                        new_meas_dict[data][table] += \
-                return_nested_data(data_dict, table_key, data_key)
+                        # one list of nested rows per data row
+                        new_meas_dict[data][table].append(
+                            return_nested_data(data_dict, table_key,
+                                               data_key))
                         temp_dict = None
                     else:
                         temp_dict[table_key] = return_data_val(data_dict,
@@ -768,6 +2293,64 @@ def string_to_datetime(string):
             return datetime_obj
     raise ValueError
 
+def convert_data_types(meas_dict, type_info):
+    """Converts the values of sorted data (see sort_keys_by_tables) into the
+    python types of their DB columns. Only depends on its arguments, so it
+    can run in worker processes (see bulk.BulkImporter).
+
+    Args:
+        - meas_dict (dict) : dict{table name : dict{...}, list[dict, ...]
+                             or Columns}
+        - type_info (dict) : dict{table name : [(key, python type), ...]},
+                             see DBHandler.get_table_info
+    """
+    station = meas_dict.get('db_probe', {}).get('station', None)
+    if isinstance(station, str):
+        if station == "probe_left":
+            station = 1
+        elif station == "probe_right":
+            station = 2
+        meas_dict['db_probe']['station'] = station
+
+    for table, data in meas_dict.items():
+        if isinstance(data, Columns):
+            for db_key, db_type in type_info.get(table, []):
+                if db_key not in data:
+                    continue
+                try:
+                    data[db_key] = convert_column(db_type, data[db_key])
+                except (ValueError, TypeError) as err:
+                    raise type(err)("Error while converting column <{}> from "
+                                    "table <{}> to type <{}>".format(
+                                        db_key, table, db_type)) from err
+            continue
+        rows = [data] if isinstance(data, dict) else data
+        if rows and isinstance(rows[0], list):
+            rows = [row for group in rows for row in group]
+        for row in rows:
+            for db_key, db_type in type_info.get(table, []):
+                if db_key not in row:
+                    continue
+                try:
+                    row[db_key] = adjust_types(db_type, row[db_key])
+                except (ValueError, TypeError) as err:
+                    raise type(err)("Error while converting key <{}> from "
+                                    "table <{}> to type <{}>".format(
+                                        db_key, table, db_type)) from err
+    return meas_dict
+
+def convert_column(db_type, column):
+    """Converts a whole column (list, tuple, numpy array) or a broadcast
+    scalar into db_type, see adjust_types.
+    """
+    if is_scalar(column):
+        return adjust_types(db_type, column)
+    if hasattr(column, "tolist"):
+        column = column.tolist()
+    if db_type in (int, float, str):
+        return list(map(db_type, column))
+    return [adjust_types(db_type, val) for val in column]
+
 def adjust_types(db_type, val):
     """Compares type of value with expected type in DB column and converts it
     if necessary.
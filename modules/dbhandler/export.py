@@ -0,0 +1,296 @@
+"""Export of DB tables into partitioned Parquet datasets.
+
+get_dict builds one dict per row and holds the whole table in memory. The
+ParquetExporter streams the rows of a table (ordered by primary key) in
+chunks, converts every chunk into an Arrow table and appends it to a
+Parquet dataset:
+
+    - the dataset is partitioned by columns of the table or of its parents
+      (e.g. 'db_info.project', 'db_probe.date', 'db_probe.paraY'). Parents
+      are joined along the cross-references of the model, DateTime
+      partition columns are partitioned by day
+    - string and enum columns (flag, operator, particletype, ...) are
+      dictionary encoded
+    - the last exported primary key of every table is kept in
+      '_export_state.json' of the dataset root, the incremental mode only
+      exports rows beyond it
+    - packed tables (see packed.py) are exported unpacked, one row per
+      point
+
+Every chunk is written to its own files, so an export that was interrupted
+can be continued in incremental mode. Run from the command line with
+
+    python -m DBHandler.modules.dbhandler.export model.yml archive/ \
+        db_probe_data --partition db_info.project db_probe.date \
+        --incremental
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import time
+import uuid
+
+import sqlalchemy
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except (ImportError, ModuleNotFoundError):
+    pa = None
+
+try:
+    from .packed import unpack_columns
+except (ModuleNotFoundError, ImportError):
+    from packed import unpack_columns
+
+STATE_FILE = "_export_state.json"
+# label of the primary key, selected last (see feed.CURSOR)
+PRIM_KEY = "export_pk_"
+
+
+def arrow_type(sql_type):
+    """Returns the Arrow type of a SQLAlchemy column type, None if it has to
+    be inferred."""
+    for sql_class, factory in [
+            (sqlalchemy.Boolean, pa.bool_),
+            (sqlalchemy.Integer, pa.int64),
+            (sqlalchemy.Float, pa.float64),
+            (sqlalchemy.Numeric, pa.float64),
+            (sqlalchemy.DateTime, lambda: pa.timestamp("us")),
+            (sqlalchemy.Date, pa.date32),
+            (sqlalchemy.String, pa.string),
+            (sqlalchemy.LargeBinary, pa.binary)]:
+        if isinstance(sql_type, sql_class):
+            return factory()
+    return None
+
+
+def _partition_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    return value
+
+
+class ParquetExporter():
+    """Streams DB tables into partitioned Parquet datasets.
+
+    Args:
+        - handler (DBHandler) : provides model, engine and packed tables
+        - root (str) : directory of the datasets, one subdirectory per table
+        - chunk_size (int) : rows per fetch and per written chunk
+        - compression (str) : Parquet compression, e.g. 'zstd', 'snappy'
+        - dictionary (list) : dictionary encoded columns, default are all
+                              string and enum columns
+    """
+    def __init__(self, handler, root, chunk_size=100000, #pylint: disable=R0913
+                 compression="zstd", dictionary=None):
+        if pa is None:
+            raise ImportError("The Parquet export needs pyarrow")
+        self.log = logging.getLogger("DBHandler.ParquetExporter")
+        self.handler = handler
+        self.dbt = handler.dbt
+        self.root = root
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.dictionary = dictionary
+
+    def export(self, table, partition_by=(), incremental=False):
+        """Exports table, returns a report with the number of rows and the
+        last exported primary key.
+
+        Args:
+            - table (str) : name of DB table
+            - partition_by (list) : 'column' of table or 'table.column' of a
+                                    cross-referenced parent
+            - incremental (bool) : only rows beyond the last export
+        """
+        start = time.perf_counter()
+        packed = self.handler.packed.get(table)
+        source = self.dbt.obj(packed["table"] if packed else table).__table__
+        prim_key = source.c[self.dbt.primkey(packed["table"] if packed
+                                             else table)]
+        joined, partitions = self._partitions(table, source, partition_by)
+        if packed:
+            selected = [prim_key, source.c[packed["key"]],
+                        source.c[packed["column"]]]
+        else:
+            # own partition columns are restored from the directory names
+            selected = [column for column in source.columns
+                        if column.name not in dict(partitions)]
+        # the primary key is read by its label, it needn't be the first
+        # column of the table
+        query = sqlalchemy.select(selected + [column for _, column
+                                              in partitions]
+                                  + [prim_key.label(PRIM_KEY)])\
+            .select_from(joined).order_by(prim_key)
+        state = self._load_state()
+        last_pk = state.get(table) if incremental else None
+        if last_pk is not None:
+            query = query.where(prim_key > last_pk)
+
+        report = {"table": table, "rows": 0, "chunks": 0,
+                  "first_pk": last_pk, "last_pk": last_pk}
+        with self.handler.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True)\
+                .execute(query)
+            while True:
+                rows = result.fetchmany(self.chunk_size if not packed
+                                        else max(self.chunk_size // 1000, 1))
+                if not rows:
+                    break
+                if packed:
+                    arrow_table = self._packed_chunk(table, packed, rows,
+                                                     partitions)
+                else:
+                    arrow_table = self._chunk(selected, rows, partitions)
+                self._write(table, arrow_table, partitions,
+                            rows[0][PRIM_KEY], rows[-1][PRIM_KEY])
+                report["rows"] += arrow_table.num_rows
+                report["chunks"] += 1
+                report["last_pk"] = rows[-1][PRIM_KEY]
+                state[table] = report["last_pk"]
+                self._save_state(state)
+        report["seconds"] = time.perf_counter() - start
+        self.log.info("Exported %s rows of %s in %.2f s", report["rows"],
+                      table, report["seconds"])
+        return report
+
+    def _partitions(self, table, source, partition_by):
+        """Returns the joined tables and a list of (label, column) of the
+        partition columns."""
+        joined = source
+        tables = {table: source}
+        partitions = []
+        for spec in partition_by or ():
+            name, _, column = spec.rpartition(".")
+            name = name or table
+            if name not in tables:
+                # follow the cross-references from table to name
+                child = table
+                while child != name:
+                    info = self.dbt.cr_dict.get(child)
+                    if not info:
+                        raise ValueError("{} is no parent of {}".format(
+                            name, table))
+                    parent = info["table name"]
+                    if parent not in tables:
+                        tables[parent] = self.dbt.obj(parent).__table__
+                        joined = joined.join(
+                            tables[parent], tables[child].c[info["para"]]
+                            == tables[parent].c[info["para"]])
+                    child = parent
+            label = column
+            if name != table and column in source.c:
+                label = "{}_{}".format(tables[name].name, column)
+            elif name == table and isinstance(source.c[column].type,
+                                              sqlalchemy.DateTime):
+                # the timestamp stays in the data
+                label = column + "_date"
+            partitions.append((label, tables[name].c[column].label(label)))
+        return joined, partitions
+
+    def _arrays(self, names, types, values):
+        """Returns an Arrow table of columns, dictionary encoded where
+        needed."""
+        arrays = []
+        for name, arrow, column in zip(names, types, values):
+            array = pa.array(column, type=arrow)
+            if self._is_dictionary(name, array.type):
+                array = array.dictionary_encode()
+            arrays.append(array)
+        return pa.Table.from_arrays(arrays, names=names)
+
+    def _is_dictionary(self, name, arrow):
+        if self.dictionary is not None:
+            return name in self.dictionary
+        return pa.types.is_string(arrow)
+
+    def _chunk(self, selected, rows, partitions):
+        names = [column.name for column in selected] \
+            + [label for label, _ in partitions]
+        types = [arrow_type(column.type) for column in selected] \
+            + [pa.string()] * len(partitions)
+        values = [list(column) for column in zip(*rows)]
+        for pos in range(len(selected), len(names)):
+            values[pos] = [None if value is None else
+                           str(_partition_value(value))
+                           for value in values[pos]]
+        return self._arrays(names, types, values)
+
+    def _packed_chunk(self, table, packed, rows, partitions):
+        """Unpacks the curves of rows into one row per point."""
+        tab = self.dbt.obj(table).__table__
+        columns = {}
+        for row in rows:
+            curve = unpack_columns(row[2])
+            length = len(next(iter(curve.values()))) if curve else 0
+            curve[packed["key"]] = [row[1]] * length
+            for pos, (label, _) in enumerate(partitions):
+                value = _partition_value(row[3 + pos])
+                curve[label] = [None if value is None else str(value)] \
+                    * length
+            for name in set(columns) | set(curve):
+                columns.setdefault(name, [])
+                column = curve.get(name, [None] * length)
+                columns[name].extend(column.tolist()
+                                     if hasattr(column, "tolist")
+                                     else column)
+        names = [name for name in tab.c.keys() if name in columns]
+        types = [arrow_type(tab.c[name].type) for name in names] \
+            + [pa.string()] * len(partitions)
+        names += [label for label, _ in partitions]
+        return self._arrays(names, types, [columns[name] for name in names])
+
+    def _write(self, table, arrow_table, partitions, first_pk, last_pk): #pylint: disable=R0913
+        # the pk range names the file, the random part keeps a re-export
+        # of the same range from replacing the files of an earlier one
+        pq.write_to_dataset(
+            arrow_table, os.path.join(self.root, table),
+            partition_cols=[label for label, _ in partitions] or None,
+            basename_template="{}-{}-{}-{}-{{i}}.parquet".format(
+                table, first_pk, last_pk, uuid.uuid4().hex[:8]),
+            existing_data_behavior="overwrite_or_ignore",
+            compression=self.compression)
+
+    def _load_state(self):
+        path = os.path.join(self.root, STATE_FILE)
+        if not os.path.isfile(path):
+            return {}
+        with open(path, "r") as state_file:
+            return json.load(state_file)
+
+    def _save_state(self, state):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, STATE_FILE)
+        with open(path + ".tmp", "w") as state_file:
+            json.dump(state, state_file, indent=1)
+        os.replace(path + ".tmp", path)
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Export of DB tables into "
+                                     "partitioned Parquet datasets")
+    parser.add_argument("model", help="model file or 'default'")
+    parser.add_argument("root", help="directory of the datasets")
+    parser.add_argument("tables", nargs="+", help="names of DB tables")
+    parser.add_argument("--partition", nargs="*", default=[],
+                        help="'column' or 'table.column' of a parent")
+    parser.add_argument("--incremental", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--compression", default="zstd")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from DBHandler.modules.dbhandler import DBHandler
+    handler = DBHandler(args.model)
+    for table in args.tables:
+        handler.export_parquet(table, args.root, args.partition,
+                               args.incremental, chunk_size=args.chunk_size,
+                               compression=args.compression)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Incremental reads of new rows (change feed).
+
+Consumers like the dashboard or downstream analysis find new measurements
+without re-querying whole tables. Every table has a watermark, its largest
+primary key: the primary keys are autoincremented, so new rows are always
+beyond the watermark of an earlier read.
+
+    - changes returns up to limit rows with a primary key beyond the
+      cursor of a client, ordered by primary key, and the cursor of the
+      next call
+    - wait blocks until there are rows beyond the cursor or the timeout
+      expires. The DBHandler notifies the feed whenever it committed rows
+      of a table (upload_data, upload_file, store_columns, load_nested,
+      bulk_upload, AsyncDBHandler) or summary rows (see summary.py), the
+      waiters of the table are woken by a condition and query the DB
+      once, they do not poll it.
+
+    cursor = handler.watermark("db_probe")
+    while True:
+        batch = handler.wait_for_changes("db_probe", cursor, timeout=30)
+        process(batch["rows"])
+        cursor = batch["cursor"]
+
+Rows written by other processes are returned as well, but they only wake
+waiters when their timeout expires. If several sessions insert into the
+same table concurrently (e.g. MySQL), a row can be committed after a row
+with a larger key: a gap in the primary keys may be a transaction in
+flight. The cursor is held before a gap until it is older than a grace
+period (a rolled back insert leaves a gap for good), the rows beyond it
+are returned afterwards. SQLite serializes its writers, its keys have no
+gaps of uncommitted rows.
+"""
+import threading
+import time
+
+import sqlalchemy
+
+# label of the primary key that is selected with the rows
+CURSOR = "feed_cursor_"
+# seconds a gap in the primary keys is treated as a transaction in flight
+GRACE = 2.
+# tracked gaps per table, the oldest are forgotten beyond
+MAX_GAPS = 10000
+
+
+class ChangeFeed():
+    """Watermarks, incremental reads and waiters of the tables of a
+    DBHandler.
+
+    Args:
+        - dbt (DBTable) : table classes and primary keys
+        - engine : engine of the DB, the reads use connections of their own
+        - packed (dict) : packed tables of the model, see packed.py
+        - max_limit (int) : upper bound of the rows per batch
+        - grace (float) : seconds the cursor is held before a gap in the
+                          primary keys, default is GRACE (0 for SQLite)
+    """
+    def __init__(self, dbt, engine, packed=None, max_limit=10000, #pylint: disable=R0913
+                 grace=None):
+        self.dbt = dbt
+        self.engine = engine
+        self.packed = packed or {}
+        self.max_limit = max_limit
+        if grace is None:
+            grace = 0 if engine is None or engine.dialect.name == "sqlite" \
+                else GRACE
+        self.grace = grace
+        self.closed = False
+        self._condition = threading.Condition()
+        # {table name : number of notifications}
+        self._generations = {}
+        # {table name : {first missing primary key : time it was seen}}
+        self._gaps = {}
+        self._gaps_lock = threading.Lock()
+        self._step = None
+
+    def _prim_key(self, table):
+        if table in self.packed:
+            raise ValueError("Packed table {} is fed by its packed table {}"
+                             .format(table, self.packed[table]["table"]))
+        obj = self.dbt.obj(table)
+        if obj is None:
+            raise KeyError("Unknown table {}".format(table))
+        return obj.__table__.c[self.dbt.primkey(table)]
+
+    def notify(self, table):
+        """Wakes the waiters of table, is called after rows of table were
+        committed."""
+        with self._condition:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            self._condition.notify_all()
+
+    def close(self):
+        """Releases all waiters, e.g. when the module is interrupted."""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def watermark(self, table):
+        """Returns the largest primary key of table, 0 if it is empty."""
+        prim_key = self._prim_key(table)
+        with self.engine.connect() as conn:
+            return conn.execute(sqlalchemy.select(
+                [sqlalchemy.func.max(prim_key)])).scalar() or 0
+
+    def changes(self, table, cursor=0, limit=1000, keys=None, criteria=()): #pylint: disable=R0913
+        """Returns the rows of table beyond cursor.
+
+        Args:
+            - table (str) : name of DB table
+            - cursor (int) : primary key of the last row the client has
+            - limit (int) : maximum number of rows, at most max_limit
+            - keys (list) : selected columns, default are all
+            - criteria (list) : SQL expressions that filter the rows
+
+        Returns:
+            dict{"table" : name, "cursor" : primary key of the last row
+                 (cursor if there are no rows), "rows" : [dict, ...],
+                 "more" : True if there are more rows beyond the cursor}
+        """
+        return self._changes(table, cursor, limit, keys, criteria)[0]
+
+    def _changes(self, table, cursor, limit, keys, criteria): #pylint: disable=R0913
+        """Returns the batch of changes and whether rows beyond a gap were
+        held back."""
+        prim_key = self._prim_key(table)
+        tab = prim_key.table
+        limit = max(1, min(int(limit), self.max_limit))
+        selected = [tab.c[key] for key in keys] if keys \
+            else list(tab.columns)
+        # labelled, a select does not repeat a selected primary key
+        query = sqlalchemy.select([prim_key.label(CURSOR)] + selected)\
+            .where(prim_key > cursor)
+        for criterion in criteria:
+            query = query.where(criterion)
+        query = query.order_by(prim_key).limit(limit + 1)
+        with self.engine.connect() as conn:
+            settled, held, beyond = self._settled(conn, table, prim_key,
+                                                  cursor)
+            if settled is not None:
+                query = query.where(prim_key <= settled)
+            rows = conn.execute(query).fetchall()
+        names = [column.name for column in selected]
+        more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = rows[-1][0] if rows else cursor
+        if settled is not None and not more:
+            # all rows up to settled were read, also those filtered out
+            next_cursor = max(next_cursor, settled)
+            more = beyond
+        return {"table": table,
+                "cursor": next_cursor,
+                "rows": [dict(zip(names, row[1:])) for row in rows],
+                "more": more}, held
+
+    def _settled(self, conn, table, prim_key, cursor):
+        """Checks the primary keys beyond cursor for gaps.
+
+        Returns:
+            tuple(primary key up to which the rows are committed (None if
+                  all are), True if rows beyond a gap younger than grace
+                  were held back, True if there are unchecked rows beyond)
+        """
+        if not self.grace:
+            return None, False, False
+        step = self._auto_increment_step(conn)
+        window = [key for key, in conn.execute(
+            sqlalchemy.select([prim_key]).where(prim_key > cursor)
+            .order_by(prim_key).limit(self.max_limit + 1))]
+        beyond = len(window) > self.max_limit
+        window = window[:self.max_limit]
+        if not window:
+            return cursor, False, False
+        now = time.monotonic()
+        # the first key of a table is unknown
+        expected = cursor + step if cursor else window[0]
+        with self._gaps_lock:
+            gaps = self._gaps.setdefault(table, {})
+            for key in window:
+                if key > expected:
+                    seen = gaps.setdefault(expected, now)
+                    if now - seen < self.grace:
+                        return expected - step, True, False
+                expected = key + step
+            if len(gaps) > MAX_GAPS:
+                for first in sorted(gaps, key=gaps.get)[:len(gaps) // 2]:
+                    del gaps[first]
+        return window[-1], False, beyond
+
+    def _auto_increment_step(self, conn):
+        """Returns the increment of generated primary keys (MySQL
+        auto_increment_increment), 1 for other DBs."""
+        if self._step is None:
+            self._step = 1
+            if conn.dialect.name == "mysql":
+                self._step = int(conn.execute(
+                    "SELECT @@auto_increment_increment").scalar() or 1)
+        return self._step
+
+    def wait(self, table, cursor=0, timeout=30, **kwargs):
+        """Like changes, but blocks up to timeout seconds until there are
+        rows of table beyond cursor. The DB is read once at the start, once
+        per notification of table and once when the timeout expires.
+
+        Args:
+            - table (str) : name of DB table
+            - cursor (int) : primary key of the last row the client has
+            - timeout (float) : seconds to wait for new rows
+            - kwargs : limit, keys, criteria, see changes
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                generation = self._generations.get(table, 0)
+            batch, held = self._changes(
+                table, cursor, kwargs.get("limit", 1000), kwargs.get("keys"),
+                kwargs.get("criteria", ()))
+            remaining = deadline - time.monotonic()
+            if batch["rows"] or remaining <= 0 or self.closed:
+                return batch
+            cursor = batch["cursor"]
+            if held:
+                # the gap is committed or skipped after the grace period
+                remaining = min(remaining, self.grace)
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self.closed or self._generations.get(
+                        table, 0) != generation, remaining)
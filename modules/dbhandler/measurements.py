@@ -0,0 +1,208 @@
+"""Retrieval of many complete measurements at once.
+
+Reading one measurement with get_dict, search_table and a db_info lookup
+takes several queries, repeated for every probe. The MeasurementFetcher
+loads the measurements of many keys of a root table (e.g. probeids of
+db_probe) with one query per table and chunk of keys, following the
+cross-references of the model:
+
+    - parents (db_info of db_probe) with IN queries on the referenced column
+    - children (db_probe_data, db_probe_summary, ...) with IN queries on
+      their cross-reference, grandchildren (db_probe_subdata) are joined
+      along the cross-references up to the root key
+    - packed tables (see packed.py) are read from their packed table and
+      unpacked, keys without a packed row (curves with nested tables) are
+      read from the rows
+
+    measurements = handler.get_measurements([12, 13, 14])
+    measurements[12]["db_info"]["name"]
+    measurements[12]["db_probe_data"][0]["datax"]
+
+Rows are dicts (built from plain rows, see rows.py), rows of grandchildren
+are nested in their parent rows under the table name. In columnar mode the
+child tables are Columns per measurement (numpy arrays like get_columns),
+grandchildren are not nested but keep their cross-reference column.
+"""
+import sqlalchemy
+
+try:
+    from .dbhandler import Columns
+    from .rows import row_query
+    from .packed import unpack_columns, as_column
+except (ModuleNotFoundError, ImportError):
+    from dbhandler import Columns
+    from rows import row_query
+    from packed import unpack_columns, as_column
+
+# label of the root key that is selected with the rows of every table
+MEASUREMENT_KEY = "measurement_key_"
+
+
+def _chunks(values, size):
+    values = list(values)
+    for first in range(0, len(values), size):
+        yield values[first:first + size]
+
+
+def _as_columns(rows, fields):
+    if not rows:
+        return Columns()
+    return Columns((name, as_column([row[name] for row in rows]))
+                   for name in fields)
+
+
+class MeasurementFetcher():
+    """Fetches measurements with chunked IN queries, one per table level.
+
+    Args:
+        - handler (DBHandler) : provides model, session and packed tables
+        - chunk_size (int) : keys per IN query
+    """
+    def __init__(self, handler, chunk_size=500):
+        self.handler = handler
+        self.dbt = handler.dbt
+        self.chunk_size = chunk_size
+        self._stores = {info["table"] for info in handler.packed.values()}
+
+    def fetch(self, keys, table, columnar=False):
+        """Returns dict{key : dict{table name : rows}} of the keys that are
+        in the root table, in the order of keys.
+
+        Args:
+            - keys (list) : primary key values of the root table
+            - table (str) : root table, e.g. db_probe
+            - columnar (bool) : child tables as Columns instead of rows
+        """
+        conn = self.handler.session.connection()
+        tab = self.dbt.obj(table).__table__
+        prim_key = tab.c[self.dbt.primkey(table)]
+        roots = dict(self._select(conn, table, prim_key, set(keys)))
+        measurements = {key: {table: roots[key]} for key in dict.fromkeys(keys)
+                        if key in roots}
+        self._parents(conn, table, measurements)
+        self._children(conn, table, measurements, columnar)
+        return measurements
+
+    def _select(self, conn, table, column, values, joined=None): #pylint: disable=R0913
+        """Yields (root key, row dict) of the rows of table whose column
+        (labelled as root key) is in values."""
+        obj = self.dbt.obj(table)
+        cls, query = row_query(obj)
+        query = query.column(column.label(MEASUREMENT_KEY))\
+            .order_by(obj.__table__.c[self.dbt.primkey(table)])
+        if joined is not None:
+            query = query.select_from(joined)
+        new = tuple.__new__
+        for chunk in _chunks(values, self.chunk_size):
+            for row in conn.execute(query.where(column.in_(chunk))):
+                row = tuple(row)
+                yield row[-1], new(cls, row[:-1]).to_dict()
+
+    def _parents(self, conn, table, measurements):
+        """Adds the referenced row of every parent table."""
+        child = table
+        visited = {table}
+        while child in self.dbt.cr_dict:
+            info = self.dbt.cr_dict[child]
+            parent = info["table name"]
+            if parent in visited or parent not in self.dbt.all_names():
+                break
+            visited.add(parent)
+            refs = {key: (measurement[child] or {}).get(info["para"])
+                    for key, measurement in measurements.items()}
+            found = dict(self._select(
+                conn, parent, self.dbt.obj(parent).__table__.c[info["para"]],
+                {ref for ref in refs.values() if ref is not None}))
+            for key, measurement in measurements.items():
+                measurement[parent] = found.get(refs[key])
+            child = parent
+
+    def _children(self, conn, table, measurements, columnar):
+        """Adds the rows of the child tables level by level."""
+        keys = list(measurements)
+        root = self.dbt.obj(table).__table__
+        prim_key = self.dbt.primkey(table)
+        fetched = {table: [(key, measurements[key][table]) for key in keys]}
+        # (table, joined tables, root key column) of the parents
+        level = [(table, None, None)]
+        while level:
+            next_level = []
+            for parent, joined, root_key in level:
+                for child, info in self.dbt.cr_dict.items():
+                    if info["table name"] != parent or child in fetched \
+                            or child in self._stores \
+                            or child not in self.dbt.all_names():
+                        continue
+                    tab = self.dbt.obj(child).__table__
+                    para = info["para"]
+                    if parent == table and para == prim_key:
+                        child_joined, child_key = None, tab.c[para]
+                    else:
+                        parent_tab = self.dbt.obj(parent).__table__
+                        child_joined = (joined if joined is not None
+                                        else parent_tab).join(
+                                            tab, tab.c[para]
+                                            == parent_tab.c[para])
+                        child_key = root_key if root_key is not None \
+                            else root.c[prim_key]
+                    if parent == table and child in self.handler.packed:
+                        rows = self._packed(conn, child, keys)
+                        # curves with nested tables (e.g. R_poly) stay in
+                        # rows, like in get_columns
+                        packed = {key for key, _ in rows}
+                        rows.extend(self._select(
+                            conn, child, child_key,
+                            [key for key in keys if key not in packed],
+                            child_joined))
+                    else:
+                        rows = list(self._select(conn, child, child_key, keys,
+                                                 child_joined))
+                    fetched[child] = rows
+                    if columnar or parent == table:
+                        self._group(measurements, child, rows, columnar)
+                    else:
+                        self._nest(fetched[parent], child, para, rows)
+                    next_level.append((child, child_joined, child_key))
+            level = next_level
+
+    def _packed(self, conn, table, keys):
+        """Rows of a packed table from its unpacked curves."""
+        info = self.handler.packed[table]
+        store = self.dbt.obj(info["table"]).__table__
+        rows = []
+        for chunk in _chunks(keys, self.chunk_size):
+            for key, blob in conn.execute(sqlalchemy.select(
+                    [store.c[info["key"]], store.c[info["column"]]])
+                                          .where(store.c[info["key"]]
+                                                 .in_(chunk))):
+                curve = unpack_columns(blob)
+                names = list(curve)
+                for values in zip(*(curve[name].tolist()
+                                    if hasattr(curve[name], "tolist")
+                                    else curve[name] for name in names)):
+                    row = dict(zip(names, values))
+                    row[info["key"]] = key
+                    rows.append((key, row))
+        return rows
+
+    @staticmethod
+    def _group(measurements, child, rows, columnar):
+        """Adds the rows of child to their measurements."""
+        grouped = {key: [] for key in measurements}
+        for key, row in rows:
+            grouped[key].append(row)
+        fields = list(rows[0][1]) if rows else []
+        for key, measurement in measurements.items():
+            measurement[child] = _as_columns(grouped[key], fields) \
+                if columnar else grouped[key]
+
+    @staticmethod
+    def _nest(parents, child, para, rows):
+        """Adds the rows of child to their parent rows."""
+        index = {}
+        for _, row in parents:
+            row[child] = []
+            index[row.get(para)] = row
+        for _, row in rows:
+            if row.get(para) in index:
+                index[row[para]][child].append(row)
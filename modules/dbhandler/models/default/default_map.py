@@ -1,7 +1,7 @@
 """Default SQLite metadata"""
 # pylint: disable=C0111, C0103, R0903, R0201, E0402
 from sqlalchemy import Boolean, Column, Integer, String, Float, DateTime
-from sqlalchemy import Date, Enum
+from sqlalchemy import Date, Enum, LargeBinary
 from ..meta import BASE
 
 class db_info(BASE):
@@ -63,6 +63,32 @@ class db_probe_data(BASE):
     time = Column(DateTime)
     bias_current = Column(Float)
 
+class db_probe_curve(BASE):
+
+    __tablename__ = "probe_curve"
+
+    curveid = Column(Integer, primary_key=True, autoincrement=True)
+    probeid = Column(Integer, unique=True)
+    # MySQL creates a LONGBLOB for this length
+    data = Column(LargeBinary(length=2**32 - 1))
+
+class db_probe_summary(BASE):
+
+    __tablename__ = "probe_summary"
+
+    summaryid = Column(Integer, primary_key=True, autoincrement=True)
+    probeid = Column(Integer, unique=True)
+    count = Column(Integer)
+    datax_min = Column(Float)
+    datax_max = Column(Float)
+    datay_min = Column(Float)
+    datay_max = Column(Float)
+    datay_mean = Column(Float)
+    temperature_min = Column(Float)
+    temperature_max = Column(Float)
+    time_first = Column(DateTime)
+    time_last = Column(DateTime)
+
 class db_probe_subdata(BASE):
 
     __tablename__ = "probe_subdata"
@@ -0,0 +1,310 @@
+"""High-volume insert path for parent/child tables.
+
+Measurements like etl_tct_pulse (one row per scope event) with several
+etl_tct_cfd_time rows per pulse produce millions of rows per run. The
+NestedLoader inserts such parent/child data from columns (see Columns):
+
+    - the parents are inserted in batches and get their primary keys from
+      the auto increment of the DB. The keys of a batch are read back with
+      one query and become the foreign keys of the children:
+        - MySQL: a batch is one multi-row INSERT, a 'simple insert' that
+          InnoDB assigns consecutive IDs (a distance of
+          auto_increment_increment apart) in every innodb_autoinc_lock_mode,
+          the first one is LAST_INSERT_ID()
+        - SQLite: the first insert holds the write lock of the DB until the
+          commit, so the rowids of a batch are consecutive and end at
+          MAX(rowid)
+        - other backends insert the parents one by one
+    - the children are loaded in batches with the fastest path of the
+      backend: executemany of row tuples (SQLite; mysqlconnector sends
+      multi-row VALUES) or 'LOAD DATA LOCAL INFILE' from a temporary CSV
+      file (MySQL, needs 'local infile : true' in the model). Parents are
+      never loaded from a file: LOAD DATA is a 'bulk insert' whose IDs can
+      interleave with other sessions with innodb_autoinc_lock_mode = 2.
+    - MySQL batches are split further so that their statements fit into
+      max_allowed_packet.
+"""
+import datetime
+import logging
+import os
+import tempfile
+
+import sqlalchemy
+
+try:
+    from .dbhandler import Columns, columns_insert, is_scalar
+except (ModuleNotFoundError, ImportError):
+    from dbhandler import Columns, columns_insert, is_scalar
+
+METHODS = ["auto", "executemany", "infile"]
+# share of max_allowed_packet (MySQL) used by one multi-row INSERT, values
+# can grow when they are escaped
+PACKET_SHARE = 0.5
+# transient errors of concurrent writers, the load is retried
+RETRY_ERRORS = ("database is locked", "Deadlock found", "Lock wait timeout")
+
+
+def split_nested(rows, nested_key, child_keys=None):
+    """Splits per-point dicts with a nested list (e.g. pulses with their
+    'cfd_infos') into parent columns, child columns and the parent index of
+    every child in one pass.
+
+    Args:
+        - rows (list) : per-point dicts, rows[i][nested_key] is a list of
+                        dicts
+        - nested_key (str) : key of the nested list
+        - child_keys (list) : keys of the children, default are the keys of
+                              the first child
+
+    Returns:
+        (Columns, Columns, list)
+    """
+    parents = Columns()
+    children = Columns()
+    parent_index = []
+    if not rows:
+        return parents, children, parent_index
+    parent_keys = [key for key in rows[0] if key != nested_key]
+    for key in parent_keys:
+        parents[key] = []
+    for index, row in enumerate(rows):
+        for key in parent_keys:
+            parents[key].append(row[key])
+        for child in row[nested_key]:
+            if child_keys is None:
+                child_keys = list(child)
+                for key in child_keys:
+                    children[key] = []
+            for key in child_keys:
+                children[key].append(child[key])
+            parent_index.append(index)
+    return parents, children, parent_index
+
+
+def _csv_value(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat(" ")
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+class NestedLoader():
+    """Loads parent rows and their children in one transaction.
+
+    Args:
+        - engine : SQLAlchemy engine
+        - dbt (DBTable) : table classes, primary keys and cross-references
+        - batch_size (int) : rows per executemany
+        - method (str) : 'executemany', 'infile' (MySQL only) or 'auto'
+                         (infile if local_infile)
+        - local_infile (bool) : the MySQL connection allows LOAD DATA LOCAL
+        - retries (int) : attempts of a load that failed on a lock
+    """
+    def __init__(self, engine, dbt, batch_size=50000, method="auto", #pylint: disable=R0913
+                 local_infile=False, retries=3):
+        if method not in METHODS:
+            raise ValueError("Unknown load method '{}'".format(method))
+        self.log = logging.getLogger("DBHandler.NestedLoader")
+        self.engine = engine
+        self.dbt = dbt
+        self.batch_size = batch_size
+        self.retries = retries
+        # MySQL server variables, read once
+        self._max_packet = None
+        self._step = None
+        if method == "auto":
+            method = "infile" if engine.dialect.name == "mysql" \
+                and local_infile else "executemany"
+        if method == "infile" and engine.dialect.name != "mysql":
+            raise ValueError("'infile' is only supported by MySQL")
+        self.method = method
+
+    def foreign_key(self, parent, child):
+        """Returns the key of child that references parent (see
+        cross-reference), default is the primary key of parent."""
+        info = self.dbt.cr_dict.get(child) or {}
+        if info.get("table name") == parent:
+            return info["para"]
+        return self.dbt.primkey(parent)
+
+    def load(self, parent, parents, child=None, children=None, #pylint: disable=R0913
+             parent_index=None, callback=None):
+        """Inserts parents and children, returns the IDs of the parents.
+
+        Args:
+            - parent (str) : name of parent table
+            - parents (Columns) : parent columns, scalars are broadcast
+            - child (str) : name of child table
+            - children (Columns) : child columns without foreign key
+            - parent_index (list) : index of the parent of every child
+            - callback (callable) : called with the connection after the
+                                    rows were inserted, within their
+                                    transaction (e.g. to write a summary)
+        """
+        for attempt in range(self.retries):
+            try:
+                with self.engine.begin() as conn:
+                    ids = self.load_on(conn, parent, parents, child,
+                                       children, parent_index)
+                    if callback is not None:
+                        callback(conn)
+                    return ids
+            except sqlalchemy.exc.OperationalError as err:
+                if attempt + 1 == self.retries or not any(
+                        error in str(err.orig) for error in RETRY_ERRORS):
+                    raise
+                self.log.info("Load of %s failed on a lock (%s), retrying",
+                              parent, err.orig)
+        return None
+
+    def load_on(self, conn, parent, parents, child=None, children=None, #pylint: disable=R0913
+                parent_index=None):
+        """Same as load, but on conn within the transaction of the caller
+        and without retries."""
+        prim_key = self.dbt.primkey(parent)
+        parent_tab = self.dbt.obj(parent).__table__
+        if prim_key in parents:
+            ids = parents[prim_key]
+            ids = ids.tolist() if hasattr(ids, "tolist") else list(ids)
+            self._executemany(conn, parent_tab, parents)
+        else:
+            ids = self.insert_generated(conn, parent_tab, prim_key, parents)
+        if child is not None and parent_index is not None \
+                and len(parent_index):
+            if isinstance(ids, range):
+                # evenly spaced IDs, also works for numpy arrays
+                fk_values = parent_index * ids.step + ids.start if hasattr(
+                    parent_index, "dtype") else [
+                        ids.start + index * ids.step
+                        for index in parent_index]
+            else:
+                fk_values = [ids[index] for index in parent_index]
+            self._load(conn, self.dbt.obj(child).__table__,
+                       Columns(children, **{
+                           self.foreign_key(parent, child): fk_values}))
+        return ids
+
+    def _batches(self, columns):
+        length = columns.length()
+        for start in range(0, length, self.batch_size):
+            yield Columns(
+                (key, column if is_scalar(column)
+                 else column[start:start + self.batch_size])
+                for key, column in columns.items())
+
+    def _packets(self, conn, statement, rows):
+        """Splits rows into lists whose multi-row INSERT (MySQL) fits into
+        max_allowed_packet, other backends get rows as they are."""
+        if conn.dialect.name != "mysql":
+            yield rows
+            return
+        if self._max_packet is None:
+            self._max_packet = int(conn.execute(
+                "SELECT @@max_allowed_packet").scalar())
+        limit = int(self._max_packet * PACKET_SHARE)
+        packet = []
+        size = len(statement)
+        for row in rows:
+            # quotes and separators of the values and the row
+            length = sum(len(str(value)) + 4 for value in row) + 4
+            if packet and size + length > limit:
+                yield packet
+                packet = []
+                size = len(statement)
+            packet.append(row)
+            size += length
+        if packet:
+            yield packet
+
+    def _auto_increment_step(self, conn):
+        if self._step is None:
+            self._step = int(conn.execute(
+                "SELECT @@auto_increment_increment").scalar() or 1)
+        return self._step
+
+    def insert_generated(self, conn, table, prim_key, columns):
+        """Inserts rows without primary keys in batches on conn (within a
+        transaction) and returns their generated keys in the order of the
+        rows, a range if they are evenly spaced.
+
+        Args:
+            - conn : connection of the transaction
+            - table (sqlalchemy.Table) : table of the rows
+            - prim_key (str) : name of the autoincremented primary key
+            - columns (Columns) : columns of the rows without prim_key
+        """
+        ids = []
+        step = 1
+        for batch in self._batches(columns):
+            statement, rows = columns_insert(conn.dialect, table, batch)
+            if not rows:
+                continue
+            if conn.dialect.name == "mysql":
+                step = self._auto_increment_step(conn)
+                values = statement[statement.index(" VALUES ") + 8:]
+                for packet in self._packets(conn, statement, rows):
+                    first = conn.execute(
+                        statement + (", " + values) * (len(packet) - 1),
+                        tuple(value for row in packet for value in row))\
+                        .lastrowid
+                    ids.extend(range(first, first + step * len(packet),
+                                     step))
+                continue
+            if conn.dialect.name == "sqlite":
+                conn.execute(statement, rows)
+                first = conn.execute(sqlalchemy.select([sqlalchemy.func.max(
+                    table.c[prim_key])])).scalar() - len(rows) + 1
+            else:
+                for row in rows:
+                    ids.append(conn.execute(table.insert(), dict(zip(
+                        batch, row))).inserted_primary_key[0])
+                continue
+            ids.extend(range(first, first + len(rows)))
+        # the batches are evenly spaced, a larger distance between two of
+        # them shows in the span of all IDs
+        if ids and ids[-1] - ids[0] == (len(ids) - 1) * step:
+            return range(ids[0], ids[-1] + 1, step)
+        return ids
+
+    def _load(self, conn, table, columns):
+        if self.method == "infile":
+            self._load_infile(conn, table, columns)
+            return
+        self._executemany(conn, table, columns)
+
+    def _executemany(self, conn, table, columns):
+        for batch in self._batches(columns):
+            statement, rows = columns_insert(conn.dialect, table, batch)
+            if not rows:
+                continue
+            # mysqlconnector sends the rows as one multi-row INSERT
+            for packet in self._packets(conn, statement, rows):
+                conn.execute(statement, packet)
+
+    def _load_infile(self, conn, table, columns):
+        keys = list(columns)
+        length = columns.length()
+        values = [[column] * length if is_scalar(column)
+                  else (column.tolist() if hasattr(column, "tolist")
+                        else column)
+                  for column in columns.values()]
+        handle, path = tempfile.mkstemp(suffix=".csv")
+        try:
+            with os.fdopen(handle, "w") as csv_file:
+                for row in zip(*values):
+                    csv_file.write(",".join(map(_csv_value, row)))
+                    csv_file.write("\n")
+            preparer = conn.dialect.identifier_preparer
+            conn.execute(
+                "LOAD DATA LOCAL INFILE '{0}' INTO TABLE {1} "
+                "FIELDS TERMINATED BY ',' ENCLOSED BY '\"' ESCAPED BY '' "
+                "LINES TERMINATED BY '\\n' ({2})".format(
+                    path.replace("'", "''"), preparer.format_table(table),
+                    ", ".join(preparer.quote(key) for key in keys)))
+        finally:
+            os.remove(path)
@@ -0,0 +1,156 @@
+"""Packed-curve storage: the data columns of one measurement in one row.
+
+A curve of db_probe_data takes one row per point. A table that is listed in
+the 'packed tables' section of the model is stored as one row per key (e.g.
+probeid) in a table with a BLOB column instead:
+
+    packed tables:
+        db_probe_data:                  # rows of this table ...
+            table       : db_probe_curve    # ... are stored here
+            key         : probeid           # one row per key value
+            column      : data              # BLOB column (default 'data')
+            compression : zstd              # zstd, lz4 or None
+
+The BLOB holds every column as a typed little-endian array (float64, int64,
+datetime64[us] or JSON for strings), compressed as a whole:
+
+    b'DBHP' | uint32 header length | JSON header | compressed arrays
+
+The JSON header lists length, compression and name, dtype and byte size of
+the columns. Packing and unpacking need numpy.
+"""
+import datetime
+import json
+import struct
+
+from DBHandler.utility.transport import compress, decompress
+
+try:
+    import numpy as np
+except (ImportError, ModuleNotFoundError):
+    np = None
+
+MAGIC = b"DBHP"
+COMPRESSIONS = ["zstd", "lz4", None]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("Packed tables need numpy")
+
+
+def packed_config(packed_cfg, dbt):
+    """Checks the 'packed tables' section of the model and returns
+    dict{table : dict{'table', 'key', 'column', 'compression'}}."""
+    packed = {}
+    for table, info in (packed_cfg or {}).items():
+        info = dict({"column": "data", "compression": "zstd"}, **info)
+        if info["compression"] in ["None", "none", ""]:
+            info["compression"] = None
+        if info["compression"] not in COMPRESSIONS:
+            raise ValueError("Unknown compression '{}' of packed table {}"
+                             .format(info["compression"], table))
+        for name in [table, info["table"]]:
+            if name not in dbt.all_names():
+                raise ValueError("Packed table {} is not in the model"
+                                 .format(name))
+        _require_numpy()
+        packed[table] = info
+    return packed
+
+
+def _as_array(column):
+    """Returns column as little-endian numpy array and its dtype string,
+    (None, 'json') for columns that are no numbers or datetimes."""
+    if hasattr(column, "dtype") and column.dtype.kind in "biuf":
+        dtype = "<f8" if column.dtype.kind == "f" else "<i8"
+        return np.ascontiguousarray(column, dtype=dtype), dtype
+    if hasattr(column, "dtype") and column.dtype.kind == "M":
+        return np.ascontiguousarray(column, dtype="<M8[us]"), "<M8[us]"
+    values = column.tolist() if hasattr(column, "tolist") else list(column)
+    present = [value for value in values if value is not None]
+    if present and all(isinstance(value, datetime.datetime)
+                       for value in present):
+        return np.array(values, dtype="<M8[us]"), "<M8[us]"
+    if all(isinstance(value, (int, float)) for value in present):
+        if len(present) == len(values) and all(
+                isinstance(value, int) for value in present):
+            return np.array(values, dtype="<i8"), "<i8"
+        return np.array([np.nan if value is None else value
+                         for value in values], dtype="<f8"), "<f8"
+    return None, "json"
+
+
+def as_column(values):
+    """Returns a list of values as numpy array like pack_columns would store
+    it, lists of strings (or all values without numpy) are returned as is."""
+    if np is None:
+        return values
+    array = _as_array(values)[0]
+    return values if array is None else array
+
+
+def pack_columns(columns, compression="zstd"):
+    """Packs columns (see Columns, without broadcast scalars) into bytes."""
+    _require_numpy()
+    length = columns.length()
+    header = {"length": length, "compression": compression, "columns": []}
+    chunks = []
+    for key, column in columns.items():
+        array, dtype = _as_array(column)
+        if array is None:
+            values = column.tolist() if hasattr(column, "tolist") \
+                else list(column)
+            chunk = json.dumps(values, default=str).encode("utf-8")
+        else:
+            chunk = array.tobytes()
+        header["columns"].append([key, dtype, len(chunk)])
+        chunks.append(chunk)
+    head = json.dumps(header).encode("utf-8")
+    return MAGIC + struct.pack("<I", len(head)) + head \
+        + compress(b"".join(chunks), compression)
+
+
+def concat_columns(*parts):
+    """Concatenates columns (dicts{key : list or array}) in one pass, keys
+    missing in a part are filled with None."""
+    lengths = [len(next(iter(part.values()))) if part else 0
+               for part in parts]
+    merged = {}
+    for key in dict.fromkeys(key for part in parts for key in part):
+        values = []
+        for part, length in zip(parts, lengths):
+            if key not in part:
+                values.extend([None] * length)
+            else:
+                column = part[key]
+                values.extend(column.tolist() if hasattr(column, "tolist")
+                              else column)
+        merged[key] = values
+    return merged
+
+
+def unpack_columns(blob, keys=None):
+    """Unpacks bytes of pack_columns into dict{key : numpy array} (lists for
+    JSON columns), keys selects the returned columns."""
+    _require_numpy()
+    blob = bytes(blob)
+    if blob[:4] != MAGIC:
+        raise ValueError("No packed columns")
+    size, = struct.unpack("<I", blob[4:8])
+    header = json.loads(blob[8:8 + size].decode("utf-8"))
+    # writable arrays without copies
+    payload = bytearray(decompress(blob[8 + size:], header["compression"]))
+    columns = {}
+    offset = 0
+    for key, dtype, nbytes in header["columns"]:
+        if keys is None or key in keys:
+            if dtype == "json":
+                columns[key] = json.loads(
+                    payload[offset:offset + nbytes].decode("utf-8"))
+            else:
+                columns[key] = np.frombuffer(
+                    payload, dtype=dtype, count=header["length"],
+                    offset=offset)
+        offset += nbytes
+    return columns
@@ -0,0 +1,210 @@
+"""SQL statement profiler for the DBHandler.
+
+The QueryProfiler listens to the before/after_cursor_execute events of a
+SQLAlchemy engine. It aggregates every statement by its normalized shape:
+literals, bound parameters and IN lists are replaced by '?'. For each
+shape it keeps count, total/mean/p99 time and affected rows. Statements
+slower than a threshold go to a slow-query log. Within a request (see
+QueryProfiler.request) shapes that are executed many times are reported
+as N+1 patterns.
+"""
+import collections
+import contextlib
+import logging
+import re
+import threading
+import time
+
+import sqlalchemy
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|%s|:\w+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,)*\s*\?\s*\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement):
+    """Returns the shape of a SQL statement: literals and parameters are
+    replaced by '?', IN lists are collapsed and whitespace is squeezed."""
+    shape = _STRING.sub("?", statement)
+    shape = _PARAM.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("IN (?...)", shape)
+    return _SPACE.sub(" ", shape).strip()
+
+
+class StatementStats():
+    """Aggregated timings of one statement shape."""
+
+    def __init__(self, samples):
+        self.count = 0
+        self.total = 0.
+        self.rows = 0
+        self.max = 0.
+        self._samples = collections.deque(maxlen=samples)
+
+    def add(self, duration, rows):
+        """Add one execution."""
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        if rows is not None and rows > 0:
+            self.rows += rows
+        self._samples.append(duration)
+
+    def percentile(self, fraction):
+        """Returns the percentile of the most recent executions."""
+        if not self._samples:
+            return 0.
+        samples = sorted(self._samples)
+        return samples[min(int(fraction * len(samples)), len(samples) - 1)]
+
+    def as_dict(self):
+        """Returns the stats as JSON serializable dict."""
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.total / self.count if self.count else 0.,
+                "p99": self.percentile(0.99),
+                "max": self.max,
+                "rows": self.rows}
+
+
+class QueryProfiler(): #pylint: disable=R0902
+    """Opt-in profiler of the statements a SQLAlchemy engine executes.
+
+    Args:
+        - slow_threshold (float) : statements slower than this (in seconds)
+                                   are written to the slow-query log
+        - slow_log (str) : file of the slow-query log, default is the
+                           'DBHandler.slowquery' logger only. The file
+                           handler is removed and closed by detach
+        - n_plus_one (int) : executions of one shape per request that are
+                             reported as N+1 pattern
+        - samples (int) : number of recent executions kept per shape for
+                          the p99 time
+    """
+    def __init__(self, slow_threshold=0.1, slow_log=None, n_plus_one=10,
+                 samples=1000):
+        self.slow_threshold = slow_threshold
+        self.n_plus_one = n_plus_one
+        self._samples = samples
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._patterns = collections.deque(maxlen=100)
+        self._local = threading.local()
+        self._engines = []
+        self.slow_queries = 0
+        self.log = logging.getLogger("DBHandler.slowquery")
+        self._handler = None
+        self._level = self.log.level
+        if slow_log:
+            self._handler = logging.FileHandler(slow_log)
+            self._handler.setFormatter(logging.Formatter(
+                "%(asctime)s - %(message)s"))
+            self.log.addHandler(self._handler)
+            self.log.setLevel(logging.INFO)
+
+    def attach(self, engine):
+        """Start profiling the statements of engine."""
+        sqlalchemy.event.listen(engine, "before_cursor_execute",
+                                self._before_execute)
+        sqlalchemy.event.listen(engine, "after_cursor_execute",
+                                self._after_execute)
+        sqlalchemy.event.listen(engine, "handle_error", self._handle_error)
+        self._engines.append(engine)
+
+    def detach(self):
+        """Stop profiling all attached engines and close the slow-query
+        log file."""
+        for engine in self._engines:
+            sqlalchemy.event.remove(engine, "before_cursor_execute",
+                                    self._before_execute)
+            sqlalchemy.event.remove(engine, "after_cursor_execute",
+                                    self._after_execute)
+            sqlalchemy.event.remove(engine, "handle_error",
+                                    self._handle_error)
+        self._engines = []
+        if self._handler is not None:
+            self.log.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = None
+            self.log.setLevel(self._level)
+
+    def _before_execute(self, conn, cursor, statement, #pylint: disable=R0913
+                        parameters, context, executemany): #pylint: disable=W0613
+        conn.info.setdefault("profiler_start", []).append(time.perf_counter())
+
+    @staticmethod
+    def _handle_error(context):
+        # a failed statement has no after_cursor_execute event
+        conn = context.connection
+        if conn is not None and conn.info.get("profiler_start"):
+            conn.info["profiler_start"].pop()
+
+    def _after_execute(self, conn, cursor, statement, #pylint: disable=R0913
+                       parameters, context, executemany): #pylint: disable=W0613
+        duration = time.perf_counter() - conn.info["profiler_start"].pop()
+        shape = normalize_statement(statement)
+        with self._lock:
+            try:
+                stats = self._stats[shape]
+            except KeyError:
+                stats = StatementStats(self._samples)
+                self._stats[shape] = stats
+            stats.add(duration, cursor.rowcount)
+        request_counts = getattr(self._local, "counts", None)
+        if request_counts is not None:
+            request_counts[shape] += 1
+        if duration >= self.slow_threshold:
+            with self._lock:
+                self.slow_queries += 1
+            self.log.warning("%.4f s: %s %s", duration,
+                             _SPACE.sub(" ", statement),
+                             str(parameters)[:500])
+
+    @contextlib.contextmanager
+    def request(self, name):
+        """Context manager that groups the statements of one request (e.g.
+        one upload) to detect N+1 patterns."""
+        outer = getattr(self._local, "counts", None)
+        if outer is not None:
+            # nested requests are accounted to the outermost one
+            yield
+            return
+        self._local.counts = collections.Counter()
+        try:
+            yield
+        finally:
+            counts = self._local.counts
+            self._local.counts = None
+            for shape, count in counts.items():
+                if count >= self.n_plus_one:
+                    self._patterns.append({"request": name,
+                                           "statement": shape,
+                                           "count": count})
+                    self.log.warning("N+1 pattern in %s: %s times %s",
+                                     name, count, shape)
+
+    def summary(self, top=None):
+        """Returns the profile as dict, statements sorted by total time.
+
+        Args:
+            - top (int) : only return the slowest statements
+        """
+        with self._lock:
+            statements = [dict(stats.as_dict(), statement=shape)
+                          for shape, stats in self._stats.items()]
+            slow_queries = self.slow_queries
+        statements.sort(key=lambda stat: stat["total"], reverse=True)
+        return {"statements": statements[:top] if top else statements,
+                "n_plus_one": list(self._patterns),
+                "slow_queries": slow_queries,
+                "slow_threshold": self.slow_threshold}
+
+    def reset(self):
+        """Removes all recorded statements and patterns."""
+        with self._lock:
+            self._stats = {}
+            self._patterns.clear()
+            self.slow_queries = 0
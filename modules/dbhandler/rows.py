@@ -0,0 +1,82 @@
+"""Lightweight read-only rows.
+
+ORM instances are instrumented, carry an InstanceState and are tracked in
+the identity map of the session, which dominates the read time and memory
+of wide tables (e.g. db_alibava with ~60 columns). For read paths the
+DBHandler returns rows of a tuple subclass instead:
+
+    - one class per table class, generated on first use from the mapped
+      columns, with a read-only property per column
+    - no __dict__ (empty __slots__), no session state, immutable
+    - to_dict returns dict{attribute name : value} like get_dict
+
+    rows = handler.search_rows("db_alibava", run=1234)
+    rows[0].voltage, rows[0].to_dict()
+"""
+import keyword
+import operator
+import threading
+
+import sqlalchemy
+
+_CLASSES = {}
+_LOCK = threading.Lock()
+
+
+class Row(tuple):
+    """Base class of the generated row classes."""
+    __slots__ = ()
+    _fields = ()
+
+    def to_dict(self):
+        """Returns dict{attribute name : value}."""
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join(
+            "{}={!r}".format(name, value)
+            for name, value in zip(self._fields, self)))
+
+
+def _attributes(table):
+    """Returns [(attribute name, column), ...] of a mapped table class."""
+    return [(attr.key, attr.columns[0])
+            for attr in sqlalchemy.inspect(table).column_attrs]
+
+
+def row_class(table):
+    """Returns the row class of a mapped table class."""
+    cls = _CLASSES.get(table)
+    if cls is None:
+        with _LOCK:
+            cls = _CLASSES.get(table)
+            if cls is None:
+                fields = tuple(name for name, _ in _attributes(table))
+                namespace = {"__slots__": (), "_fields": fields,
+                             "__doc__": "Row of {}.".format(table.__name__)}
+                for pos, name in enumerate(fields):
+                    if name.isidentifier() and not keyword.iskeyword(name) \
+                            and not hasattr(Row, name):
+                        namespace[name] = property(operator.itemgetter(pos))
+                cls = type(table.__name__ + "_row", (Row,), namespace)
+                _CLASSES[table] = cls
+    return cls
+
+
+def row_query(table):
+    """Returns the row class of a mapped table class and a select of its
+    columns in the order of the row fields."""
+    return row_class(table), sqlalchemy.select(
+        [column for _, column in _attributes(table)])
+
+
+def select_rows(conn, table, criteria=(), order_by=None):
+    """Returns the rows of a mapped table class that match criteria (SQL
+    expressions) as instances of its row class."""
+    cls, query = row_query(table)
+    for criterion in criteria:
+        query = query.where(criterion)
+    if order_by is not None:
+        query = query.order_by(order_by)
+    new = tuple.__new__
+    return [new(cls, row) for row in conn.execute(query)]
@@ -0,0 +1,312 @@
+"""Incrementally maintained summary tables.
+
+Overview pages list measurements with their point count, voltage range or
+temperature range. Instead of aggregating db_probe_data per probeid for
+every request, the DBHandler keeps one summary row per key that is computed
+from the in-memory container during the upload:
+
+    summary tables:
+        db_probe_data:                      # summarized table
+            table   : db_probe_summary      # table class of the summaries
+            key     : probeid               # one summary row per key value
+            columns :
+                datax       : [min, max]
+                datay       : [min, max, mean]
+                time        : [first, last]
+
+The summary table has the key column, which must be unique, 'count' and
+one column '<column>_<aggregate>' per aggregate (min, max, mean, first,
+last). First and last are the values of the first and last row in upload
+order. The summary is written after the rows, in their transaction. Later
+chunks of the same key (see upload_file) are merged into the summary row,
+the mean is weighted by the row count. Existing data is summarized with
+SummaryBuilder.rebuild, e.g. from the command line:
+
+    python -m DBHandler.modules.dbhandler.summary model.yml db_probe_data \
+        --batch-size 500
+"""
+import argparse
+import logging
+import math
+import time
+
+import sqlalchemy
+
+try:
+    from .packed import unpack_columns
+except (ModuleNotFoundError, ImportError):
+    from packed import unpack_columns
+
+AGGREGATES = ["min", "max", "mean", "first", "last"]
+
+
+def _is_unique(tab, column):
+    if column.unique or list(tab.primary_key.columns) == [column]:
+        return True
+    return any(list(index.columns) == [column]
+               for index in tab.indexes if index.unique) \
+        or any(isinstance(constraint, sqlalchemy.UniqueConstraint)
+               and list(constraint.columns) == [column]
+               for constraint in tab.constraints)
+
+
+def summary_config(summary_cfg, dbt):
+    """Checks the 'summary tables' section of the model and returns
+    dict{table : dict{'table', 'key', 'columns' : dict{column : [...]}}}."""
+    summaries = {}
+    for table, info in (summary_cfg or {}).items():
+        missing = [name for name in [table, info["table"]]
+                   if name not in dbt.all_names()]
+        if missing:
+            # e.g. the table classes of the map could not be imported, the
+            # handler works without summaries
+            logging.getLogger("DBHandler.summary").warning(
+                "Summary of %s skipped, %s not in the model", table,
+                ", ".join(missing))
+            continue
+        summary_tab = dbt.obj(info["table"]).__table__
+        summary_columns = summary_tab.c
+        if info["key"] not in summary_columns or not _is_unique(
+                summary_tab, summary_columns[info["key"]]):
+            raise ValueError("{} needs a unique column {}".format(
+                info["table"], info["key"]))
+        columns = {}
+        for column, aggregates in (info.get("columns") or {}).items():
+            aggregates = [aggregates] if isinstance(aggregates, str) \
+                else list(aggregates)
+            for aggregate in aggregates:
+                if aggregate not in AGGREGATES:
+                    raise ValueError("Unknown aggregate '{}' of {}".format(
+                        aggregate, column))
+                if "{}_{}".format(column, aggregate) not in summary_columns:
+                    raise ValueError("{} has no column {}_{}".format(
+                        info["table"], column, aggregate))
+            columns[column] = aggregates
+        summaries[table] = {"table": info["table"], "key": info["key"],
+                            "columns": columns}
+    return summaries
+
+
+def _present(values):
+    return [value for value in values if value is not None
+            and not (isinstance(value, float) and math.isnan(value))]
+
+
+def summarize(columns, length, spec):
+    """Returns the summary row (without key) of columns.
+
+    Args:
+        - columns (dict) : dict{column : list or array}, missing columns
+                           count as empty
+        - length (int) : number of rows
+        - spec (dict) : dict{column : [aggregate, ...]}
+    """
+    row = {"count": length}
+    for column, aggregates in spec.items():
+        values = columns.get(column, [])
+        values = values.tolist() if hasattr(values, "tolist") \
+            else list(values)
+        present = _present(values)
+        for aggregate in aggregates:
+            name = "{}_{}".format(column, aggregate)
+            if not present:
+                row[name] = None
+            elif aggregate == "min":
+                row[name] = min(present)
+            elif aggregate == "max":
+                row[name] = max(present)
+            elif aggregate == "mean":
+                row[name] = sum(present) / len(present)
+            elif aggregate == "first":
+                row[name] = present[0]
+            else:
+                row[name] = present[-1]
+    return row
+
+
+def merge(old, new, spec):
+    """Merges the summary row new (later rows of the same key) into old."""
+    row = {"count": (old["count"] or 0) + new["count"]}
+    for column, aggregates in spec.items():
+        for aggregate in aggregates:
+            name = "{}_{}".format(column, aggregate)
+            values = [old[name], new[name]]
+            if None in values:
+                row[name] = new[name] if old[name] is None else old[name]
+            elif aggregate == "min":
+                row[name] = min(values)
+            elif aggregate == "max":
+                row[name] = max(values)
+            elif aggregate == "mean":
+                row[name] = (old[name] * (old["count"] or 0)
+                             + new[name] * new["count"]) / row["count"]
+            elif aggregate == "first":
+                row[name] = old[name]
+            else:
+                row[name] = new[name]
+    return row
+
+
+def upsert_summary(conn, dbt, info, key_value, row):
+    """Inserts the summary row of key_value or merges it into the existing
+    one (on conn, within the transaction of the caller, after the rows were
+    written).
+
+    The existing row is locked (SELECT ... FOR UPDATE). If a concurrent
+    transaction inserted the first summary row of key_value, the insert
+    fails on the unique key within a savepoint and row is merged into that
+    one. SQLite has no row locks, but the transaction holds the write lock
+    of the DB since the rows were written.
+    """
+    tab = dbt.obj(info["table"]).__table__
+    key = tab.c[info["key"]]
+    query = sqlalchemy.select([tab]).where(key == key_value)\
+        .with_for_update()
+    old = conn.execute(query).first()
+    if old is None:
+        new = dict(row, **{info["key"]: key_value})
+        if conn.dialect.name == "sqlite":
+            conn.execute(tab.insert(), new)
+            return
+        try:
+            with conn.begin_nested():
+                conn.execute(tab.insert(), new)
+            return
+        except sqlalchemy.exc.IntegrityError:
+            old = conn.execute(query).first()
+    conn.execute(tab.update().where(key == key_value),
+                 merge(dict(old), row, info["columns"]))
+
+
+class SummaryBuilder():
+    """Rebuilds the summaries of existing data in batches of keys.
+
+    Args:
+        - handler (DBHandler) : provides model, engine and packed tables
+        - batch_size (int) : keys per transaction
+    """
+    def __init__(self, handler, batch_size=1000):
+        self.log = logging.getLogger("DBHandler.SummaryBuilder")
+        self.handler = handler
+        self.dbt = handler.dbt
+        self.batch_size = batch_size
+
+    def rebuild(self, table):
+        """Replaces all summary rows of table, returns a report. Keys of a
+        packed table without a packed row (e.g. curves with nested tables)
+        are summarized from the rows."""
+        start = time.perf_counter()
+        info = self.handler.summaries[table]
+        packed = self.handler.packed.get(table)
+        source = self.dbt.obj(table).__table__
+        sources = [source]
+        if packed:
+            packed_source = self.dbt.obj(packed["table"]).__table__
+            sources.append(packed_source)
+        summary = self.dbt.obj(info["table"]).__table__
+        report = {"table": table, "keys": 0, "batches": 0}
+        with self.handler.engine.connect() as conn:
+            keys = sorted({value for tab in sources for value, in conn.execute(
+                sqlalchemy.select([tab.c[info["key"]]]).distinct())
+                           if value is not None})
+            for first in range(0, len(keys), self.batch_size):
+                batch = keys[first:first + self.batch_size]
+                with conn.begin():
+                    rows = []
+                    if packed:
+                        rows = self._packed_rows(conn, packed, packed_source,
+                                                 batch, info)
+                        done = {row[info["key"]] for row in rows}
+                        batch_rows = [value for value in batch
+                                      if value not in done]
+                    else:
+                        batch_rows = batch
+                    if batch_rows:
+                        rows.extend(self._rows(conn, table, source,
+                                               batch_rows, info))
+                    conn.execute(summary.delete().where(
+                        summary.c[info["key"]].in_(batch)))
+                    if rows:
+                        conn.execute(summary.insert(), rows)
+                report["keys"] += len(batch)
+                report["batches"] += 1
+        report["seconds"] = time.perf_counter() - start
+        self.log.info("Rebuilt %s summaries of %s in %.2f s", report["keys"],
+                      table, report["seconds"])
+        return report
+
+    def _rows(self, conn, table, source, batch, info):
+        """Summaries of row tables with one GROUP BY query, first and last
+        values are looked up by the first and last primary key."""
+        key = source.c[info["key"]]
+        prim_key = source.c[self.dbt.primkey(table)]
+        func = sqlalchemy.func
+        selected = [key, func.count(), func.min(prim_key), func.max(prim_key)]
+        names = []
+        for column, aggregates in info["columns"].items():
+            for aggregate in aggregates:
+                if aggregate in ["min", "max"]:
+                    selected.append(getattr(func, aggregate)(source.c[column]))
+                elif aggregate == "mean":
+                    selected.append(func.avg(source.c[column]))
+                else:
+                    continue
+                names.append("{}_{}".format(column, aggregate))
+        rows = {}
+        ends = {}
+        for result in conn.execute(sqlalchemy.select(selected)
+                                   .where(key.in_(batch)).group_by(key)):
+            rows[result[0]] = dict(zip(names, result[4:]),
+                                   **{info["key"]: result[0],
+                                      "count": result[1]})
+            ends.setdefault(result[2], (result[0], set()))[1].add("first")
+            ends.setdefault(result[3], (result[0], set()))[1].add("last")
+        ends_columns = [(column, aggregate) for column, aggregates
+                        in info["columns"].items() for aggregate in aggregates
+                        if aggregate in ["first", "last"]]
+        end_keys = list(dict.fromkeys(column for column, _ in ends_columns))
+        if end_keys and ends:
+            for result in conn.execute(sqlalchemy.select(
+                    [prim_key] + [source.c[column] for column in end_keys])
+                                       .where(prim_key.in_(list(ends)))):
+                key_value, end = ends[result[0]]
+                for column, aggregate in ends_columns:
+                    if aggregate in end:
+                        rows[key_value]["{}_{}".format(column, aggregate)] \
+                            = result[1 + end_keys.index(column)]
+        return list(rows.values())
+
+    def _packed_rows(self, conn, packed, source, batch, info): #pylint: disable=R0913
+        """Summaries of packed tables from the unpacked curves."""
+        rows = []
+        for key_value, blob in conn.execute(sqlalchemy.select(
+                [source.c[packed["key"]], source.c[packed["column"]]])
+                                            .where(source.c[packed["key"]]
+                                                   .in_(batch))):
+            columns = unpack_columns(blob)
+            length = len(next(iter(columns.values()))) if columns else 0
+            row = summarize(columns, length, info["columns"])
+            row[info["key"]] = key_value
+            rows.append(row)
+        return rows
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Rebuild of summary "
+                                     "tables")
+    parser.add_argument("model", help="model file or 'default'")
+    parser.add_argument("tables", nargs="*",
+                        help="summarized tables, default are all")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from DBHandler.modules.dbhandler import DBHandler
+    handler = DBHandler(args.model)
+    for table in args.tables or list(handler.summaries):
+        handler.rebuild_summary(table, batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""Offline-first synchronization of a local SQLite buffer to the central DB.
+
+If the model contains an 'offline buffer' section, the DBHandler writes all
+uploads into a local SQLite DB that uses the same table classes. The
+Synchronizer thread replicates the buffer to the central DB in large
+batches:
+
+    - tables with upload option 'once'/'always' are pushed in model order,
+      so parents are pushed before their children
+    - rows beyond the per-table watermark (last pushed local primary key)
+      are inserted in batches, the server assigns their IDs by auto
+      increment (see NestedLoader.insert_generated)
+    - every pushed row is recorded in 'sync_remote_idmap' on the server
+      (buffer origin, table, local ID, server ID) in the transaction of the
+      rows. Before a batch is pushed, the buffer marks it as pending; if the
+      server committed the batch but the buffer did not record it (crash),
+      the next round finds its rows in the server idmap and does not insert
+      them again
+    - local IDs of cross-referenced parents (e.g. probeid, probe_uid) are
+      mapped to their server IDs in the children before they are pushed
+    - UPDATEs of pushed rows (e.g. summary upserts, appended packed curves)
+      are logged by SQLite triggers in 'sync_dirty' and pushed as UPDATEs
+      of the server rows found by the server idmap
+    - 'upload=never' tables that are cross-referenced by pushed tables
+      (e.g. db_info) are mirrored from the server to the buffer: new server
+      rows (primary key beyond the largest local one) every round, changed
+      rows every 'refresh' seconds
+
+Deletions are not replicated.
+"""
+import datetime
+import logging
+import threading
+import time
+import uuid
+
+import sqlalchemy
+from sqlalchemy import BigInteger, Column, Integer, MetaData, String, Table
+
+SYNC_METADATA = MetaData()
+WATERMARK = Table("sync_watermark", SYNC_METADATA,
+                  Column("tablename", String(64), primary_key=True),
+                  Column("last_pk", BigInteger, nullable=False),
+                  # last local ID of a batch that is being pushed
+                  Column("pending_pk", BigInteger, nullable=True))
+IDMAP = Table("sync_idmap", SYNC_METADATA,
+              Column("tablename", String(64), primary_key=True),
+              Column("local_id", BigInteger, primary_key=True),
+              Column("remote_id", BigInteger, nullable=False))
+DIRTY = Table("sync_dirty", SYNC_METADATA,
+              Column("seq", Integer, primary_key=True, autoincrement=True),
+              Column("tablename", String(64), nullable=False),
+              Column("local_id", BigInteger, nullable=False))
+ORIGIN = Table("sync_origin", SYNC_METADATA,
+               Column("origin", String(32), primary_key=True))
+# tables of the central DB
+REMOTE_METADATA = MetaData()
+REMOTE_IDMAP = Table("sync_remote_idmap", REMOTE_METADATA,
+                     Column("origin", String(32), primary_key=True),
+                     Column("tablename", String(64), primary_key=True),
+                     Column("local_id", BigInteger, primary_key=True),
+                     Column("remote_id", BigInteger, nullable=False))
+# maximum number of bound parameters per IN clause
+IN_CHUNK = 500
+# bound parameter of the server ID in UPDATEs of dirty rows
+REMOTE_ID = "sync_remote_id_"
+
+
+class Synchronizer(threading.Thread): #pylint: disable=R0902
+    """Background thread that replicates the local buffer to the server.
+
+    Args:
+        - local_engine : engine of the local SQLite buffer
+        - remote_engine : engine of the central DB
+        - dbt (DBTable) : table classes, upload options and cross-references
+        - interval (float) : seconds between two sync rounds
+        - batch_size (int) : rows per server transaction
+        - retries (int) : attempts of a server transaction that failed on a
+                          lock
+        - refresh (float) : seconds between two full reads of the mirrored
+                            tables
+    """
+    def __init__(self, local_engine, remote_engine, dbt, #pylint: disable=R0913
+                 interval=30, batch_size=5000, retries=3, refresh=3600):
+        super().__init__(name="DBHandler.sync", daemon=True)
+        try:
+            from .nested import NestedLoader, RETRY_ERRORS
+        except (ModuleNotFoundError, ImportError):
+            from nested import NestedLoader, RETRY_ERRORS
+        self.log = logging.getLogger("DBHandler.Synchronizer")
+        self.local_engine = local_engine
+        self.remote_engine = remote_engine
+        self.dbt = dbt
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retries = retries
+        self.refresh = refresh
+        self.stats = {"rounds": 0, "failed_rounds": 0, "rows": {},
+                      "updates": {}, "last_sync": None, "last_error": None}
+        self._stop_event = threading.Event()
+        self._round_lock = threading.Lock()
+        self._loader = NestedLoader(remote_engine, dbt, batch_size)
+        self._retry_errors = RETRY_ERRORS
+        self._remote_ready = False
+        self._last_refresh = None
+        SYNC_METADATA.create_all(local_engine, checkfirst=True)
+        self.origin = self._origin()
+
+        names = dbt.all_names()
+        self.push_tables = [name for name in names
+                            if dbt.opt(name) in ["once", "always"]]
+        self.reference_tables = []
+        # {child table : {column : parent table}}
+        self.remaps = {}
+        for table in self.push_tables:
+            info = dbt.cr_dict.get(table)
+            if not info:
+                continue
+            parent = info["table name"]
+            if parent in self.push_tables \
+                    and info["para"] == dbt.primkey(parent):
+                self.remaps.setdefault(table, {})[info["para"]] = parent
+            elif parent not in self.push_tables \
+                    and parent not in self.reference_tables:
+                self.reference_tables.append(parent)
+        self.parents = {parent for columns in self.remaps.values()
+                        for parent in columns.values()}
+        self._create_triggers()
+
+    def _origin(self):
+        """Returns the ID of the buffer in the server idmap, it is created
+        with the buffer."""
+        with self.local_engine.begin() as local:
+            origin = local.execute(
+                sqlalchemy.select([ORIGIN.c.origin])).scalar()
+            if origin is None:
+                origin = uuid.uuid4().hex
+                local.execute(ORIGIN.insert(), {"origin": origin})
+        return origin
+
+    def _create_triggers(self):
+        """Logs the local IDs of updated rows of the pushed tables in
+        DIRTY."""
+        preparer = self.local_engine.dialect.identifier_preparer
+        with self.local_engine.begin() as local:
+            for table in self.push_tables:
+                tab = self._table(table)
+                local.execute(
+                    "CREATE TRIGGER IF NOT EXISTS {0} AFTER UPDATE ON {1} "
+                    "BEGIN INSERT INTO {2} (tablename, local_id) "
+                    "VALUES ('{3}', NEW.{4}); END".format(
+                        preparer.quote("sync_dirty_" + tab.name),
+                        preparer.format_table(tab),
+                        preparer.format_table(DIRTY), table.replace("'", "''"),
+                        preparer.quote(self.dbt.primkey(table))))
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sync_once()
+
+    def stop(self, final_sync=True):
+        """Stop the thread, push the remaining rows if final_sync."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        if final_sync:
+            self.sync_once()
+
+    def sync_once(self):
+        """Run one sync round. Returns dict of pushed rows per table or None
+        if the server could not be reached."""
+        with self._round_lock:
+            try:
+                if not self._remote_ready:
+                    REMOTE_METADATA.create_all(self.remote_engine,
+                                               checkfirst=True)
+                    self._remote_ready = True
+                refresh = self._last_refresh is None or \
+                    time.monotonic() - self._last_refresh >= self.refresh
+                with self.remote_engine.connect() as remote, \
+                        self.local_engine.connect() as local:
+                    for table in self.reference_tables:
+                        self._pull(table, remote, local, refresh)
+                    if refresh:
+                        self._last_refresh = time.monotonic()
+                    pushed = {}
+                    updated = {}
+                    for table in self.push_tables:
+                        pushed[table] = self._push(table, remote, local)
+                        updated[table] = self._push_updates(table, remote,
+                                                            local)
+            except (sqlalchemy.exc.SQLAlchemyError, OSError) as err:
+                self.stats["failed_rounds"] += 1
+                self.stats["last_error"] = str(err)
+                self.log.warning("Sync to central DB failed: %s", err)
+                return None
+            self.stats["rounds"] += 1
+            self.stats["last_sync"] = datetime.datetime.now().isoformat()
+            for key, counts in [("rows", pushed), ("updates", updated)]:
+                for table, rows in counts.items():
+                    self.stats[key][table] = \
+                        self.stats[key].get(table, 0) + rows
+            if any(pushed.values()) or any(updated.values()):
+                self.log.info("Synced %s, updated %s", pushed, updated)
+            return pushed
+
+    def _table(self, table):
+        return self.dbt.obj(table).__table__
+
+    def _pull(self, table, remote, local, refresh):
+        """Mirror a reference table from the server: the rows beyond the
+        largest local primary key, all changed rows if refresh."""
+        tab = self._table(table)
+        prim_key = tab.c[self.dbt.primkey(table)]
+        last_pk = local.execute(sqlalchemy.select(
+            [sqlalchemy.func.max(prim_key)])).scalar()
+        query = sqlalchemy.select([tab])
+        if last_pk is not None and not refresh:
+            query = query.where(prim_key > last_pk)
+        rows = [dict(row) for row in remote.execute(query)]
+        if not rows:
+            return
+        existing = {}
+        if last_pk is not None and refresh:
+            existing = {row[prim_key.name]: dict(row) for row in
+                        local.execute(sqlalchemy.select([tab]))}
+        new = [row for row in rows if row[prim_key.name] not in existing]
+        changed = [row for row in rows if row[prim_key.name] in existing
+                   and existing[row[prim_key.name]] != row]
+        with local.begin():
+            if new:
+                local.execute(tab.insert(), new)
+            for row in changed:
+                local.execute(tab.update().where(
+                    prim_key == row[prim_key.name]).values(row))
+
+    def _push(self, table, remote, local):
+        """Push all new rows of table in batches. Returns number of rows."""
+        tab = self._table(table)
+        prim_key = tab.c[self.dbt.primkey(table)]
+        total = 0
+        while True:
+            watermark, pending = self._get_watermark(local, table)
+            rows = [dict(row) for row in local.execute(
+                sqlalchemy.select([tab]).where(prim_key > watermark)
+                .order_by(prim_key).limit(self.batch_size))]
+            if not rows:
+                break
+            complete = len(rows) == self.batch_size
+            count = len(rows)
+            rows = self._remap(local, table, rows)
+            if not rows:
+                break
+            local_ids = [row.pop(prim_key.name) for row in rows]
+            mapping = {}
+            if pending is not None and local_ids[0] <= pending:
+                # the last round was interrupted, its rows may be on the
+                # server already
+                mapping = self._remote_ids(remote, table, local_ids)
+            with local.begin():
+                self._set_watermark(local, table, watermark, local_ids[-1])
+            mapping.update(self._with_retries(
+                self._insert_remote, remote, table, tab, prim_key.name,
+                [(local_id, row) for local_id, row in zip(local_ids, rows)
+                 if local_id not in mapping]))
+            with local.begin():
+                if table in self.parents:
+                    local.execute(IDMAP.insert(), [
+                        {"tablename": table, "local_id": local_id,
+                         "remote_id": mapping[local_id]}
+                        for local_id in local_ids])
+                self._set_watermark(local, table, local_ids[-1])
+            total += len(rows)
+            if not complete or len(rows) < count:
+                break
+        return total
+
+    def _remap(self, local, table, rows):
+        """Replace local parent IDs by server IDs. Rows are cut at the first
+        row whose parent has not been pushed yet."""
+        for column, parent in self.remaps.get(table, {}).items():
+            mapping = self._id_map(local, parent,
+                                   {row[column] for row in rows
+                                    if row[column] is not None})
+            remapped = []
+            for row in rows:
+                if row[column] is not None:
+                    if row[column] not in mapping:
+                        break
+                    row[column] = mapping[row[column]]
+                remapped.append(row)
+            rows = remapped
+        return rows
+
+    @staticmethod
+    def _id_map(local, parent, local_ids):
+        mapping = {}
+        local_ids = sorted(local_ids)
+        for start in range(0, len(local_ids), IN_CHUNK):
+            chunk = local_ids[start:start + IN_CHUNK]
+            for local_id, remote_id in local.execute(
+                    sqlalchemy.select([IDMAP.c.local_id, IDMAP.c.remote_id])
+                    .where(IDMAP.c.tablename == parent)
+                    .where(IDMAP.c.local_id.in_(chunk))):
+                mapping[local_id] = remote_id
+        return mapping
+
+    def _remote_ids(self, remote, table, local_ids):
+        """Returns dict{local ID : server ID} of the pushed rows of table
+        from the server idmap."""
+        mapping = {}
+        local_ids = sorted(local_ids)
+        for start in range(0, len(local_ids), IN_CHUNK):
+            chunk = local_ids[start:start + IN_CHUNK]
+            for local_id, remote_id in remote.execute(
+                    sqlalchemy.select([REMOTE_IDMAP.c.local_id,
+                                       REMOTE_IDMAP.c.remote_id])
+                    .where(REMOTE_IDMAP.c.origin == self.origin)
+                    .where(REMOTE_IDMAP.c.tablename == table)
+                    .where(REMOTE_IDMAP.c.local_id.in_(chunk))):
+                mapping[local_id] = remote_id
+        return mapping
+
+    def _with_retries(self, function, remote, *args):
+        """Runs function(remote, *args) in a server transaction, retries it
+        if it failed on a lock."""
+        for attempt in range(self.retries):
+            try:
+                with remote.begin():
+                    return function(remote, *args)
+            except sqlalchemy.exc.OperationalError as err:
+                if attempt + 1 == self.retries or not any(
+                        error in str(err.orig)
+                        for error in self._retry_errors):
+                    raise
+                self.log.info("Sync of %s failed on a lock (%s), retrying",
+                              args[0], err.orig)
+        return None
+
+    def _insert_remote(self, remote, table, tab, prim_key, rows):
+        """Insert (local ID, row) pairs, the server generates their IDs.
+        Returns dict{local ID : server ID}."""
+        if not rows:
+            return {}
+        try:
+            from .dbhandler import Columns
+        except (ModuleNotFoundError, ImportError):
+            from dbhandler import Columns
+        remote_ids = self._loader.insert_generated(
+            remote, tab, prim_key, Columns.from_rows([row for _, row in rows]))
+        mapping = {local_id: remote_id for (local_id, _), remote_id
+                   in zip(rows, remote_ids)}
+        remote.execute(REMOTE_IDMAP.insert(), [
+            {"origin": self.origin, "tablename": table, "local_id": local_id,
+             "remote_id": remote_id}
+            for local_id, remote_id in mapping.items()])
+        return mapping
+
+    def _push_updates(self, table, remote, local):
+        """Push the updated rows of table that were pushed before. Returns
+        the number of rows."""
+        tab = self._table(table)
+        prim_key = tab.c[self.dbt.primkey(table)]
+        watermark, _ = self._get_watermark(local, table)
+        dirty = local.execute(
+            sqlalchemy.select([DIRTY.c.seq, DIRTY.c.local_id])
+            .where(DIRTY.c.tablename == table)
+            .where(DIRTY.c.local_id <= watermark)).fetchall()
+        if not dirty:
+            return 0
+        local_ids = sorted({local_id for _, local_id in dirty})
+        total = 0
+        for start in range(0, len(local_ids), IN_CHUNK):
+            chunk = local_ids[start:start + IN_CHUNK]
+            rows = self._remap(local, table, [dict(row) for row in local.execute(
+                sqlalchemy.select([tab]).where(prim_key.in_(chunk)))])
+            mapping = self._remote_ids(remote, table, chunk)
+            updates = []
+            for row in rows:
+                local_id = row.pop(prim_key.name)
+                if local_id not in mapping:
+                    self.log.warning("Updated row %s of %s is not in the "
+                                     "server idmap", local_id, table)
+                    continue
+                row[REMOTE_ID] = mapping[local_id]
+                updates.append(row)
+            if updates:
+                self._with_retries(self._update_remote, remote, table, tab,
+                                   prim_key, updates)
+            total += len(updates)
+        with local.begin():
+            local.execute(DIRTY.delete()
+                          .where(DIRTY.c.tablename == table)
+                          .where(DIRTY.c.local_id <= watermark)
+                          .where(DIRTY.c.seq <= max(seq for seq, _ in dirty)))
+        return total
+
+    @staticmethod
+    def _update_remote(remote, table, tab, prim_key, rows): #pylint: disable=W0613
+        """Update server rows, rows are dicts with the server ID as
+        REMOTE_ID."""
+        keys = [key for key in rows[0] if key != REMOTE_ID]
+        remote.execute(
+            tab.update().where(prim_key == sqlalchemy.bindparam(REMOTE_ID))
+            .values({key: sqlalchemy.bindparam(key) for key in keys}), rows)
+
+    @staticmethod
+    def _get_watermark(local, table):
+        """Returns the last pushed local ID of table and the last local ID
+        of a batch that was being pushed (None if there is none)."""
+        row = local.execute(
+            sqlalchemy.select([WATERMARK.c.last_pk, WATERMARK.c.pending_pk])
+            .where(WATERMARK.c.tablename == table)).fetchone()
+        return (row[0], row[1]) if row is not None else (0, None)
+
+    @staticmethod
+    def _set_watermark(local, table, last_pk, pending_pk=None):
+        updated = local.execute(
+            WATERMARK.update().where(WATERMARK.c.tablename == table)
+            .values(last_pk=last_pk, pending_pk=pending_pk))
+        if updated.rowcount == 0:
+            local.execute(WATERMARK.insert(),
+                          {"tablename": table, "last_pk": last_pk,
+                           "pending_pk": pending_pk})
@@ -0,0 +1,32 @@
+"""Fixtures of the DBHandler tests. The sample model runs on a SQLite file
+in the temporary directory of the test."""
+import os
+
+import pytest
+import yaml
+
+from DBHandler.modules.dbhandler import DBHandler
+
+MODELS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "modules", "dbhandler", "models")
+
+
+@pytest.fixture
+def sample_model(tmp_path):
+    """Returns the path of the sample model, moved to a SQLite DB."""
+    with open(os.path.join(MODELS, "sample", "sample.yml"), "r") as cfg:
+        db_cfg = yaml.load(cfg, Loader=yaml.FullLoader)
+    db_cfg["engine"] = "sqlite"
+    db_cfg["sqlite"] = {"path": str(tmp_path / "sample.db")}
+    path = tmp_path / "sample.yml"
+    with open(path, "w") as cfg:
+        yaml.dump(db_cfg, cfg)
+    return str(path)
+
+
+@pytest.fixture
+def handler(sample_model, monkeypatch):
+    """DBHandler of the sample model."""
+    # the module base class parses the command line of pytest otherwise
+    monkeypatch.setattr("sys.argv", ["DBHandler"])
+    return DBHandler(sample_model)
@@ -0,0 +1,25 @@
+"""Tests of the asyncio API."""
+import asyncio
+
+from DBHandler.modules.dbhandler.aio import AsyncDBHandler
+
+
+def test_calls_inside_iterate(handler):
+    """The iteration does not occupy a worker, calls awaited inside it
+    are served by a single worker."""
+    handler.store_rows("db_probe_data", [
+        {"probe_uid": uid, "probeid": uid % 2} for uid in range(1, 11)])
+
+    async def iterate():
+        async with AsyncDBHandler(handler, max_connections=1) as adb:
+            found = []
+            async for chunk in adb.iterate("db_probe_data", chunk_size=3,
+                                           keys=["probe_uid"]):
+                for uid in chunk["probe_uid"]:
+                    rows = await adb.search_rows("db_probe_data",
+                                                 probe_uid=uid)
+                    found.extend(row.probe_uid for row in rows)
+            return found
+
+    found = asyncio.run(iterate())
+    assert found == list(range(1, 11))
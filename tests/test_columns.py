@@ -0,0 +1,24 @@
+"""Tests of the columnar inserts."""
+import datetime
+
+from DBHandler.modules.dbhandler.dbhandler import Columns
+
+TIME = datetime.datetime(2019, 6, 1, 12, 0, 0)
+
+
+def test_columns_stored_like_rows(handler):
+    """store_columns passes the values through the bind processors of the
+    column types, the stored values equal those of an ORM insert."""
+    handler.store_rows("db_probe_data", [
+        {"probe_uid": 1, "probeid": 1, "datax": 1.0, "time": TIME}])
+    handler.store_columns("db_probe_data", Columns(
+        probe_uid=[2, 3], probeid=1, datax=[1.0, 2.0], time=[TIME, TIME]))
+
+    stored = handler.session.execute(
+        "SELECT probe_uid, probeid, datax, time FROM probe_data "
+        "ORDER BY probe_uid").fetchall()
+    assert tuple(stored[1][1:]) == tuple(stored[0][1:])
+    assert stored[2][3] == stored[0][3]
+    obj = handler.dbt.obj("db_probe_data")
+    assert handler.session.query(obj.probe_uid)\
+        .filter(obj.time == TIME).count() == 3
@@ -0,0 +1,31 @@
+"""Tests of the Parquet export."""
+import datetime
+
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def _rows(first, count):
+    return [{"probe_uid": uid, "probeid": 1, "datax": float(uid),
+             "time": datetime.datetime(2019, 6, 1, 12, 0, uid)}
+            for uid in range(first, first + count)]
+
+
+def test_incremental_export_by_prim_key(handler, tmp_path):
+    """The pk of probe_data is not its first column, an incremental export
+    must neither repeat rows nor replace the files of an earlier one."""
+    root = str(tmp_path / "archive")
+    handler.store_rows("db_probe_data", _rows(1, 5))
+    report = handler.export_parquet("db_probe_data", root, incremental=True)
+    assert report["rows"] == 5
+    assert report["last_pk"] == 5
+
+    handler.store_rows("db_probe_data", _rows(6, 5))
+    report = handler.export_parquet("db_probe_data", root, incremental=True)
+    assert report["rows"] == 5
+    assert report["last_pk"] == 10
+
+    uids = pq.read_table(str(tmp_path / "archive" / "db_probe_data"))\
+        .column("probe_uid").to_pylist()
+    assert sorted(uids) == list(range(1, 11))
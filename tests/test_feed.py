@@ -0,0 +1,44 @@
+"""Tests of the change feed."""
+import time
+
+from DBHandler.modules.dbhandler.feed import ChangeFeed
+
+
+def _store(handler, *uids):
+    handler.store_rows("db_probe_data", [{"probe_uid": uid, "probeid": 1}
+                                         for uid in uids])
+
+
+def _uids(batch):
+    return [row["probe_uid"] for row in batch["rows"]]
+
+
+def test_cursor_held_before_gap(handler):
+    """A missing primary key may be a transaction in flight, the cursor
+    stays before it until the row is committed."""
+    feed = ChangeFeed(handler.dbt, handler.engine, grace=30)
+    _store(handler, 1, 2, 4)
+    batch = feed.changes("db_probe_data", 0)
+    assert _uids(batch) == [1, 2]
+    assert batch["cursor"] == 2
+    _store(handler, 3)
+    batch = feed.changes("db_probe_data", batch["cursor"])
+    assert _uids(batch) == [3, 4]
+    assert batch["cursor"] == 4
+
+
+def test_gap_skipped_after_grace(handler):
+    """A gap older than the grace period is a rolled back insert."""
+    feed = ChangeFeed(handler.dbt, handler.engine, grace=0.2)
+    _store(handler, 1, 3)
+    start = time.monotonic()
+    batch = feed.wait("db_probe_data", 1, timeout=5)
+    assert _uids(batch) == [3]
+    assert 0.2 <= time.monotonic() - start < 5
+
+
+def test_sqlite_feed_has_no_grace(handler):
+    """SQLite serializes its writers, rows beyond a gap are returned."""
+    _store(handler, 1, 3)
+    assert handler.feed.grace == 0
+    assert _uids(handler.changes("db_probe_data", 0)) == [1, 3]
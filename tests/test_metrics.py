@@ -0,0 +1,66 @@
+"""Tests of the upload metrics."""
+import threading
+
+import pytest
+
+from DBHandler.modules.dbhandler import DBHandler
+
+
+def _container(points):
+    return {"header": {"measurement": "iv", "name": "sensor",
+                       "project": "test", "operator": "tester",
+                       "date": "2019-06-01 12:00:00", "temperature": 20.,
+                       "humidity": 30., "cerntimestamp": 0, "flag": "good",
+                       "guardring": True, "station": 1},
+            "data": [{"voltage": float(point), "current": 1e-9 * point,
+                      "timestamp": "2019-06-01 12:00:00",
+                      "temperature": 20., "humidity": 30.,
+                      "biascurrent": 0.} for point in range(points)]}
+
+
+@pytest.fixture
+def metered(sample_model, monkeypatch):
+    """Sample model handler with metrics and a sensor to upload to."""
+    monkeypatch.setattr("sys.argv", ["DBHandler"])
+    handler = DBHandler(sample_model, config={"module": {"metrics": True}})
+    handler.add_item("db_info", {"name": "sensor", "project": "test"})
+    return handler
+
+
+def _round_trips(handler):
+    return handler.metrics.snapshot()["histograms"][
+        ("dbhandler_upload_round_trips", ())]
+
+
+def test_concurrent_upload_round_trips(metered):
+    """Every upload records the statements of its own thread."""
+    assert metered.upload_data(_container(20)) is not False
+    single = _round_trips(metered)["sum"]
+    assert single > 0
+
+    def upload():
+        metered.session_copy().upload_data(_container(20))
+    threads = [threading.Thread(target=upload) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    histogram = _round_trips(metered)
+    assert histogram["count"] == 7
+    assert histogram["sum"] == 7 * single
+    assert metered.session.execute(
+        "SELECT COUNT(*) FROM probe_data").scalar() == 7 * 20
+
+
+def test_chunked_upload_metrics(metered):
+    """upload_chunks records its stages per chunk and its round trips once
+    per upload."""
+    container = _container(25)
+    assert metered.upload_chunks(container["header"],
+                                 [container["data"][:10],
+                                  container["data"][10:]]) is True
+    histograms = metered.metrics.snapshot()["histograms"]
+    assert histograms[("dbhandler_stage_seconds",
+                       (("stage", "store_data"),))]["count"] == 2
+    assert _round_trips(metered)["count"] == 1
+    assert metered.metrics.value("dbhandler_uploads_total") == 1
@@ -0,0 +1,52 @@
+"""Tests of the NestedLoader."""
+from sqlalchemy.dialects.mysql.mysqlconnector import \
+    MySQLDialect_mysqlconnector
+
+from DBHandler.modules.dbhandler.dbhandler import Columns
+from DBHandler.modules.dbhandler.nested import NestedLoader
+
+
+class _Result():
+    def __init__(self, lastrowid=None, scalar=None):
+        self.lastrowid = lastrowid
+        self._scalar = scalar
+
+    def scalar(self):
+        return self._scalar
+
+
+class _MySQLConnection():
+    """Connection of a MySQL server that generates IDs with an
+    auto_increment_increment of 2 and accepts small packets."""
+    dialect = MySQLDialect_mysqlconnector(paramstyle="format")
+
+    def __init__(self, max_packet):
+        self.variables = {"@@auto_increment_increment": 2,
+                          "@@max_allowed_packet": max_packet}
+        self.next_id = 11
+        self.statements = []
+
+    def execute(self, statement, params=()):
+        if statement.startswith("SELECT @@"):
+            return _Result(scalar=self.variables[statement[7:]])
+        # length of the statement with quoted values
+        self.statements.append(len(statement) - 2 * statement.count("%s")
+                               + sum(len(str(value)) + 2
+                                     for value in params))
+        first = self.next_id
+        self.next_id += 2 * (statement.count("), (") + 1)
+        return _Result(lastrowid=first)
+
+
+def test_mysql_generated_ids(handler):
+    """The IDs of a multi-row INSERT are auto_increment_increment apart,
+    the rows are split to fit into max_allowed_packet."""
+    conn = _MySQLConnection(max_packet=2000)
+    loader = NestedLoader(handler.engine, handler.dbt)
+    ids = loader.insert_generated(
+        conn, handler.dbt.obj("db_probe").__table__, "probeid",
+        Columns(operator=["operator {}".format(index)
+                          for index in range(100)]))
+    assert len(conn.statements) > 1
+    assert max(conn.statements) <= 1000
+    assert ids == range(11, 211, 2)
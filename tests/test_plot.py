@@ -0,0 +1,63 @@
+"""Tests of the plot endpoint."""
+import datetime
+import json
+
+import pytest
+
+from DBHandler.modules.dbhandler import DBHandler
+from DBHandler.modules.dbhandler.aggregate import aggregate_columns, \
+    lttb_columns
+
+
+@pytest.fixture
+def client(sample_model, monkeypatch):
+    """Test client of the REST API of a sample model handler with a curve
+    of five points, one per second."""
+    monkeypatch.setattr("sys.argv", ["DBHandler"])
+    handler = DBHandler(sample_model, start_flask=True, testing=True)
+    handler.store_rows("db_probe_data", [
+        {"probe_uid": uid, "probeid": 1, "datay": float(uid),
+         "time": datetime.datetime(2019, 6, 1, 12, 0, uid)}
+        for uid in range(5)])
+    return handler.app.test_client()
+
+
+@pytest.mark.parametrize("reduce", ["points=3", "buckets=2"])
+def test_plot_datetime_x(client, reduce):
+    """DateTime x values are returned as strings."""
+    response = client.get("/plot/db_probe_data?x=time&y=datay&" + reduce,
+                          headers={"Accept": "application/json"})
+    assert response.status_code == 200
+    curve = json.loads(response.data)
+    assert curve["time"]
+    assert all(value.startswith("2019-06-01 12:00:0")
+               for value in curve["time"])
+
+
+
+def test_reduce_in_memory(handler):
+    """Curves of packed tables are reduced in memory, like the curves stored
+    in rows are reduced in SQL."""
+    handler.store_rows("db_probe_data", [
+        {"probe_uid": uid, "probeid": 1, "datay": float(uid % 3),
+         "time": datetime.datetime(2019, 6, 1, 12, 0, uid)}
+        for uid in range(10)])
+    curve = handler.get_columns("db_probe_data", 1, ["time", "datay"])
+    in_memory = aggregate_columns(curve, "time", ["datay"], 4)
+    in_sql = handler.aggregate("db_probe_data", "time", "datay", buckets=4,
+                               filters={"probeid": 1})
+    # julianday of SQLite loses some microseconds
+    assert all(abs(first - second) < datetime.timedelta(milliseconds=1)
+               for first, second in zip(in_memory.pop("time"),
+                                        in_sql.pop("time")))
+    assert in_memory == in_sql
+    assert lttb_columns(curve, "time", "datay", 4) == handler.downsample(
+        "db_probe_data", "time", "datay", 4, filters={"probeid": 1})
+
+
+def test_packed_needs_key(handler, monkeypatch):
+    """Packed tables are only reduced one curve at a time."""
+    monkeypatch.setitem(handler.packed, "db_probe_data",
+                        {"table": "db_probe_data", "key": "probeid"})
+    with pytest.raises(ValueError):
+        handler.aggregate("db_probe_data", "time", "datay")
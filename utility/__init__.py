@@ -1,7 +1,16 @@
 """ The utility config """
 from .config import Config, MCJSONEncoder
 from .old_config import load_config, get_config
-from .dict import lower_case_keys, dict_values, dict_extract
-from .template import template_extract_keys, template_substitute_data
+from .dict import lower_case_keys, dict_values, dict_extract, \
+    dict_extract_first
+from .template import template_extract_keys, template_substitute_data, \
+    compile_template
+from .transport import encode_payload, decode_payload, negotiate_encoding, \
+    negotiate_stream, ndjson_stream, arrow_stream, gzip_stream, open_stream, \
+    read_ndjson, read_arrow
+from .jsonstream import JSONContainerFile
+from .serve import create_server
+from .logshipper import BatchHTTPHandler
+from .metrics import MetricsRegistry
 from .start import StartModule
 from .registry import get_process, get_device
@@ -22,6 +22,9 @@ class Config():
         self.path = path
         self._config = None
         self._jinja_environment = None
+        # case folded copy of the config with merged global section, built
+        # on first lookup and dropped whenever the config may change
+        self._index = None
 
         if isinstance(config, str): # Save path of config and load it
             self.path = config
@@ -69,6 +72,18 @@ class Config():
         self._config = yaml.load(
             self._jinja_environment.get_template(file_name).render(),
             Loader=yaml.FullLoader)
+        self._invalidate()
+
+    def _invalidate(self):
+        self._index = None
+
+    def _get_index(self):
+        index = self._index
+        if index is None:
+            index = Config.lower_case_keys(
+                Config.copy_global_section(self._config))
+            self._index = index
+        return index
 
     def keys(self, lower_case=True):
         """ Returns all or only (deep=False) the top-level keys of the config
@@ -96,15 +111,20 @@ class Config():
                 else:
                     values.append(value)
             return values
+        # the values can be modified in place
+        self._invalidate()
         return self._config.values()
 
     def items(self):
         """ Return items of the dictionary """
+        self._invalidate()
         return self._config.items()
 
     @property
     def dictionary(self):
         """ Get the config dictionary """
+        # the dictionary can be modified in place
+        self._invalidate()
         return self._config
 
     @dictionary.setter
@@ -119,6 +139,7 @@ class Config():
         """
         if isinstance(dictionary, dict):
             self._config = dictionary
+            self._invalidate()
         else:
             raise TypeError(f"{dictionary} has to be a dictionary!")
 
@@ -155,6 +176,7 @@ class Config():
 
         """
         self._config[key] = value
+        self._invalidate()
 
     def get(self, keys, default=None, case_sensitive=False, #pylint: disable=R0913
             lower_case_keys=True, resolve_path=True, copy_global=True):
@@ -181,6 +203,10 @@ class Config():
         if isinstance(keys, str):
             keys = [keys]
 
+        # The default lookup is served from the case folded index
+        if copy_global and lower_case_keys and not case_sensitive:
+            return self._indexed_get(keys, default, resolve_path)
+
         # Copy global section
         if copy_global:
             tmp_config = Config.copy_global_section(self._config)
@@ -203,6 +229,24 @@ class Config():
             return os.path.join(os.path.dirname(self.path), value)
         return value
 
+    def _indexed_get(self, keys, default, resolve_path):
+        """ Lookup keys in the index. The index is not copied or lower
+        cased again, a sub-config gets a copy of its part of the index. """
+        value = self._get_index()
+        try:
+            for key in keys:
+                value = value[key.lower() if isinstance(key, str) else key]
+        except (KeyError, TypeError):
+            return default
+
+        if isinstance(value, dict):
+            return Config(Config.copy_dicts(value), path=self.path)
+
+        if isinstance(value, str) and value.startswith('.') and resolve_path:
+            # Assume that strings starting with '.' are paths
+            return os.path.join(os.path.dirname(self.path), value)
+        return value
+
     @staticmethod
     def lower_case_keys(dictionary, deep=True):
         """ Lower case all keys in a dictionary
@@ -225,6 +269,12 @@ class Config():
                 dictionary[key] = Config.lower_case_keys(dictionary[key])
         return dictionary
 
+    @staticmethod
+    def copy_dicts(dictionary):
+        """ Copy a dictionary and all its sub dictionaries """
+        return {key: Config.copy_dicts(value) if isinstance(value, dict) \
+                    else value for key, value in dictionary.items()}
+
     @staticmethod
     def deep_lookup(dictionary, key_list, case_sensitive=False):
         """ Return value of key_list in dictionary """
@@ -33,3 +33,39 @@ def dict_extract(key, obj):
                 for item in ivalue:
                     for result in dict_extract(key, item):
                         yield result
+
+def dict_extract_first(keys, obj):
+    """ Get the first value of every key in one traversal of obj
+
+    Walks obj in the same order as dict_extract and stops as soon as all
+    keys are found.
+
+    Args:
+        keys (iterable): Lower case keys to look for
+        obj (dict, list): Nested dictionaries and lists
+
+    Returns:
+        Dict of key and first matching value, missing keys are omitted
+    """
+    found = {}
+    missing = set(keys)
+
+    def _walk(item):
+        if hasattr(item, "items"):
+            for ikey, ivalue in item.items():
+                lkey = ikey.lower() if isinstance(ikey, str) else ikey
+                if lkey in missing:
+                    found[lkey] = ivalue
+                    missing.discard(lkey)
+                    if not missing:
+                        return True
+                if isinstance(ivalue, dict) and _walk(ivalue):
+                    return True
+                if isinstance(ivalue, list) \
+                        and any(_walk(element) for element in ivalue):
+                    return True
+        return False
+
+    if missing:
+        _walk(obj)
+    return found
@@ -0,0 +1,197 @@
+""" Incremental JSON container reader
+
+json.load needs the whole document and all of its parsed objects in
+memory. The JSONContainerFile memory-maps a file that holds one JSON object
+and parses its top-level fields eagerly, except for one large array (e.g.
+'data') whose elements are parsed one at a time. The elements are decoded
+by the C scanner of the json module (JSONDecoder.raw_decode) from a sliding
+window of the file, so memory is bounded by the window size and the
+largest element, not by the file size.
+"""
+
+import codecs
+import json
+import mmap
+
+_WHITESPACE = " \t\n\r"
+
+
+class _Scanner():
+    """ Sliding window over the UTF-8 text of a buffer """
+
+    def __init__(self, buf, window):
+        self._buf = buf
+        self._window = window
+        self._decoder = json.JSONDecoder()
+        self.seek(0)
+
+    def seek(self, offset):
+        """ Continue scanning at byte offset """
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._text = ""
+        self._index = 0
+        self._base = offset
+        self._next = offset
+
+    def tell(self):
+        """ Byte offset of the scan position """
+        return self._base + len(self._text[:self._index].encode("utf-8"))
+
+    def _fill(self):
+        if self._next >= len(self._buf):
+            return False
+        chunk = self._buf[self._next:self._next + self._window]
+        self._next += len(chunk)
+        self._base += len(self._text[:self._index].encode("utf-8"))
+        self._text = self._text[self._index:] + self._utf8.decode(
+            chunk, final=self._next >= len(self._buf))
+        self._index = 0
+        return True
+
+    def peek(self):
+        """ Skip whitespace, return the next character ('' at the end) """
+        while True:
+            while self._index < len(self._text) \
+                    and self._text[self._index] in _WHITESPACE:
+                self._index += 1
+            if self._index < len(self._text):
+                return self._text[self._index]
+            if not self._fill():
+                return ""
+
+    def next_char(self):
+        """ Return and consume the next non-whitespace character """
+        char = self.peek()
+        self._index += len(char)
+        return char
+
+    def expect(self, chars):
+        """ Consume the next character, it has to be one of chars """
+        char = self.next_char()
+        if not char or char not in chars:
+            raise ValueError("Expected '{0}' at byte {1}, got '{2}'".format(
+                chars, self.tell(), char))
+        return char
+
+    def value(self):
+        """ Parse the next JSON value """
+        while True:
+            self.peek()
+            try:
+                obj, end = self._decoder.raw_decode(self._text, self._index)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a value at the end of the window may continue (e.g. numbers)
+            if end == len(self._text) and self._fill():
+                continue
+            self._index = end
+            return obj
+
+
+class JSONContainerFile():
+    """ Memory-mapped JSON object whose array 'stream_key' is read
+    incrementally
+
+        with JSONContainerFile("pulses.json") as container:
+            header = container.fields["header"]
+            for rows in container.chunks(10000):
+                ...
+
+    Args:
+        path (str): JSON file containing one object
+        stream_key (str): Top-level key of the array that is streamed
+        required (tuple): Top-level keys that are parsed before the array
+                          is streamed. If they follow the array in the
+                          file, the array is skipped once to find them.
+        window (int): Bytes that are decoded at once
+    """
+
+    def __init__(self, path, stream_key="data", required=("header",),
+                 window=1 << 20):
+        self.path = path
+        self.stream_key = stream_key
+        self.fields = {}
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("Empty JSON file {0}".format(path))
+        self._scanner = _Scanner(self._map, window)
+        self._stream_offset = None
+        self._complete = False
+        self._scanner.expect("{")
+        self._scan(required)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """ Unmap and close the file """
+        self._map.close()
+        self._file.close()
+
+    def _scan(self, required=()):
+        """ Parse top-level fields until the stream array is reached and all
+        required fields are known, or until the end of the object """
+        scanner = self._scanner
+        if scanner.peek() == "}":
+            scanner.next_char()
+            self._complete = True
+            return
+        while True:
+            key = scanner.value()
+            scanner.expect(":")
+            if key == self.stream_key:
+                self._stream_offset = scanner.tell()
+                if all(field in self.fields for field in required):
+                    return
+                for _ in self._iter_array():
+                    pass
+            else:
+                self.fields[key] = scanner.value()
+            if scanner.expect(",}") == "}":
+                self._complete = True
+                return
+
+    def _iter_array(self):
+        scanner = self._scanner
+        scanner.expect("[")
+        if scanner.peek() == "]":
+            scanner.next_char()
+            return
+        while True:
+            yield scanner.value()
+            if scanner.expect(",]") == "]":
+                return
+
+    def rows(self):
+        """ Yield the elements of the stream array one by one. Fields that
+        follow the array are added to self.fields afterwards. """
+        if self._stream_offset is None:
+            return
+        self._scanner.seek(self._stream_offset)
+        for row in self._iter_array():
+            yield row
+        if not self._complete:
+            if self._scanner.expect(",}") == ",":
+                self._scan()
+            else:
+                self._complete = True
+
+    def chunks(self, size):
+        """ Yield the elements of the stream array in lists of size """
+        chunk = []
+        for row in self.rows():
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
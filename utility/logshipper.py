@@ -0,0 +1,201 @@
+""" Batched HTTP log shipping utility module
+
+logging.handlers.HTTPHandler sends one synchronous POST per log record on
+the thread that logs. The BatchHTTPHandler only puts records into a bounded
+queue. A background listener POSTs them to the logcollector in batches,
+either every 'batch_size' records or every 'flush_interval' seconds. The
+body of the POSTs is set by 'body_format':
+
+    - 'json' (default): one POST per batch with a JSON array of record
+      dicts (see logging.makeLogRecord)
+    - 'form': one form-encoded record per POST, like HTTPHandler, for
+      logcollectors that only read form bodies. The records of a batch
+      reuse one keep-alive connection, but every record is a round trip.
+
+The calling thread is never blocked. Once the queue is half full, records
+below WARNING are sampled (1 of 'sample_rate' is kept). When the queue is
+full, records are dropped. Both cases are counted, see stats().
+"""
+
+import copy
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import reprlib
+import threading
+import time
+from urllib.parse import urlencode
+
+import requests
+
+
+class _BatchListener(QueueListener):
+    """ QueueListener that hands records to a callback in batches """
+
+    def __init__(self, record_queue, send, batch_size, flush_interval):
+        super().__init__(record_queue)
+        self._send = send
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+
+    def _monitor(self):
+        batch = []
+        deadline = None
+        stop = False
+        while not stop:
+            timeout = None if deadline is None \
+                else max(deadline - time.monotonic(), 0)
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+            if record is self._sentinel:
+                stop = True
+            elif record is not None:
+                batch.append(record)
+                if deadline is None:
+                    deadline = time.monotonic() + self._flush_interval
+            if batch and (stop or len(batch) >= self._batch_size
+                          or time.monotonic() >= deadline):
+                self._send(batch)
+                batch = []
+                deadline = None
+
+    def enqueue_sentinel(self):
+        # the queue may be full, block until the sentinel fits
+        self.queue.put(self._sentinel)
+
+
+class BatchHTTPHandler(QueueHandler): # pylint: disable=R0902
+    """ Non-blocking log handler that ships batches of records via HTTP """
+
+    def __init__(self, host, url='/log', batch_size=100, # pylint: disable=R0913
+                 flush_interval=0.5, queue_size=10000, sample_rate=10,
+                 max_message_length=10000, timeout=5, body_format='json'):
+        """
+        Args:
+            host (str): 'ip:port' of the logcollector
+            url (str): Path the batches are POSTed to
+            batch_size (int): Maximum number of records per POST
+            flush_interval (float): Maximum age of a batch in seconds
+            queue_size (int): Maximum number of queued records
+            sample_rate (int): Keep 1 of sample_rate records below WARNING
+                               while the queue is more than half full
+            max_message_length (int): Truncate longer messages
+            timeout (float): Timeout of a POST in seconds
+            body_format (str): 'json' (one JSON array per batch) or
+                               'form' (one form-encoded record per POST,
+                               like HTTPHandler)
+        """
+        if body_format not in ('form', 'json'):
+            raise ValueError("Unknown body format '{0}'".format(body_format))
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.url = "http://{0}{1}".format(host, url)
+        self.sample_rate = max(int(sample_rate), 1)
+        self.max_message_length = max_message_length
+        self.timeout = timeout
+        self.body_format = body_format
+        # bounded representations of container arguments
+        self._repr = reprlib.Repr()
+        self._repr.maxlevel = 3
+        self._repr.maxstring = self._repr.maxother = max_message_length or 1
+        self._repr.maxdict = self._repr.maxlist = self._repr.maxtuple = 100
+        self._repr.maxset = self._repr.maxfrozenset = 100
+        self._high_water = queue_size // 2
+        self._counter_lock = threading.Lock()
+        self._counters = {'queued': 0, 'sampled': 0, 'dropped': 0,
+                          'sent': 0, 'failed': 0}
+        self._sample_counter = 0
+        self._session = requests.Session()
+        self._listener = _BatchListener(self.queue, self._send, batch_size,
+                                        flush_interval)
+        self._listener.start()
+
+    def _count(self, counter, number=1):
+        with self._counter_lock:
+            self._counters[counter] += number
+
+    def stats(self):
+        """ Return the counters of queued, sampled, dropped, sent and failed
+        records """
+        with self._counter_lock:
+            return dict(self._counters)
+
+    def _shorten(self, value):
+        """ Shortened string or container argument of a message """
+        if isinstance(value, str):
+            return value[:self.max_message_length + 1]
+        if isinstance(value, (dict, list, tuple, set, frozenset)):
+            return self._repr.repr(value)
+        return value
+
+    def prepare(self, record):
+        """ Merge message and arguments and truncate long messages. Long
+        string and container arguments are shortened before the message is
+        formatted. """
+        if self.max_message_length:
+            record = copy.copy(record)
+            if isinstance(record.args, dict):
+                record.args = {key: self._shorten(value)
+                               for key, value in record.args.items()}
+            elif record.args:
+                record.args = tuple(self._shorten(arg) for arg in record.args)
+            elif isinstance(record.msg, str):
+                record.msg = record.msg[:self.max_message_length + 1]
+        record = super().prepare(record)
+        if self.max_message_length \
+                and len(record.msg) > self.max_message_length:
+            record.msg = "{0}... [truncated]".format(
+                record.msg[:self.max_message_length])
+        return record
+
+    def emit(self, record):
+        """ Queue the record unless it is sampled out or the queue is full.
+        The message is only formatted if the record is queued. """
+        if record.levelno < logging.WARNING \
+                and self.queue.qsize() >= self._high_water:
+            with self._counter_lock:
+                self._sample_counter += 1
+                sampled = self._sample_counter % self.sample_rate
+            if sampled:
+                self._count('sampled')
+                return
+        try:
+            self.enqueue(self.prepare(record))
+        except queue.Full:
+            self._count('dropped')
+        except Exception: # pylint: disable=W0703
+            self.handleError(record)
+        else:
+            self._count('queued')
+
+    def enqueue(self, record):
+        self.queue.put_nowait(record)
+
+    def _send(self, records):
+        if self.body_format == 'json':
+            self._post(json.dumps([dict(record.__dict__)
+                                   for record in records], default=str),
+                       'application/json', len(records))
+            return
+        for record in records:
+            self._post(urlencode(dict(record.__dict__)),
+                       'application/x-www-form-urlencoded', 1)
+
+    def _post(self, body, content_type, records):
+        try:
+            self._session.post(self.url, data=body, timeout=self.timeout,
+                               headers={'Content-Type': content_type})
+        except requests.RequestException:
+            self._count('failed', records)
+        else:
+            self._count('sent', records)
+
+    def close(self):
+        """ Ship the remaining records and stop the listener """
+        with self._counter_lock:
+            listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.stop()
+        super().close()
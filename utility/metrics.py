@@ -0,0 +1,182 @@
+""" Metrics utility module
+
+A small, thread-safe registry of counters and histograms that can be
+rendered in the Prometheus text exposition format. Every module owns a
+registry (Module.metrics) that is exported by the '/metrics' endpoint.
+
+A disabled registry ignores all calls, and its timer() returns a shared
+no-op context manager, so instrumented code paths cost one method call.
+"""
+
+import bisect
+import threading
+import time
+
+# Prometheus default buckets in seconds
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+class Histogram():
+    """ Cumulative histogram with fixed upper bounds """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        """ Add value to the histogram """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ Return list of (upper bound, cumulative count) """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class _NullTimer():
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer():
+    def __init__(self, registry, name, labels):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self._registry.observe(self._name, time.perf_counter() - self._start,
+                               **self._labels)
+        return False
+
+
+class MetricsRegistry():
+    """ Registry of labelled counters and histograms """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, text):
+        """ Set the HELP text of a metric """
+        self._help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        """ Increase counter name by value """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=None, **labels):
+        """ Add value to histogram name """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            try:
+                histogram = self._histograms[key]
+            except KeyError:
+                histogram = Histogram(buckets or DEFAULT_BUCKETS)
+                self._histograms[key] = histogram
+            histogram.observe(value)
+
+    def timer(self, name, **labels):
+        """ Context manager that observes its runtime in histogram name """
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def value(self, name, **labels):
+        """ Return the value of a counter, 0 if it was never increased """
+        return self._counters.get(self._key(name, labels), 0)
+
+    def snapshot(self):
+        """ Return all metrics as dict, e.g. for tests
+
+        Returns:
+            {'counters': {(name, labels): value},
+             'histograms': {(name, labels): {'count': .., 'sum': ..,
+                                             'buckets': [(le, count)]}}}
+        """
+        with self._lock:
+            return {'counters': dict(self._counters),
+                    'histograms': {key: {'count': hist.count,
+                                         'sum': hist.sum,
+                                         'buckets': hist.cumulative()}
+                                   for key, hist in self._histograms.items()}}
+
+    def reset(self):
+        """ Remove all recorded values """
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ""
+        return "{" + ",".join('{0}="{1}"'.format(
+            key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                              for key, value in labels) + "}"
+
+    @staticmethod
+    def _format_bound(bound):
+        return "+Inf" if bound == float('inf') else repr(float(bound))
+
+    def render_prometheus(self):
+        """ Return all metrics in the Prometheus text exposition format """
+        snapshot = self.snapshot()
+        lines = []
+        for kind, metrics in (('counter', snapshot['counters']),
+                              ('histogram', snapshot['histograms'])):
+            described = set()
+            for (name, labels), value in sorted(metrics.items()):
+                if name not in described:
+                    if name in self._help:
+                        lines.append("# HELP {0} {1}".format(
+                            name, self._help[name]))
+                    lines.append("# TYPE {0} {1}".format(name, kind))
+                    described.add(name)
+                if kind == 'counter':
+                    lines.append("{0}{1} {2}".format(
+                        name, self._format_labels(labels), value))
+                    continue
+                for bound, count in value['buckets']:
+                    lines.append("{0}_bucket{1} {2}".format(
+                        name, self._format_labels(
+                            labels, [('le', self._format_bound(bound))]),
+                        count))
+                lines.append("{0}_sum{1} {2}".format(
+                    name, self._format_labels(labels), value['sum']))
+                lines.append("{0}_count{1} {2}".format(
+                    name, self._format_labels(labels), value['count']))
+        return "\n".join(lines) + "\n"
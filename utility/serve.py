@@ -0,0 +1,217 @@
+""" Serving backend utility module
+
+Runs the flask app of a module with the backend selected in the 'server'
+entry of the module config section, e.g.
+
+    server:
+        backend: waitress    # werkzeug (default), waitress or gunicorn
+        threads: 8           # worker threads (per worker process)
+        workers: 4           # worker processes, gunicorn only
+        keepalive: 5         # seconds an idle connection is kept open
+        backlog: 1024        # queue length of the listening socket
+        connection_limit: 100
+        debug: False         # werkzeug only
+
+Every server can be stopped from within a request (see the '/interrupt'
+endpoint), so no backend relies on 'werkzeug.server.shutdown'.
+
+Gunicorn forks its workers after the module was initialized. The
+before_fork and after_fork hooks of the module (e.g. of the DBHandler,
+which must not share DB connections between processes) are called in the
+arbiter before every fork and in every new worker.
+"""
+
+import logging
+import os
+import signal
+import threading
+
+try:
+    import waitress
+except (ImportError, ModuleNotFoundError):
+    waitress = None
+try:
+    from gunicorn.app.base import BaseApplication
+except (ImportError, ModuleNotFoundError):
+    BaseApplication = object
+
+# delay before a shutdown triggered by a request is executed, so that the
+# response of that request can still be delivered
+SHUTDOWN_DELAY = 0.1
+
+DEFAULTS = {'backend': 'werkzeug',
+            'threads': 8,
+            'workers': 1,
+            'keepalive': 5,
+            'backlog': 1024,
+            'connection_limit': 100,
+            'debug': False}
+
+
+class Server():
+    """ Serving backend base class """
+
+    # the server has to run in the main thread of the process
+    main_thread = False
+
+    def __init__(self, app, host, port, config, **hooks): # pylint: disable=unused-argument
+        self.app = app
+        self.host = host
+        self.port = port
+        self.config = config
+        self.log = logging.getLogger("MC.{0}".format(self.__class__.__name__))
+
+    def run(self):
+        """ Serve requests until shutdown() is called. Blocks. """
+        raise NotImplementedError
+
+    def shutdown(self):
+        """ Stop serving. May be called from a request handler. """
+        timer = threading.Timer(SHUTDOWN_DELAY, self._shutdown)
+        timer.daemon = True
+        timer.start()
+
+    def _shutdown(self):
+        raise NotImplementedError
+
+
+class WerkzeugServer(Server):
+    """ Threaded werkzeug development server """
+
+    def __init__(self, app, host, port, config, **hooks): # pylint: disable=unused-argument
+        from werkzeug.serving import make_server
+        super().__init__(app, host, port, config)
+        app.debug = config['debug']
+        self._server = make_server(host, port, app, threaded=True)
+
+    def run(self):
+        self.log.info("Serving on %s:%s (werkzeug)", self.host, self.port)
+        self._server.serve_forever()
+
+    def _shutdown(self):
+        self._server.shutdown()
+
+
+class WaitressServer(Server):
+    """ Waitress production server with a thread pool """
+
+    def __init__(self, app, host, port, config, **hooks): # pylint: disable=unused-argument
+        super().__init__(app, host, port, config)
+        if waitress is None:
+            raise ImportError("Server backend 'waitress' is not installed")
+        # socket map of the server, its listener and its (keep-alive)
+        # channels, run() returns when it is empty
+        self._map = {}
+        self._server = waitress.create_server(
+            app, map=self._map, host=host, port=port,
+            threads=config['threads'],
+            backlog=config['backlog'],
+            connection_limit=config['connection_limit'],
+            channel_timeout=config['keepalive'])
+
+    def run(self):
+        self.log.info("Serving on %s:%s (waitress, %s threads)",
+                      self.host, self.port, self.config['threads'])
+        self._server.run()
+
+    def _shutdown(self):
+        self._server.task_dispatcher.shutdown(cancel_pending=False)
+        # the channels belong to the thread of the asyncore loop
+        self._server.trigger.pull_trigger(self._close_channels)
+
+    def _close_channels(self):
+        for channel in list(self._map.values()):
+            if channel not in (self._server, self._server.trigger):
+                channel.close()
+        # closes the listener and the trigger
+        self._server.close()
+
+
+class _GunicornApplication(BaseApplication): # pylint: disable=W0223
+    def __init__(self, app, options):
+        self.application = app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+class GunicornServer(Server):
+    """ Gunicorn pre-fork server with a pool of worker processes. The
+    arbiter installs signal handlers and has to run in the main thread.
+
+    Hooks (callables without arguments):
+        before_fork: called in the arbiter before a worker is forked
+        after_fork: called in the new worker before it handles requests
+    """
+
+    main_thread = True
+
+    def __init__(self, app, host, port, config, before_fork=None, # pylint: disable=too-many-arguments
+                 after_fork=None):
+        super().__init__(app, host, port, config)
+        if BaseApplication is object:
+            raise ImportError("Server backend 'gunicorn' is not installed")
+        self._arbiter_pid = None
+        options = {'bind': '{0}:{1}'.format(host, port),
+                   'workers': config['workers'],
+                   'threads': config['threads'],
+                   'keepalive': config['keepalive'],
+                   'backlog': config['backlog'],
+                   'worker_connections': config['connection_limit']}
+        # gunicorn calls the hooks with its arbiter and worker objects
+        if before_fork is not None:
+            options['pre_fork'] = lambda server, worker: before_fork()
+        if after_fork is not None:
+            options['post_fork'] = lambda server, worker: after_fork()
+        self._application = _GunicornApplication(app, options)
+
+    def run(self):
+        self.log.info("Serving on %s:%s (gunicorn, %s workers)",
+                      self.host, self.port, self.config['workers'])
+        self._arbiter_pid = os.getpid()
+        try:
+            self._application.run()
+        except SystemExit:
+            # the arbiter exits after a graceful shutdown, forked workers
+            # must not return into the module code
+            if os.getpid() != self._arbiter_pid:
+                raise
+
+    def _shutdown(self):
+        # requests are handled in forked workers, ask the arbiter to stop
+        os.kill(self._arbiter_pid, signal.SIGTERM)
+
+
+BACKENDS = {'werkzeug': WerkzeugServer,
+            'waitress': WaitressServer,
+            'gunicorn': GunicornServer}
+
+
+def create_server(app, host, port, config=None, **hooks):
+    """ Create the serving backend for app
+
+    Args:
+        app (Flask): WSGI application
+        host (str): Interface to bind to
+        port (int): Port to bind to
+        config (dict, Config, None): 'server' section of the module config
+        hooks: before_fork and after_fork, used by pre-fork servers
+
+    Returns:
+        Server object, call run() to start serving
+    """
+    server_config = dict(DEFAULTS)
+    if config:
+        server_config.update(getattr(config, 'dictionary', config))
+    try:
+        backend = BACKENDS[server_config['backend']]
+    except KeyError:
+        raise ValueError("Unknown server backend {}".format(
+            server_config['backend']))
+    return backend(app, host, port, server_config, **hooks)
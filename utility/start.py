@@ -3,15 +3,15 @@ Helper module to simplify module start scripts.
 """
 
 import logging
-import logging.handlers
 from socket import error as socket_error
 import sys
 import argparse
 import requests
 from flask_cors import CORS
 from flask_restplus import Resource
-from flask import request
 from . import Config
+from .serve import create_server
+from .logshipper import BatchHTTPHandler
 
 from . import get_config
 
@@ -31,6 +31,7 @@ class Interrupt(Resource):  # pylint: disable=R0903
     def __init__(self, *args, **kwargs):
         super().__init__(self)
         self._module = args[1]
+        self._starter = args[2]
 
     def post(self):  # pylint: disable=R0201
         """Handle interrupt."""
@@ -38,10 +39,7 @@ class Interrupt(Resource):  # pylint: disable=R0903
             self._module.interrupt()
         except AttributeError:
             print("Interrupt not implemented on ", self._module)
-        func = request.environ.get('werkzeug.server.shutdown')
-        if func is None:
-            raise RuntimeError('Not running with the Werkzeug Server')
-        func()
+        self._starter.shutdown()
 
 class Alive(Resource):  # pylint: disable=R0903
     """Alive endpoint."""
@@ -94,6 +92,7 @@ class StartModule(): # pylint: disable=too-many-instance-attributes
         else:
             self._module = None
         self._api = api
+        self._server = None
         self.add_interrupt_endpoint()
         if self.registry:
             self.add_alive_endpoint()
@@ -135,7 +134,8 @@ class StartModule(): # pylint: disable=too-many-instance-attributes
 
     def run(self, app):
         """
-        Run the flask app
+        Run the flask app with the serving backend configured in the 'server'
+        entry of the module config (see utility.serve).
         """
         # Assign IP and Port
         try:
@@ -146,11 +146,17 @@ class StartModule(): # pylint: disable=too-many-instance-attributes
             port = 5010
         logging.getLogger('werkzeug').setLevel(logging.WARNING)
         CORS(app, resources={r"/*": {"origins": "*"}})
-        app.run(debug=True,
-                host=ip_addr,
-                port=port,
-                use_reloader=False,
-                threaded=True)
+        self._server = create_server(app, ip_addr, port,
+                                     self._conf.get('server'))
+        self._server.run()
+
+    def shutdown(self):
+        """
+        Stop the server started by run. Can be called from within a request.
+        """
+        if self._server is None:
+            raise RuntimeError('No server running')
+        self._server.shutdown()
 
     def register_devices(self, devices):
         """Register devices with registry. Only needed for devicemanagers."""
@@ -212,11 +218,10 @@ class StartModule(): # pylint: disable=too-many-instance-attributes
         http_handler = None
         for proc in log_collector:
             if proc['type'] == 'logcollector':
-                http_handler = logging.handlers.HTTPHandler(
+                http_handler = BatchHTTPHandler(
                     '{0}:{1}'.format(proc['ip'], proc['port']),
                     '/log',
-                    method='POST',
-                )
+                    **(self._conf.get('log_shipping') or {}))
                 http_handler.setLevel(logging.NOTSET)
         return http_handler
 
@@ -240,7 +245,7 @@ class StartModule(): # pylint: disable=too-many-instance-attributes
         Add interrupt endpoint to the module
         """
         self._api.add_resource(Interrupt, '/interrupt',
-                               resource_class_args=[self._module])
+                               resource_class_args=[self._module, self])
 
     def add_alive_endpoint(self):
         """
@@ -1,22 +1,31 @@
 """ Template utility class """
 
 import re
+from functools import lru_cache
 
 from string import Template
-from .dict import dict_extract
+from .dict import dict_extract_first
+
+TEMPLATE_KEY = re.compile(r'\$\{(\w+)\}')
 
 def template_extract_keys(string):
     """ Extract keys from a string.Template """
-    return re.findall(r'\$\{(\w+)\}', string)
+    return TEMPLATE_KEY.findall(string)
+
+@lru_cache(maxsize=256)
+def compile_template(template_string):
+    """ Return the cached string.Template and the tuple of its keys """
+    return Template(template_string), tuple(template_extract_keys(
+        template_string))
 
 def template_substitute_data(template_string, data_dictionary,
                              replacements=None):
     """ Substitute template with data from a dictionary """
-    template = Template(template_string)
-    template_keys = template_extract_keys(template_string)
-    substitutions = {}
+    template, template_keys = compile_template(template_string)
+    substitutions = dict_extract_first(template_keys, data_dictionary)
     for key in template_keys:
-        substitutions[key] = list(dict_extract(key, data_dictionary))[0]
+        if key not in substitutions:
+            raise IndexError("Key {} not found in data".format(key))
 
     if isinstance(replacements, dict):
         for key, value in substitutions.items():
@@ -0,0 +1,400 @@
+""" Payload transport utility module
+
+Modules exchange measurement containers ({"header": {...}, "data": [...]})
+over HTTP. JSON stays the default encoding, but containers with many data
+points can be sent as msgpack or as an Arrow IPC stream instead. Both binary
+encodings transmit the numeric columns of the 'data' block as packed int64 or
+float64 arrays, dates and times as strings like JSON. The body can optionally
+be compressed with zstd or lz4.
+
+Results and uploads that do not fit into memory are streamed instead: as
+NDJSON (one JSON value per line) or as Arrow IPC stream with one record
+batch per chunk, optionally gzip compressed chunk by chunk.
+"""
+
+import datetime
+import gzip
+import io
+import json
+import zlib
+
+try:
+    import numpy as np
+except (ImportError, ModuleNotFoundError):
+    np = None
+try:
+    import msgpack
+except (ImportError, ModuleNotFoundError):
+    msgpack = None
+try:
+    import pyarrow as pa
+except (ImportError, ModuleNotFoundError):
+    pa = None
+try:
+    import zstandard
+except (ImportError, ModuleNotFoundError):
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except (ImportError, ModuleNotFoundError):
+    lz4_frame = None
+
+JSON = "application/json"
+MSGPACK = "application/x-msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+CONTENT_TYPES = {'json': JSON,
+                 'msgpack': MSGPACK,
+                 'arrow': ARROW}
+ENCODINGS = {value: key for key, value in CONTENT_TYPES.items()}
+NDJSON = "application/x-ndjson"
+# encodings of streamed results, one record batch or line per chunk
+STREAM_TYPES = {'ndjson': NDJSON,
+                'arrow': ARROW}
+
+# key of the container block that is transported column-wise
+DATA_KEY = "data"
+# msgpack extension type code of numpy arrays
+NDARRAY_EXT = 1
+# arrow schema metadata key holding everything but the data block
+ARROW_HEADER = b"container"
+
+
+def _require(module, name):
+    if module is None:
+        raise ImportError("Transport requires the '{}' package".format(name))
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def rows_to_columns(rows):
+    """ Convert a list of per-point dicts into a dict of columns
+
+    Columns that only contain integers are packed into int64 arrays, other
+    numeric columns into float64 arrays. All other columns (timestamps,
+    nested subdata,...) are kept as lists.
+
+    Args:
+        rows (list): List of dicts, keys missing in a row are None
+
+    Returns:
+        Dict of column name and numpy array or list
+    """
+    _require(np, "numpy")
+    columns = {}
+    # keys of all rows in the order of their first occurrence
+    keys = dict.fromkeys(key for row in rows for key in row)
+    for key in keys:
+        column = [row.get(key) for row in rows]
+        if all(_is_number(value) for value in column):
+            integers = all(isinstance(value, int) for value in column)
+            try:
+                columns[key] = np.asarray(
+                    column, dtype=np.int64 if integers else np.float64)
+            except OverflowError:
+                columns[key] = column
+        else:
+            columns[key] = column
+    return columns
+
+
+def columns_to_rows(columns):
+    """ Convert a dict of columns back into a list of per-point dicts """
+    columns = {key: (value.tolist() if hasattr(value, 'tolist') else value)
+               for key, value in columns.items()}
+    keys = list(columns)
+    return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+
+def _has_rows(payload):
+    return isinstance(payload, dict) \
+        and isinstance(payload.get(DATA_KEY), list) \
+        and all(isinstance(row, dict) for row in payload[DATA_KEY])
+
+
+def _msgpack_default(obj):
+    if np is not None and isinstance(obj, np.ndarray):
+        return msgpack.ExtType(NDARRAY_EXT, msgpack.packb(
+            [obj.dtype.str, list(obj.shape), obj.tobytes()]))
+    if np is not None and isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, (datetime.date, datetime.time)):
+        # like the JSON encoding of results (default=str)
+        return str(obj)
+    raise TypeError("Cannot serialize {!r}".format(obj))
+
+
+def _msgpack_ext_hook(code, data):
+    if code == NDARRAY_EXT:
+        dtype, shape, buffer = msgpack.unpackb(data)
+        return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+    return msgpack.ExtType(code, data)
+
+
+def _encode_msgpack(payload):
+    _require(msgpack, "msgpack")
+    if _has_rows(payload):
+        payload = dict(payload)
+        payload[DATA_KEY] = {'columns': rows_to_columns(payload[DATA_KEY])}
+    return msgpack.packb(payload, default=_msgpack_default,
+                         use_bin_type=True)
+
+
+def _decode_msgpack(body, columnar):
+    _require(msgpack, "msgpack")
+    payload = msgpack.unpackb(body, ext_hook=_msgpack_ext_hook, raw=False,
+                              strict_map_key=False)
+    data = payload.get(DATA_KEY) if isinstance(payload, dict) else None
+    if isinstance(data, dict) and set(data) == {'columns'}:
+        payload[DATA_KEY] = data['columns'] if columnar \
+            else columns_to_rows(data['columns'])
+    return payload
+
+
+def _encode_arrow(payload):
+    _require(pa, "pyarrow")
+    if not _has_rows(payload):
+        raise TypeError("Arrow transport requires a container with a "
+                        "'{}' list".format(DATA_KEY))
+    container = {key: val for key, val in payload.items() if key != DATA_KEY}
+    columns = rows_to_columns(payload[DATA_KEY])
+    table = pa.table({key: pa.array(value) for key, value in columns.items()})
+    table = table.replace_schema_metadata(
+        {ARROW_HEADER: json.dumps(container, default=str).encode()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _decode_arrow(body, columnar):
+    _require(pa, "pyarrow")
+    table = pa.ipc.open_stream(body).read_all()
+    payload = json.loads(table.schema.metadata[ARROW_HEADER])
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        if pa.types.is_floating(column.type) or (
+                pa.types.is_integer(column.type) and not column.null_count):
+            columns[name] = column.to_numpy()
+        else:
+            columns[name] = column.to_pylist()
+    payload[DATA_KEY] = columns if columnar else columns_to_rows(columns)
+    return payload
+
+
+def compress(body, compression):
+    """ Compress body with 'zstd' or 'lz4', return body if None """
+    if compression is None:
+        return body
+    if compression == 'zstd':
+        _require(zstandard, "zstandard")
+        return zstandard.ZstdCompressor().compress(body)
+    if compression == 'lz4':
+        _require(lz4_frame, "lz4")
+        return lz4_frame.compress(body)
+    raise ValueError("Unknown compression {}".format(compression))
+
+
+def decompress(body, compression):
+    """ Decompress body according to its Content-Encoding """
+    if compression in (None, '', 'identity'):
+        return body
+    if compression == 'zstd':
+        _require(zstandard, "zstandard")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if compression == 'lz4':
+        _require(lz4_frame, "lz4")
+        return lz4_frame.decompress(body)
+    raise ValueError("Unknown compression {}".format(compression))
+
+
+def encode_payload(payload, encoding='json', compression=None):
+    """ Encode a payload for transport
+
+    Args:
+        payload: JSON serializable payload or measurement container
+        encoding (str): 'json', 'msgpack' or 'arrow'
+        compression (str, None): 'zstd', 'lz4' or None
+
+    Returns:
+        Tuple of body (bytes) and HTTP headers (dict)
+    """
+    if encoding == 'json':
+        body = json.dumps(payload, default=str).encode()
+    elif encoding == 'msgpack':
+        body = _encode_msgpack(payload)
+    elif encoding == 'arrow':
+        body = _encode_arrow(payload)
+    else:
+        raise ValueError("Unknown encoding {}".format(encoding))
+    headers = {'Content-Type': CONTENT_TYPES[encoding]}
+    if compression:
+        body = compress(body, compression)
+        headers['Content-Encoding'] = compression
+    return body, headers
+
+
+def decode_payload(body, content_type=JSON, compression=None,
+                   columnar=False):
+    """ Decode a payload received over HTTP
+
+    Args:
+        body (bytes): Request or response body
+        content_type (str): Mimetype of the body
+        compression (str, None): Content-Encoding of the body
+        columnar (bool): Return the data block as dict of columns instead of
+                         a list of per-point dicts
+
+    Returns:
+        Decoded payload
+    """
+    body = decompress(body, compression)
+    encoding = ENCODINGS.get(content_type, 'json')
+    if encoding == 'msgpack':
+        return _decode_msgpack(body, columnar)
+    if encoding == 'arrow':
+        return _decode_arrow(body, columnar)
+    if not body:
+        return None
+    payload = json.loads(body)
+    if columnar and _has_rows(payload):
+        payload[DATA_KEY] = rows_to_columns(payload[DATA_KEY])
+    return payload
+
+
+def negotiate_encoding(accept_mimetypes, payload=None):
+    """ Return the best supported encoding of a werkzeug Accept header
+
+    Args:
+        accept_mimetypes: Accept header of the request
+        payload: If given, Arrow is only offered for measurement containers
+                 with a 'data' list
+    """
+    available = [CONTENT_TYPES['json']]
+    if msgpack is not None:
+        available.append(CONTENT_TYPES['msgpack'])
+    if pa is not None and (payload is None or _has_rows(payload)):
+        available.append(CONTENT_TYPES['arrow'])
+    best = accept_mimetypes.best_match(available, default=JSON)
+    return ENCODINGS[best]
+
+
+def negotiate_stream(accept_mimetypes):
+    """ Return the best supported stream encoding of a werkzeug Accept
+    header, NDJSON is the default """
+    available = [NDJSON] + ([ARROW] if pa is not None else [])
+    best = accept_mimetypes.best_match(available, default=NDJSON)
+    return 'arrow' if best == ARROW else 'ndjson'
+
+
+def ndjson_stream(chunks, columnar=False):
+    """ Encode chunks of columns (dicts of lists or arrays) as NDJSON
+
+    Args:
+        chunks (iterable): Dicts of columns
+        columnar (bool): One line per chunk ({"key": [...], ...}) instead of
+                         one line per row
+
+    Yields:
+        Encoded lines of one chunk (bytes)
+    """
+    for columns in chunks:
+        columns = {key: (value.tolist() if hasattr(value, 'tolist')
+                         else value) for key, value in columns.items()}
+        if columnar:
+            lines = [json.dumps(columns, default=str)]
+        else:
+            lines = [json.dumps(row, default=str)
+                     for row in columns_to_rows(columns)]
+        if lines:
+            yield ("\n".join(lines) + "\n").encode()
+
+
+def arrow_stream(chunks, types=None):
+    """ Encode chunks of columns as one Arrow IPC stream, one record batch
+    per chunk. types (dict of column name and Arrow type) sets the type of
+    columns, the other types are inferred from the first chunk. An empty
+    stream has the schema of types. """
+    _require(pa, "pyarrow")
+    return _arrow_batches(chunks, types or {})
+
+
+def _arrow_batches(chunks, types):
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+
+    def drain():
+        body = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return body
+
+    for columns in chunks:
+        if schema is None:
+            schema = pa.schema([
+                (key, types.get(key) or pa.array(
+                    value.tolist() if hasattr(value, 'tolist')
+                    else value).type)
+                for key, value in columns.items()])
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_batch(pa.record_batch(
+            [pa.array(columns[field.name], type=field.type)
+             for field in schema], schema=schema))
+        yield drain()
+    if writer is None:
+        writer = pa.ipc.new_stream(sink, pa.schema(list(types.items())))
+    writer.close()
+    yield drain()
+
+
+def gzip_stream(chunks, level=6):
+    """ gzip compress a stream of bytes, every chunk is flushed so that the
+    receiver can decode it without waiting for the end of the stream """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        body = compressor.compress(chunk) + \
+            compressor.flush(zlib.Z_SYNC_FLUSH)
+        if body:
+            yield body
+    yield compressor.flush()
+
+
+def open_stream(stream, compression=None):
+    """ Return a file-like object that decompresses stream (e.g. a request
+    body) incrementally according to its Content-Encoding """
+    if compression in (None, '', 'identity'):
+        return stream
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if compression == 'zstd':
+        _require(zstandard, "zstandard")
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+    raise ValueError("Unknown compression {}".format(compression))
+
+
+def read_ndjson(stream):
+    """ Yield the JSON values of an NDJSON stream line by line """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_arrow(stream):
+    """ Read an Arrow IPC stream batch by batch
+
+    Returns:
+        Tuple of the schema metadata (dict) and a generator of dicts of
+        columns, one per record batch
+    """
+    _require(pa, "pyarrow")
+    reader = pa.ipc.open_stream(stream)
+    metadata = reader.schema.metadata or {}
+
+    def batches():
+        for batch in reader:
+            yield {name: column.to_pylist() for name, column
+                   in zip(batch.schema.names, batch.columns)}
+    return metadata, batches()